@@ -60,10 +60,11 @@ async def export_to_pdf(update, context, user_id: int):
     
     Установка: pip install fpdf2
     """
+    import tempfile
     from fpdf import FPDF
+    from exporter import html_to_text
     
     db = Database()
-    words = db.get_user_words(user_id)
     
     pdf = FPDF()
     pdf.add_page()
@@ -71,56 +72,39 @@ async def export_to_pdf(update, context, user_id: int):
     pdf.cell(0, 10, 'Мой словарь', 0, 1, 'C')
     
     pdf.set_font('Arial', '', 12)
-    for word_data in words:
+    # Слова читаются из БД потоком, а не списком целиком
+    for word_data in db.iter_user_words(user_id):
         pdf.cell(0, 10, f"{word_data['word']}", 0, 1)
-        pdf.multi_cell(0, 10, word_data['definition'])
+        pdf.multi_cell(0, 10, html_to_text(word_data['definition']))
         pdf.ln(5)
     
-    filename = f"vocabulary_{user_id}.pdf"
-    pdf.output(filename)
-    
-    # Отправить файл пользователю
-    await context.bot.send_document(
-        chat_id=update.effective_chat.id,
-        document=open(filename, 'rb'),
-        filename='my_vocabulary.pdf'
-    )
+    # Временный файл вместо файла в рабочей папке; закрывается после отправки
+    with tempfile.TemporaryFile() as out:
+        out.write(pdf.output())
+        out.seek(0)
+        await context.bot.send_document(
+            chat_id=update.effective_chat.id,
+            document=out,
+            filename='my_vocabulary.pdf'
+        )
 
 
 async def export_to_excel(update, context, user_id: int):
     """
-    Экспорт в Excel
+    Экспорт в Excel (потоково, см. exporter.py)
     
     Установка: pip install openpyxl
     """
-    from openpyxl import Workbook
+    from exporter import export_words
     
     db = Database()
-    words = db.get_user_words(user_id)
-    
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Словарь"
-    
-    # Заголовки
-    ws.append(['Слово', 'Определение', 'Дата добавления'])
-    
-    # Данные
-    for word_data in words:
-        ws.append([
-            word_data['word'],
-            word_data['definition'],
-            word_data['created_at']
-        ])
-    
-    filename = f"vocabulary_{user_id}.xlsx"
-    wb.save(filename)
-    
-    await context.bot.send_document(
-        chat_id=update.effective_chat.id,
-        document=open(filename, 'rb'),
-        filename='my_vocabulary.xlsx'
-    )
+    out, count = export_words(db, user_id, 'xlsx')
+    with out:
+        await context.bot.send_document(
+            chat_id=update.effective_chat.id,
+            document=out,
+            filename='my_vocabulary.xlsx'
+        )
 
 
 # ============= КВИЗ-РЕЖИМ =============
@@ -134,7 +118,8 @@ class QuizManager:
     
     async def start_quiz(self, update, context, user_id: int):
         """Начать квиз"""
-        words = self.db.get_user_words(user_id)
+        # Для вопроса нужно только краткое определение, без HTML объяснений
+        words = self.db.get_word_briefs(user_id)
         
         if len(words) < 4:
             await update.message.reply_text(
@@ -166,7 +151,7 @@ class QuizManager:
         random.shuffle(options)
         
         return {
-            'definition': word_data['definition'],
+            'definition': word_data['short_definition'],
             'correct_answer': word_data['word'],
             'options': options
         }
@@ -264,7 +249,8 @@ def get_learning_progress(user_id: int):
     Получить детальный прогресс обучения
     """
     db = Database()
-    words = db.get_user_words(user_id)
+    # Для статистики нужны только даты — объяснения не читаем и не распаковываем
+    words = db.get_user_words(user_id, with_definition=False)
     
     # Анализ по датам
     words_by_date = {}
@@ -0,0 +1,53 @@
+"""
+Асинхронный фасад над Database
+
+Драйверы psycopg2/sqlite3 блокирующие, поэтому каждый метод Database
+выполняется в отдельном пуле потоков. API тот же, только методы
+нужно вызывать через await.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from config import DB_MAX_WORKERS
+
+
+class AsyncDatabase:
+    """Асинхронная обертка: await db.add_word(...) вместо db.add_word(...)"""
+
+    def __init__(self, db, max_workers: int = None):
+        """
+        Args:
+            db: Экземпляр Database
+            max_workers: Размер пула потоков для запросов к БД
+        """
+        self.db = db
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or DB_MAX_WORKERS,
+            thread_name_prefix="db"
+        )
+
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def wrapper(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(attr, *args, **kwargs))
+
+        # Кэшируем обертку, чтобы не создавать ее на каждый вызов
+        setattr(self, name, wrapper)
+        return wrapper
+
+    async def run(self, func, *args):
+        """Выполнить блокирующую функцию func(db, *args) в пуле потоков БД (например, потоковый экспорт)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, self.db, *args))
+
+    def shutdown(self):
+        """Дождаться завершения запросов, остановить пул потоков и закрыть соединения"""
+        self._executor.shutdown(wait=True)
+        self.db.close()
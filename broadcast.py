@@ -0,0 +1,81 @@
+"""
+Движок рассылки
+
+Обрабатывает получателей параллельно, но в рамках отдельных бюджетов
+запросов к Gemini и к Telegram. Время рассылки определяется квотами,
+а не числом подписчиков.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from config import BROADCAST_CONCURRENCY, BROADCAST_GEMINI_RPM, BROADCAST_TELEGRAM_RPS
+from rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class BroadcastEngine:
+    """Параллельная рассылка с token bucket для Gemini и Telegram"""
+
+    def __init__(self, concurrency: int = None, gemini_rpm: float = None, telegram_rps: float = None):
+        """
+        Args:
+            concurrency: Сколько получателей обрабатывается одновременно
+            gemini_rpm: Бюджет запросов к Gemini в минуту
+            telegram_rps: Бюджет сообщений Telegram в секунду
+        """
+        self.concurrency = concurrency or BROADCAST_CONCURRENCY
+        self.gemini = TokenBucket((gemini_rpm or BROADCAST_GEMINI_RPM) / 60)
+        self.telegram = TokenBucket(telegram_rps or BROADCAST_TELEGRAM_RPS)
+        self.running = False
+
+    async def run(self, recipients: Iterable,
+                  deliver: Callable[[object], Awaitable[Optional[Tuple[int, int]]]]) -> Dict:
+        """
+        Обработать всех получателей.
+
+        Args:
+            recipients: ID пользователей или пачки ID (списки)
+            deliver: Корутина доставки для одного элемента. Перед обращением
+                к Gemini она ждет self.gemini.acquire(), перед отправкой — self.telegram.acquire().
+                Для пачки возвращает (доставлено, не доставлено); None — доставлен весь элемент,
+                исключение — не доставлен весь элемент
+
+        Returns:
+            Статистика по пользователям: sent, failed, seconds
+        """
+        queue = asyncio.Queue()
+        for item in recipients:
+            queue.put_nowait(item)
+
+        stats = {'sent': 0, 'failed': 0}
+        started = time.monotonic()
+
+        async def worker():
+            while True:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                size = len(item) if isinstance(item, (list, tuple)) else 1
+                try:
+                    result = await deliver(item)
+                    sent, failed = result if result is not None else (size, 0)
+                except Exception as e:
+                    sent, failed = 0, size
+                    logger.error(f"Ошибка рассылки {item}: {e}")
+                stats['sent'] += sent
+                stats['failed'] += failed
+
+        self.running = True
+        try:
+            workers = min(self.concurrency, queue.qsize())
+            await asyncio.gather(*(worker() for _ in range(workers)))
+        finally:
+            self.running = False
+
+        stats['seconds'] = round(time.monotonic() - started, 1)
+        return stats
@@ -1,22 +1,118 @@
+"""
+Проверка доступных моделей Gemini
+
+При запуске бота список моделей, которые умеют generateContent, берется
+из файла кэша (MODEL_PROBE_CACHE), а раз в MODEL_PROBE_TTL обновляется
+запросом к API. Роутер моделей не отправляет запросы в модели, которых
+нет у этого ключа. Если API недоступно, используется устаревший кэш.
+
+Запуск вручную: python check_models.py [--refresh]
+"""
+
+import hashlib
+import json
+import logging
 import os
-import google.generativeai as genai
-from dotenv import load_dotenv
+import time
+from typing import Callable, List, Optional
+
+from config import MODEL_PROBE_CACHE, MODEL_PROBE_TTL
+
+logger = logging.getLogger(__name__)
+
+
+def list_generation_models() -> List[str]:
+    """Имена моделей с generateContent (без префикса models/)"""
+    import google.generativeai as genai
+
+    return sorted(
+        m.name.split("/", 1)[-1] for m in genai.list_models()
+        if 'generateContent' in m.supported_generation_methods
+    )
+
+
+def key_fingerprint(api_key: str) -> str:
+    """Отпечаток ключа: кэш другого ключа не подходит (сам ключ в файл не пишем)"""
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:12]
+
+
+def load_probe(path: str, fingerprint: str, ttl: float = None) -> Optional[List[str]]:
+    """Модели из кэша или None, если кэша нет, он чужой или старше ttl"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get('key') != fingerprint:
+        return None
+    if ttl is not None and time.time() - data.get('checked_at', 0) > ttl:
+        return None
+    return data.get('models')
+
+
+def save_probe(path: str, fingerprint: str, models: List[str]):
+    # Через временный файл: оборванная запись не испортит кэш
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({'key': fingerprint, 'checked_at': time.time(), 'models': models}, f)
+    os.replace(tmp_path, path)
+
+
+def probe_models(api_key: str = None, path: str = None, ttl: float = None, refresh: bool = False,
+                 lister: Callable[[], List[str]] = list_generation_models) -> Optional[List[str]]:
+    """
+    Доступные модели: из свежего кэша или запросом к API
+
+    Args:
+        api_key: Ключ Gemini (по умолчанию GEMINI_API_KEY)
+        refresh: Не смотреть в кэш
+        lister: Функция запроса списка моделей (для тестов)
+
+    Returns:
+        Имена моделей или None, если узнать не удалось
+    """
+    path = path or MODEL_PROBE_CACHE
+    fingerprint = key_fingerprint(api_key or os.getenv('GEMINI_API_KEY'))
+    if not refresh:
+        cached = load_probe(path, fingerprint, MODEL_PROBE_TTL if ttl is None else ttl)
+        if cached is not None:
+            return cached
+
+    try:
+        models = lister()
+    except Exception as e:
+        logger.warning(f"Не удалось получить список моделей Gemini: {e}")
+        return load_probe(path, fingerprint)
+
+    try:
+        save_probe(path, fingerprint, models)
+    except OSError as e:
+        logger.warning(f"Не удалось сохранить кэш моделей {path}: {e}")
+    return models
+
+
+if __name__ == "__main__":
+    import sys
+
+    import google.generativeai as genai
+    from dotenv import load_dotenv
+
+    load_dotenv()
 
-load_dotenv()
+    api_key = os.getenv('GEMINI_API_KEY')
+    if not api_key:
+        print("❌ API Key not found in .env")
+        sys.exit(1)
 
-api_key = os.getenv('GEMINI_API_KEY')
-if not api_key:
-    print("❌ API Key not found in .env")
-    exit(1)
+    genai.configure(api_key=api_key)
 
-genai.configure(api_key=api_key)
+    print(f"Checking models for key: {api_key[:5]}...")
 
-print(f"Checking models for key: {api_key[:5]}...")
+    models = probe_models(api_key, refresh="--refresh" in sys.argv)
+    if models is None:
+        print("❌ Error listing models")
+        sys.exit(1)
 
-try:
     print("\nAvailable models:")
-    for m in genai.list_models():
-        if 'generateContent' in m.supported_generation_methods:
-            print(f"- {m.name}")
-except Exception as e:
-    print(f"❌ Error listing models: {e}")
+    for name in models:
+        print(f"- {name}")
@@ -0,0 +1,69 @@
+"""
+Сжатие длинных объяснений для хранения в БД
+
+HTML объяснений повторяет одни и те же заголовки разделов и теги, поэтому
+сжимается zlib с предустановленным словарем (zdict): даже одно объяснение
+в пару килобайт сжимается хорошо, без накопления статистики по тексту.
+Короткие определения хранятся как есть.
+
+Формат: первый байт — версия словаря, дальше raw deflate.
+"""
+
+import zlib
+from typing import Optional, Tuple
+
+# Короче этого (символов) не сжимаем: выигрыш меньше накладных расходов
+COMPRESS_MIN_LENGTH = 256
+
+FORMAT_VERSION = 1
+
+# Словарь версии 1. НЕЛЬЗЯ менять: сохраненные данные читаются только с тем
+# же словарем. Новый словарь — новая версия в DICTIONARIES.
+# zlib лучше всего находит строки из конца словаря — самые частые идут последними
+_ZDICT_V1 = (
+    "Происхождение от латинского греческого французского немецкого английского слова «» "
+    "например, используется в значении, то есть, а также, который, которая, которое "
+    "Научная среда Повседневная речь Литература Политика Бизнес Медицина Право Психология "
+    "<a href=\"https://ru.wikipedia.org/wiki/\"></a><code></code><s></s><pre></pre>"
+    "<b>💡 Интересный факт:</b>\n"
+    "<b>🧠 Происхождение слова:</b>\nОт латинского <i></i> — «».\n\n"
+    "<b>🔄 Синонимы:</b>\n• \n\n"
+    "<b>💬 Примеры предложений:</b>\n• \n• \n\n"
+    "<b>🔍 Контекст использования:</b>\n• \n• \n\n"
+    "<b>📝 Краткое определение:</b>\n<i></i> — \n\n"
+    "</b> — <b></i> — <i></i>, <i>.\n• "
+).encode("utf-8")
+
+DICTIONARIES = {1: _ZDICT_V1}
+
+
+def compress_text(text: str) -> bytes:
+    """Сжать текст текущей версией словаря"""
+    compressor = zlib.compressobj(level=9, wbits=-15, zdict=DICTIONARIES[FORMAT_VERSION])
+    return bytes([FORMAT_VERSION]) + compressor.compress(text.encode("utf-8")) + compressor.flush()
+
+
+def decompress_text(data: bytes) -> str:
+    """Распаковать данные compress_text (любой известной версии словаря)"""
+    data = bytes(data)  # psycopg2 отдает bytea как memoryview
+    zdict = DICTIONARIES.get(data[0])
+    if zdict is None:
+        raise ValueError(f"Неизвестная версия сжатия: {data[0]}")
+    decompressor = zlib.decompressobj(wbits=-15, zdict=zdict)
+    return (decompressor.decompress(data[1:]) + decompressor.flush()).decode("utf-8")
+
+
+def pack_definition(text: str) -> Tuple[str, Optional[bytes]]:
+    """
+    Значения колонок (definition, definition_z) для записи
+
+    Длинный текст уходит в definition_z, а definition остается пустым.
+    """
+    if text and len(text) >= COMPRESS_MIN_LENGTH:
+        return "", compress_text(text)
+    return text, None
+
+
+def unpack_definition(definition: str, packed: Optional[bytes]) -> str:
+    """Текст определения из колонок (definition, definition_z)"""
+    return decompress_text(packed) if packed is not None else definition
@@ -4,6 +4,81 @@ from dotenv import load_dotenv
 # Загружаем переменные окружения из .env файла
 load_dotenv()
 
+# Максимум одновременных запросов к Gemini (остальные ждут в очереди)
+GEMINI_MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', '8'))
+# Квота каждой модели (запросов в минуту)
+GEMINI_RPM = float(os.getenv('GEMINI_RPM', '60'))
+# Повторы временных ошибок (429, перегрузка): число попыток, база и потолок задержки (секунды);
+# дольше GEMINI_MAX_INTERACTIVE_WAIT пользователь не ждет — сразу видит кнопку "Повторить"
+GEMINI_MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', '3'))
+GEMINI_BACKOFF_BASE = float(os.getenv('GEMINI_BACKOFF_BASE', '1'))
+GEMINI_BACKOFF_CAP = float(os.getenv('GEMINI_BACKOFF_CAP', '30'))
+GEMINI_MAX_INTERACTIVE_WAIT = float(os.getenv('GEMINI_MAX_INTERACTIVE_WAIT', '15'))
+# Предохранитель: неудач подряд до отключения и сколько секунд запросы не отправляются
+GEMINI_BREAKER_THRESHOLD = int(os.getenv('GEMINI_BREAKER_THRESHOLD', '3'))
+GEMINI_BREAKER_RESET = float(os.getenv('GEMINI_BREAKER_RESET', '30'))
+
+# Модели: легкая — для дешевых задач (нормализация слова), сильная — для полных объяснений.
+# При исчерпании квоты одной модели запрос уходит в другую
+GEMINI_MODEL_LIGHT = os.getenv('GEMINI_MODEL_LIGHT', 'gemini-2.0-flash-lite')
+GEMINI_MODEL_STRONG = os.getenv('GEMINI_MODEL_STRONG', 'gemini-2.0-flash')
+# Цены для оценки расходов: USD за 1 млн токенов (ввод, вывод)
+GEMINI_MODEL_PRICES = {
+    'gemini-2.0-flash-lite': (0.075, 0.30),
+    'gemini-2.0-flash': (0.10, 0.40),
+}
+# Проверка доступных моделей при запуске: файл кэша и сколько он действителен (секунды)
+MODEL_PROBE_CACHE = os.getenv('MODEL_PROBE_CACHE', 'models_cache.json')
+MODEL_PROBE_TTL = int(os.getenv('MODEL_PROBE_TTL', str(24 * 3600)))
+
+# Потоковый ответ: объяснение появляется по мере генерации; правки сообщения не чаще (секунды)
+GEMINI_STREAMING = os.getenv('GEMINI_STREAMING', 'true').lower() in ('1', 'true', 'yes')
+STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', '1.5'))
+
+# Рассылка: параллельность и бюджеты запросов (Gemini — в минуту, Telegram — в секунду)
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '20'))
+BROADCAST_GEMINI_RPM = float(os.getenv('BROADCAST_GEMINI_RPM', '60'))
+BROADCAST_TELEGRAM_RPS = float(os.getenv('BROADCAST_TELEGRAM_RPS', '25'))
+# Сколько подписчиков получают слова из одного запроса к Gemini (ограничено длиной ответа модели)
+BROADCAST_BATCH_SIZE = int(os.getenv('BROADCAST_BATCH_SIZE', '5'))
+
+# Пул готовых слов: целевой размер на тему, порог пополнения, максимум выдач одного слова,
+# интервал фоновой проверки (секунды)
+WORD_POOL_SIZE = int(os.getenv('WORD_POOL_SIZE', '30'))
+WORD_POOL_REFILL_THRESHOLD = int(os.getenv('WORD_POOL_REFILL_THRESHOLD', '10'))
+WORD_POOL_MAX_SERVES = int(os.getenv('WORD_POOL_MAX_SERVES', '20'))
+WORD_POOL_REFILL_INTERVAL = int(os.getenv('WORD_POOL_REFILL_INTERVAL', '600'))
+
+# Напоминание о повторении: час рассылки (UTC) и минимум слов в очереди, чтобы напомнить
+REVIEW_REMINDER_HOUR = int(os.getenv('REVIEW_REMINDER_HOUR', '13'))
+REVIEW_MIN_DUE = int(os.getenv('REVIEW_MIN_DUE', '3'))
+
+# Импорт слов из файла: лимит слов за раз, слов в одном запросе к Gemini,
+# параллельных запросов, строк в одной транзакции записи
+IMPORT_MAX_WORDS = int(os.getenv('IMPORT_MAX_WORDS', '1000'))
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '8'))
+IMPORT_CONCURRENCY = int(os.getenv('IMPORT_CONCURRENCY', '3'))
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', '200'))
+
+# Потоки для запросов к БД (должно быть меньше максимума пула соединений Postgres)
+DB_MAX_WORKERS = int(os.getenv('DB_MAX_WORKERS', '10'))
+
+# Кэш объяснений: сколько держать в памяти процесса и сколько живет запись (секунды)
+EXPLANATION_CACHE_SIZE = int(os.getenv('EXPLANATION_CACHE_SIZE', '1000'))
+EXPLANATION_CACHE_TTL = int(os.getenv('EXPLANATION_CACHE_TTL', str(30 * 24 * 3600)))
+
+# Кэш горячих данных (страницы словаря, карточки, статистика): лимит памяти процесса (байты),
+# время жизни записи (секунды) и необязательный Redis, общий для нескольких реплик бота
+HOT_CACHE_MAX_BYTES = int(os.getenv('HOT_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+HOT_CACHE_TTL = int(os.getenv('HOT_CACHE_TTL', '300'))
+REDIS_URL = os.getenv('REDIS_URL')
+
+# Временное состояние: сколько живет кнопка "Сохранить" у предложенного слова, сколько помнить
+# недавно предложенные слова (секунды) и как часто удалять истекшие записи
+SUGGESTION_TTL = int(os.getenv('SUGGESTION_TTL', str(7 * 24 * 3600)))
+SUGGESTED_WORDS_TTL = int(os.getenv('SUGGESTED_WORDS_TTL', str(24 * 3600)))
+STATE_CLEANUP_INTERVAL = int(os.getenv('STATE_CLEANUP_INTERVAL', '3600'))
+
 # Проверка наличия обязательных переменных
 def check_environment():
     """Проверить наличие всех необходимых переменных окружения"""
@@ -1,18 +1,72 @@
 import sqlite3
+import json
+import logging
 import random
-from datetime import datetime
-from typing import List, Dict, Optional
+import re
+import threading
+from datetime import date, datetime, timedelta
+from typing import Iterator, List, Dict, Optional, Tuple
+
+from compression import COMPRESS_MIN_LENGTH, pack_definition, unpack_definition
+from sections import split_explanation
+from srs import Schedule, next_schedule
+
+logger = logging.getLogger(__name__)
+
+
+# Настройки долгоживущих соединений SQLite
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",       # читатели не блокируют писателя
+    "PRAGMA synchronous = NORMAL",     # в режиме WAL безопасно и намного быстрее FULL
+    "PRAGMA cache_size = -16000",      # ~16 МБ кэша страниц
+    "PRAGMA mmap_size = 268435456",    # 256 МБ отображения файла в память
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+# Сколько подготовленных выражений держит каждое соединение
+SQLITE_STATEMENT_CACHE = 256
+
+# Выражение полнотекстового индекса Postgres (запрос должен использовать его дословно)
+PG_SEARCH_VECTOR = "to_tsvector('russian', word || ' ' || coalesce(short_definition, ''))"
+
+# Разовые переносы данных по порядку (Database._migrate_<имя>), см. run_data_migrations
+DATA_MIGRATIONS = (
+    'random_keys',    # rand_key старых слов
+    'srs_due',        # старые слова — в очередь повторений
+    'word_keys',      # ключ слова, слияние дубликатов, уникальный индекс (user_id, word_key)
+    'sections',       # разделы и краткое определение старых слов
+    'compression',    # сжатие длинных определений старых слов
+)
+
+
+def _unpack_row(row) -> Dict:
+    """Строка БД -> dict с распакованным definition (колонка definition_z не отдается наружу)"""
+    data = dict(row)
+    if 'definition_z' in data:
+        data['definition'] = unpack_definition(data['definition'], data.pop('definition_z'))
+    return data
+
+
+def word_key(word: str) -> str:
+    """Ключ слова без учета регистра и лишних пробелов"""
+    return " ".join(word.lower().split())
+
+
+def search_terms(query: str) -> List[str]:
+    """Разбить поисковый запрос на слова (без спецсимволов FTS)"""
+    return re.findall(r"\w+", query.lower())
 
 
 class Database:
     """Класс для работы с базой данных (SQLite или PostgreSQL)"""
     
-    def __init__(self, db_url: str = None):
+    def __init__(self, db_url: str = None, init_schema: bool = True):
         """
         Инициализация базы данных
         
         Args:
             db_url: Путь к файлу SQLite или строка подключения PostgreSQL (URL)
+            init_schema: Создать/обновить схему (False — открыть как есть, например источник миграции)
         """
         self.db_url = db_url or "vocabulary.db"
         self.is_postgres = self.db_url.startswith("postgres")
@@ -30,25 +84,59 @@ class Database:
             self._connection_factory = sqlite3.connect
             self._row_factory_arg = sqlite3.Row
             self.pool = None
+            # Одно долгоживущее соединение на поток (sqlite3 не любит общие соединения)
+            self._local = threading.local()
+            self._sqlite_connections = []
+            self._sqlite_lock = threading.Lock()
             
-        self.init_db()
+        if init_schema:
+            self.init_db()
     
     def get_connection(self):
-        """Получить соединение с БД из пула (если есть)"""
+        """Получить соединение с БД из пула (Postgres) или соединение текущего потока (SQLite)"""
         if self.is_postgres and self.pool:
             return self.pool.getconn()
-            
-        conn = self._connection_factory(self.db_url)
-        if not self.is_postgres:
-            conn.row_factory = self._row_factory_arg
+        
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open_sqlite_connection()
+            self._local.conn = conn
+        return conn
+    
+    def _open_sqlite_connection(self):
+        """Открыть соединение SQLite и применить PRAGMA"""
+        # check_same_thread=False только ради close() из другого потока,
+        # в работе соединение использует лишь поток-владелец
+        conn = self._connection_factory(
+            self.db_url,
+            cached_statements=SQLITE_STATEMENT_CACHE,
+            check_same_thread=False
+        )
+        conn.row_factory = self._row_factory_arg
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+        with self._sqlite_lock:
+            self._sqlite_connections.append(conn)
         return conn
     
     def release_connection(self, conn):
-        """Вернуть соединение в пул"""
+        """Вернуть соединение в пул (для SQLite соединение остается открытым)"""
         if self.is_postgres and self.pool:
             self.pool.putconn(conn)
-        else:
-            conn.close()
+        elif conn.in_transaction:
+            # Метод упал до commit — не оставляем висящую транзакцию
+            conn.rollback()
+    
+    def close(self):
+        """Закрыть все соединения"""
+        if self.is_postgres and self.pool:
+            self.pool.closeall()
+            return
+        with self._sqlite_lock:
+            for conn in self._sqlite_connections:
+                conn.close()
+            self._sqlite_connections.clear()
+        self._local = threading.local()
     
     def get_cursor(self, conn):
         """Получить курсор"""
@@ -57,6 +145,18 @@ class Database:
             return conn.cursor(cursor_factory=RealDictCursor)
         return conn.cursor()
     
+    def ping(self) -> bool:
+        """Дешевый запрос к базе (пинг /health): не трогает схему и данные"""
+        conn = self.get_connection()
+        try:
+            cursor = self.get_cursor(conn)
+            cursor.execute("SELECT 1 AS ok")
+            return cursor.fetchone() is not None
+        finally:
+            if self.is_postgres:
+                conn.rollback()
+            self.release_connection(conn)
+    
     def init_db(self):
         """Инициализация базы данных"""
         conn = self.get_connection()
@@ -89,10 +189,19 @@ class Database:
                     id SERIAL PRIMARY KEY,
                     user_id BIGINT NOT NULL,
                     word TEXT NOT NULL,
+                    word_key TEXT,
                     definition TEXT NOT NULL,
                     context TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     last_reviewed TIMESTAMP,
+                    rand_key DOUBLE PRECISION,
+                    ease REAL NOT NULL DEFAULT 2.5,
+                    interval_days INTEGER NOT NULL DEFAULT 0,
+                    repetitions INTEGER NOT NULL DEFAULT 0,
+                    due_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    short_definition TEXT,
+                    sections TEXT,
+                    definition_z BYTEA,
                     FOREIGN KEY (user_id) REFERENCES users(user_id)
                 )
             """ if self.is_postgres else """
@@ -100,35 +209,141 @@ class Database:
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     user_id INTEGER NOT NULL,
                     word TEXT NOT NULL,
+                    word_key TEXT,
                     definition TEXT NOT NULL,
                     context TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     last_reviewed TIMESTAMP,
+                    rand_key REAL,
+                    ease REAL NOT NULL DEFAULT 2.5,
+                    interval_days INTEGER NOT NULL DEFAULT 0,
+                    repetitions INTEGER NOT NULL DEFAULT 0,
+                    due_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    short_definition TEXT,
+                    sections TEXT,
+                    definition_z BLOB,
                     FOREIGN KEY (user_id) REFERENCES users(user_id)
                 )
             """
             cursor.execute(word_table_sql)
             
-            # Таблица временных предложений (для решения проблемы mappingproxy)
-            pending_table_sql = """
-                CREATE TABLE IF NOT EXISTS pending_suggestions (
-                    user_id BIGINT PRIMARY KEY,
+            # Временное состояние диалогов (предложенные слова за кнопками "Сохранить") с временем жизни.
+            # Заменяет pending_suggestions: там была одна строка на пользователя без очистки
+            state_table_sql = """
+                CREATE TABLE IF NOT EXISTS ephemeral_state (
+                    state_key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    value_z BYTEA,
+                    expires_at TIMESTAMP NOT NULL
+                )
+            """ if self.is_postgres else """
+                CREATE TABLE IF NOT EXISTS ephemeral_state (
+                    state_key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    value_z BLOB,
+                    expires_at TIMESTAMP NOT NULL
+                )
+            """
+            cursor.execute(state_table_sql)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_ephemeral_state_expires ON ephemeral_state(expires_at)")
+            cursor.execute("DROP TABLE IF EXISTS pending_suggestions")
+            
+            # Общий кэш объяснений Gemini (одинаков для всех пользователей)
+            cache_table_sql = """
+                CREATE TABLE IF NOT EXISTS explanation_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    normalized_word TEXT NOT NULL,
+                    explanation TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """
+            cursor.execute(cache_table_sql)
+            
+            # Пул заранее сгенерированных "умных слов" по темам
+            pool_table_sql = """
+                CREATE TABLE IF NOT EXISTS word_pool (
+                    id SERIAL PRIMARY KEY,
+                    theme TEXT NOT NULL,
                     word TEXT NOT NULL,
-                    definition TEXT NOT NULL,
+                    word_key TEXT NOT NULL,
+                    explanation TEXT NOT NULL,
+                    served_count INTEGER DEFAULT 0,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             """ if self.is_postgres else """
-                CREATE TABLE IF NOT EXISTS pending_suggestions (
-                    user_id INTEGER PRIMARY KEY,
+                CREATE TABLE IF NOT EXISTS word_pool (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    theme TEXT NOT NULL,
                     word TEXT NOT NULL,
-                    definition TEXT NOT NULL,
+                    word_key TEXT NOT NULL,
+                    explanation TEXT NOT NULL,
+                    served_count INTEGER DEFAULT 0,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             """
-            cursor.execute(pending_table_sql)
+            cursor.execute(pool_table_sql)
             
-            # Индексы
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_words ON words(user_id, created_at DESC)")
+            # Денормализованная статистика пользователя (обновляется при каждом изменении слов)
+            stats_table_exists = self._table_exists(cursor, 'user_stats')
+            stats_table_sql = """
+                CREATE TABLE IF NOT EXISTS user_stats (
+                    user_id BIGINT PRIMARY KEY,
+                    word_count INTEGER NOT NULL DEFAULT 0,
+                    first_word_date TIMESTAMP,
+                    last_word_date TIMESTAMP,
+                    reviews_done INTEGER NOT NULL DEFAULT 0,
+                    streak_days INTEGER NOT NULL DEFAULT 0,
+                    last_active_date DATE
+                )
+            """ if self.is_postgres else """
+                CREATE TABLE IF NOT EXISTS user_stats (
+                    user_id INTEGER PRIMARY KEY,
+                    word_count INTEGER NOT NULL DEFAULT 0,
+                    first_word_date TIMESTAMP,
+                    last_word_date TIMESTAMP,
+                    reviews_done INTEGER NOT NULL DEFAULT 0,
+                    streak_days INTEGER NOT NULL DEFAULT 0,
+                    last_active_date DATE
+                )
+            """
+            cursor.execute(stats_table_sql)
+            
+            # Миграция: колонки статистики, появившиеся после word_count
+            stats_migrated = False
+            for column in ("first_word_date TIMESTAMP", "last_word_date TIMESTAMP",
+                           "reviews_done INTEGER NOT NULL DEFAULT 0", "streak_days INTEGER NOT NULL DEFAULT 0",
+                           "last_active_date DATE"):
+                stats_migrated |= self._add_column(cursor, 'user_stats', column)
+            
+            # Индексы (user_id, created_at, id) — порядок словаря и курсор пагинации
+            cursor.execute("DROP INDEX IF EXISTS idx_user_words")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_words_keyset ON words(user_id, created_at DESC, id DESC)")
+            cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_word_pool_key ON word_pool(theme, word_key)")
+            
+            # Ключ слова без учета регистра и пробелов (уникальный индекс — в переносе word_keys)
+            self._add_column(cursor, 'words', 'word_key TEXT')
+            
+            # Разовые переносы данных, уже выполненные в этой базе
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    name TEXT PRIMARY KEY,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            
+            # Случайный ключ для выборки случайных слов по индексу
+            self._init_random_keys(cursor)
+            
+            # Интервальные повторения: очередь слов к повторению по индексу (user_id, due_at)
+            self._init_srs(cursor)
+            
+            # Сжатые длинные определения (колонка definition_z)
+            self._init_compression(cursor)
+            
+            # Разделы объяснения и краткое определение (для списков, квизов и поиска);
+            # старые слова заполняет перенос sections
+            self._add_column(cursor, 'words', 'short_definition TEXT')
+            self._add_column(cursor, 'words', 'sections TEXT')
             
             # Миграция: добавляем колонку подписки, если её нет (для SQLite, в Postgres создали сразу)
             if not self.is_postgres:
@@ -138,8 +353,269 @@ class Database:
                     pass
             
             conn.commit()
+            self._init_search_index(conn)
         finally:
             self.release_connection(conn)
+        
+        self.run_data_migrations()
+        
+        if not stats_table_exists or stats_migrated:
+            # Таблица статистики новая — заполняем ее по уже сохраненным словам
+            self.rebuild_user_stats()
+    
+    def run_data_migrations(self, force: bool = False) -> List[str]:
+        """
+        Выполнить разовые переносы данных (DATA_MIGRATIONS), еще не отмеченные в schema_migrations
+        
+        Переносы заполняют новые колонки у старых строк и проходят всю таблицу words,
+        поэтому выполняются один раз, а не при каждом init_db. Каждый — своей транзакцией.
+        
+        Args:
+            force: Выполнить все заново (после переноса строк из другой базы, см. migration.py).
+                Переносы трогают только незаполненные строки, повтор безопасен
+        
+        Returns:
+            Имена выполненных переносов
+        """
+        conn = self.get_connection()
+        done = []
+        stats_changed = False
+        try:
+            cursor = self.get_cursor(conn)
+            p = "%s" if self.is_postgres else "?"
+            cursor.execute("SELECT name FROM schema_migrations")
+            applied = set() if force else {row['name'] for row in cursor.fetchall()}
+            for name in DATA_MIGRATIONS:
+                if name in applied:
+                    continue
+                stats_changed |= bool(getattr(self, f"_migrate_{name}")(cursor))
+                cursor.execute(f"INSERT INTO schema_migrations (name) VALUES ({p}) ON CONFLICT (name) DO NOTHING",
+                               (name,))
+                conn.commit()
+                done.append(name)
+        finally:
+            self.release_connection(conn)
+        
+        if stats_changed:
+            self.rebuild_user_stats()
+        return done
+    
+    def _migrate_word_keys(self, cursor, batch_size: int = 500) -> bool:
+        """
+        Ключ word_key у старых строк, слияние дубликатов и уникальный индекс (user_id, word_key)
+        
+        Ключ считается в Python (word_key) для обеих баз: lower() SQLite понимает только
+        ASCII, а lower(word) в Postgres не схлопывает пробелы — "слово " и "слово"
+        были бы дубликатами в одной базе и разными словами в другой.
+        
+        Returns:
+            True, если дубликаты слиты (статистику нужно пересчитать)
+        """
+        p = "%s" if self.is_postgres else "?"
+        while True:
+            cursor.execute(f"SELECT id, word FROM words WHERE word_key IS NULL LIMIT {p}", (batch_size,))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            cursor.executemany(f"UPDATE words SET word_key = {p} WHERE id = {p}",
+                               [(word_key(row['word']), row['id']) for row in rows])
+        merged = self._merge_duplicate_words(cursor)
+        # Прежний индекс: по lower(word) в Postgres, по word_key в SQLite
+        cursor.execute("DROP INDEX IF EXISTS idx_words_user_word")
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_words_user_key ON words (user_id, word_key)")
+        return merged > 0
+    
+    def _merge_duplicate_words(self, cursor) -> int:
+        """
+        Слить слова пользователя с одинаковым word_key в одну строку
+        
+        Объяснение и контекст — от последнего сохранения (как при upsert в add_word),
+        дата добавления — самая ранняя, а состояние повторений (SM-2 и last_reviewed) —
+        от строки, которую повторяли последней.
+        
+        Returns:
+            Сколько строк удалено
+        """
+        p = "%s" if self.is_postgres else "?"
+        cursor.execute("""
+            SELECT user_id, word_key, MAX(id) AS keep_id, MIN(created_at) AS created_at
+            FROM words GROUP BY user_id, word_key HAVING COUNT(*) > 1
+        """)
+        groups = cursor.fetchall()
+        removed = 0
+        for group in groups:
+            cursor.execute(f"""
+                SELECT ease, interval_days, repetitions, due_at, last_reviewed FROM words
+                WHERE user_id = {p} AND word_key = {p} AND last_reviewed IS NOT NULL
+                ORDER BY last_reviewed DESC, id DESC LIMIT 1
+            """, (group['user_id'], group['word_key']))
+            reviewed = cursor.fetchone()
+            if reviewed:
+                cursor.execute(f"""
+                    UPDATE words SET created_at = {p}, ease = {p}, interval_days = {p}, repetitions = {p},
+                                     due_at = {p}, last_reviewed = {p}
+                    WHERE id = {p}
+                """, (group['created_at'], reviewed['ease'], reviewed['interval_days'], reviewed['repetitions'],
+                      reviewed['due_at'], reviewed['last_reviewed'], group['keep_id']))
+            else:
+                cursor.execute(f"UPDATE words SET created_at = {p} WHERE id = {p}",
+                               (group['created_at'], group['keep_id']))
+            cursor.execute(f"DELETE FROM words WHERE user_id = {p} AND word_key = {p} AND id <> {p}",
+                           (group['user_id'], group['word_key'], group['keep_id']))
+            removed += cursor.rowcount
+        if removed:
+            logger.warning(f"⚠️ Слиты дубликаты слов (без учета регистра и пробелов): удалено строк {removed}")
+        return removed
+    
+    def _init_random_keys(self, cursor):
+        """Колонка rand_key (равномерно в [0, 1)) и индекс (user_id, rand_key)"""
+        self._add_column(cursor, 'words', 'rand_key DOUBLE PRECISION' if self.is_postgres else 'rand_key REAL')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_words_rand ON words(user_id, rand_key)")
+    
+    def _migrate_random_keys(self, cursor):
+        """rand_key для слов, сохраненных до его появления"""
+        if self.is_postgres:
+            cursor.execute("UPDATE words SET rand_key = random() WHERE rand_key IS NULL")
+        else:
+            cursor.execute("UPDATE words SET rand_key = (random() / 18446744073709551616.0) + 0.5 WHERE rand_key IS NULL")
+    
+    def _init_srs(self, cursor):
+        """Колонки SM-2 и индекс очереди повторений (старые слова ставит в очередь перенос srs_due)"""
+        self._add_column(cursor, 'words', 'ease REAL NOT NULL DEFAULT 2.5')
+        self._add_column(cursor, 'words', 'interval_days INTEGER NOT NULL DEFAULT 0')
+        self._add_column(cursor, 'words', 'repetitions INTEGER NOT NULL DEFAULT 0')
+        self._add_column(cursor, 'words', 'due_at TIMESTAMP')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_words_due ON words(user_id, due_at)")
+    
+    def _migrate_srs_due(self, cursor):
+        """Слова, сохраненные до появления повторений, сразу попадают в очередь"""
+        cursor.execute("UPDATE words SET due_at = created_at WHERE due_at IS NULL")
+    
+    def _migrate_sections(self, cursor, batch_size: int = 500):
+        """short_definition/sections для старых слов (разбор HTML в Python)"""
+        p = "%s" if self.is_postgres else "?"
+        while True:
+            cursor.execute(f"SELECT id, definition, definition_z FROM words WHERE short_definition IS NULL LIMIT {p}",
+                           (batch_size,))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            cursor.executemany(f"UPDATE words SET short_definition = {p}, sections = {p} WHERE id = {p}", [
+                split_explanation(unpack_definition(row['definition'], row['definition_z'])) + (row['id'],)
+                for row in rows
+            ])
+    
+    def _init_compression(self, cursor):
+        """Колонки для сжатых определений"""
+        blob = "BYTEA" if self.is_postgres else "BLOB"
+        self._add_column(cursor, 'words', f'definition_z {blob}')
+    
+    def _migrate_compression(self, cursor, batch_size: int = 500):
+        """Сжать длинные определения, сохраненные до появления сжатия (или перенесенные из старой базы)"""
+        p = "%s" if self.is_postgres else "?"
+        while True:
+            cursor.execute(f"""
+                SELECT id, definition FROM words
+                WHERE definition_z IS NULL AND length(definition) >= {p} LIMIT {p}
+            """, (COMPRESS_MIN_LENGTH, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            cursor.executemany(f"UPDATE words SET definition = {p}, definition_z = {p} WHERE id = {p}",
+                               [pack_definition(row['definition']) + (row['id'],) for row in rows])
+    
+    def _add_column(self, cursor, table: str, column_def: str) -> bool:
+        """Добавить колонку, если ее еще нет. Возвращает True, если колонка добавлена"""
+        column = column_def.split()[0]
+        if self.is_postgres:
+            cursor.execute(
+                "SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = %s",
+                (table, column)
+            )
+        else:
+            cursor.execute(f"SELECT 1 FROM pragma_table_info('{table}') WHERE name = ?", (column,))
+        if cursor.fetchone():
+            return False
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column_def}")
+        return True
+    
+    def _table_exists(self, cursor, table: str) -> bool:
+        """Проверить, есть ли таблица в БД"""
+        if self.is_postgres:
+            cursor.execute("SELECT to_regclass(%s) IS NOT NULL AS present", (table,))
+            return cursor.fetchone()['present']
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+        return cursor.fetchone() is not None
+    
+    def _init_search_index(self, conn):
+        """Полнотекстовый индекс по словам (FTS5 в SQLite, pg_trgm + tsvector в Postgres)"""
+        cursor = self.get_cursor(conn)
+        
+        if self.is_postgres:
+            try:
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                conn.commit()
+            except Exception:
+                # Нет прав на расширение — поиск работает без триграмм
+                conn.rollback()
+            
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            self.has_trgm = cursor.fetchone() is not None
+            if self.has_trgm:
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_words_word_trgm ON words USING gin (lower(word) gin_trgm_ops)")
+            # Индекс по полному определению больше не нужен: оно может храниться сжатым
+            cursor.execute("DROP INDEX IF EXISTS idx_words_tsv")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_words_search ON words USING gin ({PG_SEARCH_VECTOR})")
+            conn.commit()
+            return
+        
+        exists = self._table_exists(cursor, 'words_fts')
+        if exists:
+            cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'words_fts'")
+            sql = cursor.fetchone()['sql']
+            if 'short_definition' not in sql or 'user_id' not in sql:
+                # Старый индекс: по полному определению (теперь оно может быть сжато)
+                # или без user_id (MATCH шел по словам всех пользователей) — пересоздаем
+                for trigger in ('words_fts_insert', 'words_fts_delete', 'words_fts_update'):
+                    cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+                cursor.execute("DROP TABLE words_fts")
+                exists = False
+        
+        # Внешний контент: сам текст хранится в words, FTS держит только индекс.
+        # Индексируется краткое определение: полное хранится сжатым.
+        # user_id не индексируется, но фильтр по нему идет внутри запроса к FTS
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS words_fts USING fts5(
+                word, short_definition, user_id UNINDEXED,
+                content='words', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        """)
+        # Триггеры держат индекс в синхроне с words
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS words_fts_insert AFTER INSERT ON words BEGIN
+                INSERT INTO words_fts(rowid, word, short_definition, user_id)
+                VALUES (new.id, new.word, new.short_definition, new.user_id);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS words_fts_delete AFTER DELETE ON words BEGIN
+                INSERT INTO words_fts(words_fts, rowid, word, short_definition, user_id)
+                VALUES ('delete', old.id, old.word, old.short_definition, old.user_id);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS words_fts_update AFTER UPDATE OF word, short_definition, user_id ON words BEGIN
+                INSERT INTO words_fts(words_fts, rowid, word, short_definition, user_id)
+                VALUES ('delete', old.id, old.word, old.short_definition, old.user_id);
+                INSERT INTO words_fts(rowid, word, short_definition, user_id)
+                VALUES (new.id, new.word, new.short_definition, new.user_id);
+            END
+        """)
+        if not exists:
+            # Индекс создан впервые — заполняем его уже сохраненными словами
+            cursor.execute("INSERT INTO words_fts(words_fts) VALUES ('rebuild')")
+        conn.commit()
     
     def add_user(self, user_id: int, username: str = None, first_name: str = None):
         """Добавить пользователя"""
@@ -192,7 +668,12 @@ class Database:
     def add_word(self, user_id: int, word: str, definition: str, context: str = None) -> int:
         """
         Добавить слово в словарь
+        
+        Рядом с HTML объяснения сохраняются его разделы и краткое определение.
+        Длинный HTML хранится сжатым (definition_z).
         """
+        short, sections = split_explanation(definition)
+        definition, definition_z = pack_definition(definition)
         conn = self.get_connection()
         try:
             cursor = self.get_cursor(conn)
@@ -202,98 +683,393 @@ class Database:
             else:
                 cursor.execute("INSERT OR IGNORE INTO users (user_id) VALUES (?)", (user_id,))
                 
-            p = "%s" if self.is_postgres else "?"
-            cursor.execute(f"SELECT id FROM words WHERE user_id = {p} AND LOWER(word) = LOWER({p})", (user_id, word))
-            existing = cursor.fetchone()
-            
-            if existing:
-                cursor.execute(f"UPDATE words SET definition = {p}, context = {p}, created_at = CURRENT_TIMESTAMP WHERE id = {p}", 
-                             (definition, context, existing['id']))
-                word_id = existing['id']
+            # Атомарный upsert по уникальному индексу: без SELECT и без гонки между нажатиями
+            if self.is_postgres:
+                cursor.execute("""
+                    INSERT INTO words (user_id, word, word_key, definition, definition_z, short_definition, sections,
+                                       context, rand_key, due_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+                    ON CONFLICT (user_id, word_key) DO UPDATE SET
+                        definition = EXCLUDED.definition, definition_z = EXCLUDED.definition_z,
+                        short_definition = EXCLUDED.short_definition, sections = EXCLUDED.sections,
+                        context = EXCLUDED.context, created_at = CURRENT_TIMESTAMP
+                    RETURNING id, (xmax = 0) AS inserted
+                """, (user_id, word, word_key(word), definition, definition_z, short, sections, context,
+                      random.random()))
+                row = cursor.fetchone()
+                word_id, inserted = row['id'], row['inserted']
             else:
-                if self.is_postgres:
-                    cursor.execute("INSERT INTO words (user_id, word, definition, context) VALUES (%s, %s, %s, %s) RETURNING id",
-                                 (user_id, word, definition, context))
-                    word_id = cursor.fetchone()['id']
-                else:
-                    cursor.execute("INSERT INTO words (user_id, word, definition, context) VALUES (?, ?, ?, ?)",
-                                 (user_id, word, definition, context))
-                    word_id = cursor.lastrowid
+                # AUTOINCREMENT не переиспользует id: новая строка получает id больше последнего
+                # выданного. Блокировка записи уже взята (вставка в users), читать seq безопасно.
+                # (last_insert_rowid не годится: его меняет и вставка в users)
+                row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'words'").fetchone()
+                last_id = row[0] if row else 0
+                cursor.execute("""
+                    INSERT INTO words (user_id, word, word_key, definition, definition_z, short_definition, sections,
+                                       context, rand_key, due_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT (user_id, word_key) DO UPDATE SET
+                        definition = excluded.definition, definition_z = excluded.definition_z,
+                        short_definition = excluded.short_definition, sections = excluded.sections,
+                        context = excluded.context, created_at = CURRENT_TIMESTAMP
+                    RETURNING id
+                """, (user_id, word, word_key(word), definition, definition_z, short, sections, context, random.random()))
+                word_id = cursor.fetchone()['id']
+                inserted = word_id > last_id
+            
+            self._stats_on_add(cursor, user_id, added=int(inserted))
             conn.commit()
             return word_id
         finally:
             self.release_connection(conn)
     
-    def get_user_words(self, user_id: int, limit: int = None, offset: int = 0) -> List[Dict]:
+    def add_words_bulk(self, user_id: int, items: List[tuple]) -> int:
+        """
+        Добавить пачку новых слов одной транзакцией (импорт)
+        
+        Уже существующие слова пропускаются (не перезаписываются).
+        
+        Args:
+            items: Список (word, definition)
+        
+        Returns:
+            Сколько слов добавлено
+        """
+        if not items:
+            return 0
         conn = self.get_connection()
         try:
             cursor = self.get_cursor(conn)
-            p = "%s" if self.is_postgres else "?"
             if self.is_postgres:
-                query = f"SELECT id, word, definition, context, created_at, last_reviewed FROM words WHERE user_id = {p} ORDER BY created_at DESC"
+                from psycopg2.extras import execute_values
+                cursor.execute("INSERT INTO users (user_id) VALUES (%s) ON CONFLICT (user_id) DO NOTHING", (user_id,))
+                rows = [(user_id, word, word_key(word)) + pack_definition(definition) + split_explanation(definition)
+                        + (random.random(),) for word, definition in items]
+                inserted = execute_values(cursor, """
+                    INSERT INTO words (user_id, word, word_key, definition, definition_z, short_definition, sections,
+                                       rand_key, due_at)
+                    VALUES %s
+                    ON CONFLICT (user_id, word_key) DO NOTHING
+                    RETURNING id
+                """, rows, template="(%s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)", page_size=len(rows), fetch=True)
+                added = len(inserted)
             else:
-                query = f"SELECT id, word, definition, context, datetime(created_at, 'localtime') as created_at, last_reviewed FROM words WHERE user_id = {p} ORDER BY created_at DESC"
+                cursor.execute("INSERT OR IGNORE INTO users (user_id) VALUES (?)", (user_id,))
+                rows = [(user_id, word, word_key(word)) + pack_definition(definition) + split_explanation(definition)
+                        + (random.random(),) for word, definition in items]
+                cursor.executemany("""
+                    INSERT INTO words (user_id, word, word_key, definition, definition_z, short_definition, sections,
+                                       rand_key, due_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT (user_id, word_key) DO NOTHING
+                """, rows)
+                added = cursor.rowcount
+            
+            if added:
+                self._stats_on_add(cursor, user_id, added=added)
+            conn.commit()
+            return added
+        finally:
+            self.release_connection(conn)
+    
+    def get_existing_word_keys(self, user_id: int, words: List[str]) -> set:
+        """Какие из слов уже есть в словаре — один запрос по уникальному индексу. Возвращает их word_key"""
+        keys = list({word_key(word) for word in words})
+        if not keys:
+            return set()
+        conn = self.get_connection()
+        try:
+            cursor = self.get_cursor(conn)
+            if self.is_postgres:
+                cursor.execute("SELECT word_key FROM words WHERE user_id = %s AND word_key = ANY(%s)",
+                               (user_id, keys))
+            else:
+                # Весь список одним параметром: без лимита на число переменных SQLite
+                cursor.execute("""
+                    SELECT word_key FROM words
+                    WHERE user_id = ? AND word_key IN (SELECT value FROM json_each(?))
+                """, (user_id, json.dumps(keys, ensure_ascii=False)))
+            return {row['word_key'] for row in cursor.fetchall()}
+        finally:
+            self.release_connection(conn)
+    
+    def get_user_words(self, user_id: int, limit: int = None, offset: int = 0,
+                       with_definition: bool = True) -> List[Dict]:
+        """
+        Слова пользователя (новые первыми)
+        
+        Args:
+            with_definition: Читать и распаковывать полное объяснение (definition).
+                False — вместо него только short_definition: длинные объяснения хранятся
+                сжатыми, и распаковывать их ради списка слов незачем
+        """
+        conn = self.get_connection()
+        try:
+            cursor = self.get_cursor(conn)
+            p = "%s" if self.is_postgres else "?"
+            query = f"SELECT {self._word_columns(with_definition)} FROM words WHERE user_id = {p} ORDER BY created_at DESC, id DESC"
             
             if limit:
                 query += f" LIMIT {limit} OFFSET {offset}"
             
             cursor.execute(query, (user_id,))
+            return [_unpack_row(row) for row in cursor.fetchall()]
+        finally:
+            self.release_connection(conn)
+
+    def _word_columns(self, with_definition: bool = True) -> str:
+        """Колонки слова для выборок: полное объяснение (сжатое или нет) или только краткое"""
+        created = "created_at" if self.is_postgres else "datetime(created_at, 'localtime') as created_at"
+        definition = "definition, definition_z" if with_definition else "short_definition"
+        return f"id, word, {definition}, context, {created}, last_reviewed"
+
+    def get_word_briefs(self, user_id: int, limit: int = None) -> List[Dict]:
+        """Слова пользователя с кратким определением, без HTML объяснения (новые первыми)"""
+        conn = self.get_connection()
+        try:
+            cursor = self.get_cursor(conn)
+            p = "%s" if self.is_postgres else "?"
+            query = f"SELECT id, word, short_definition FROM words WHERE user_id = {p} ORDER BY created_at DESC, id DESC"
+            if limit:
+                query += f" LIMIT {int(limit)}"
+            cursor.execute(query, (user_id,))
             return [dict(row) for row in cursor.fetchall()]
         finally:
             self.release_connection(conn)
 
+    def iter_user_words(self, user_id: int, batch_size: int = 500) -> Iterator[Dict]:
+        """
+        Все слова пользователя по одному (старые первыми), не загружая словарь в память
+        
+        В Postgres — серверный (именованный) курсор, строки приходят пачками по batch_size.
+        SQLite отдает строки по мере чтения сам. Соединение занято, пока итерация не закончится.
+        """
+        conn = self.get_connection()
+        try:
+            if self.is_postgres:
+                from psycopg2.extras import RealDictCursor
+                cursor = conn.cursor(name=f"export_words_{user_id}", cursor_factory=RealDictCursor)
+                cursor.itersize = batch_size
+                sql = "SELECT word, definition, definition_z, context, created_at FROM words WHERE user_id = %s ORDER BY created_at, id"
+            else:
+                cursor = conn.cursor()
+                cursor.arraysize = batch_size
+                sql = "SELECT word, definition, definition_z, context, datetime(created_at, 'localtime') as created_at FROM words WHERE user_id = ? ORDER BY created_at, id"
+            cursor.execute(sql, (user_id,))
+            for row in cursor:
+                yield _unpack_row(row)
+            cursor.close()
+        finally:
+            if self.is_postgres:
+                # Закрываем транзакцию серверного курсора перед возвратом соединения в пул
+                conn.rollback()
+            self.release_connection(conn)
+    
     def get_word_by_id(self, word_id: int) -> Optional[Dict]:
         conn = self.get_connection()
         try:
             cursor = self.get_cursor(conn)
             p = "%s" if self.is_postgres else "?"
             if self.is_postgres:
-                sql = f"SELECT id, word, definition, context, created_at, last_reviewed FROM words WHERE id = {p}"
+                sql = f"SELECT id, user_id, word, definition, definition_z, context, created_at, last_reviewed FROM words WHERE id = {p}"
             else:
-                sql = f"SELECT id, word, definition, context, datetime(created_at, 'localtime') as created_at, last_reviewed FROM words WHERE id = {p}"
+                sql = f"SELECT id, user_id, word, definition, definition_z, context, datetime(created_at, 'localtime') as created_at, last_reviewed FROM words WHERE id = {p}"
             cursor.execute(sql, (word_id,))
             row = cursor.fetchone()
-            return dict(row) if row else None
+            return _unpack_row(row) if row else None
         finally:
             self.release_connection(conn)
 
-    def search_words(self, user_id: int, query: str) -> List[Dict]:
+    def search_words(self, user_id: int, query: str, limit: int = 50) -> List[Dict]:
+        """
+        Поиск по словарю пользователя с ранжированием
+        
+        Каждое слово запроса ищется как префикс (синтез → синтезировать).
+        Совпадения в самом слове важнее совпадений в определении.
+        Возвращается краткое определение (short_definition), а не весь HTML.
+        """
+        terms = search_terms(query)
+        if not terms:
+            return []
+        
         conn = self.get_connection()
         try:
             cursor = self.get_cursor(conn)
-            p = "%s" if self.is_postgres else "?"
             if self.is_postgres:
-                sql = f"SELECT id, word, definition, context, created_at FROM words WHERE user_id = {p} AND (word ILIKE {p} OR definition ILIKE {p}) ORDER BY created_at DESC"
-                cursor.execute(sql, (user_id, f"%{query}%", f"%{query}%"))
+                tsquery = " & ".join(f"{term}:*" for term in terms)
+                prefix = " ".join(terms)
+                trgm_match = "OR lower(word) %% %(prefix)s" if getattr(self, 'has_trgm', False) else ""
+                trgm_rank = "+ similarity(lower(word), %(prefix)s)" if getattr(self, 'has_trgm', False) else ""
+                sql = f"""
+                    SELECT id, word, short_definition, context, created_at,
+                           ts_rank({PG_SEARCH_VECTOR}, to_tsquery('russian', %(tsquery)s))
+                           + CASE WHEN lower(word) LIKE %(like)s THEN 1 ELSE 0 END {trgm_rank} AS rank
+                    FROM words
+                    WHERE user_id = %(user_id)s AND (
+                        {PG_SEARCH_VECTOR} @@ to_tsquery('russian', %(tsquery)s)
+                        OR lower(word) LIKE %(like)s {trgm_match}
+                    )
+                    ORDER BY rank DESC, created_at DESC
+                    LIMIT %(limit)s
+                """
+                cursor.execute(sql, {
+                    'user_id': user_id, 'tsquery': tsquery, 'prefix': prefix,
+                    'like': prefix + '%', 'limit': limit
+                })
             else:
-                sql = f"SELECT id, word, definition, context, datetime(created_at, 'localtime') as created_at FROM words WHERE user_id ? AND (LOWER(word) LIKE LOWER(?) OR LOWER(definition) LIKE LOWER(?)) ORDER BY created_at DESC"
-                cursor.execute(sql, (user_id, f"%{query}%", f"%{query}%"))
-            return [dict(row) for row in cursor.fetchall()]
+                match = " AND ".join(f'"{term}"*' for term in terms)
+                # Ранжирование и LIMIT — внутри FTS по словам пользователя,
+                # в words идем только за найденными строками
+                cursor.execute("""
+                    SELECT w.id, w.word, w.short_definition, w.context, datetime(w.created_at, 'localtime') as created_at
+                    FROM (
+                        SELECT rowid, bm25(words_fts, 10.0, 1.0) AS rank
+                        FROM words_fts
+                        WHERE words_fts MATCH ? AND user_id = ?
+                        ORDER BY rank, rowid DESC
+                        LIMIT ?
+                    ) f
+                    JOIN words w ON w.id = f.rowid
+                    ORDER BY f.rank, w.created_at DESC
+                """, (match, user_id, limit))
+            return [{k: v for k, v in dict(row).items() if k != 'rank'} for row in cursor.fetchall()]
+        finally:
+            self.release_connection(conn)
+
+    def get_random_word(self, user_id: int, with_definition: bool = True) -> Optional[Dict]:
+        """Случайное слово пользователя (поиск по индексу rand_key, без сортировки всего словаря)"""
+        words = self._sample_words(user_id, 1, with_definition=with_definition)
+        return words[0] if words else None
+
+    def _sample_words(self, user_id: int, limit: int, condition: str = "", params: tuple = (),
+                      with_definition: bool = True) -> List[Dict]:
+        """
+        Случайная выборка слов пользователя
+        
+        Берем случайную точку в [0, 1) и читаем слова с rand_key после нее по индексу
+        (user_id, rand_key), при нехватке — с начала (по кругу). Стоимость — O(log n + limit).
+        
+        Args:
+            condition: Дополнительное условие SQL (начинается с AND)
+            params: Параметры для condition
+            with_definition: Читать полное объяснение (см. get_user_words)
+        """
+        conn = self.get_connection()
+        try:
+            cursor = self.get_cursor(conn)
+            p = "%s" if self.is_postgres else "?"
+            sql = f"""
+                SELECT {self._word_columns(with_definition)} FROM words
+                WHERE user_id = {p} AND rand_key {{op}} {p} {condition}
+                ORDER BY rand_key LIMIT {p}
+            """
+            start = random.random()
+            cursor.execute(sql.format(op=">="), (user_id, start) + params + (limit,))
+            rows = cursor.fetchall()
+            if len(rows) < limit:
+                cursor.execute(sql.format(op="<"), (user_id, start) + params + (limit - len(rows),))
+                rows += cursor.fetchall()
+            random.shuffle(rows)
+            return [_unpack_row(row) for row in rows]
         finally:
             self.release_connection(conn)
 
-    def get_random_word(self, user_id: int) -> Optional[Dict]:
+    def update_last_reviewed(self, word_id: int):
         conn = self.get_connection()
         try:
             cursor = self.get_cursor(conn)
             p = "%s" if self.is_postgres else "?"
-            if self.is_postgres:
-                sql = f"SELECT id, word, definition, context, created_at FROM words WHERE user_id = {p} ORDER BY RANDOM() LIMIT 1"
-            else:
-                sql = f"SELECT id, word, definition, context, datetime(created_at, 'localtime') as created_at FROM words WHERE user_id = ? ORDER BY RANDOM() LIMIT 1"
-            cursor.execute(sql, (user_id,))
+            cursor.execute(f"SELECT user_id FROM words WHERE id = {p}", (word_id,))
             row = cursor.fetchone()
-            return dict(row) if row else None
+            if not row:
+                return
+            
+            # Новый rand_key после показа выравнивает вероятность слов с большим "зазором" перед ними
+            cursor.execute(f"UPDATE words SET last_reviewed = CURRENT_TIMESTAMP, rand_key = {p} WHERE id = {p}",
+                           (random.random(), word_id))
+            self._stats_on_review(cursor, row['user_id'])
+            conn.commit()
         finally:
             self.release_connection(conn)
 
-    def update_last_reviewed(self, word_id: int):
+    def review_word(self, word_id: int, user_id: int, grade: int) -> Optional[Schedule]:
+        """
+        Записать ответ на повторение и запланировать следующий показ (SM-2)
+        
+        Returns:
+            Новое расписание слова или None, если слово не найдено
+        """
         conn = self.get_connection()
         try:
             cursor = self.get_cursor(conn)
             p = "%s" if self.is_postgres else "?"
-            cursor.execute(f"UPDATE words SET last_reviewed = CURRENT_TIMESTAMP WHERE id = {p}", (word_id,))
+            cursor.execute(f"SELECT ease, interval_days, repetitions FROM words WHERE id = {p} AND user_id = {p}",
+                           (word_id, user_id))
+            row = cursor.fetchone()
+            if not row:
+                return None
+            
+            schedule = next_schedule(row['ease'], row['interval_days'], row['repetitions'], grade)
+            due = f"CURRENT_TIMESTAMP + {p} * INTERVAL '1 minute'" if self.is_postgres else "datetime('now', '+' || ? || ' minutes')"
+            cursor.execute(f"""
+                UPDATE words SET ease = {p}, interval_days = {p}, repetitions = {p}, due_at = {due},
+                    last_reviewed = CURRENT_TIMESTAMP, rand_key = {p}
+                WHERE id = {p}
+            """, (schedule.ease, schedule.interval_days, schedule.repetitions, schedule.delay_minutes,
+                  random.random(), word_id))
+            self._stats_on_review(cursor, user_id)
             conn.commit()
+            return schedule
+        finally:
+            self.release_connection(conn)
+
+    def get_due_words(self, user_id: int, limit: int = 10) -> List[Dict]:
+        """Слова, которые пора повторить (самые просроченные первыми) — диапазон по индексу (user_id, due_at)"""
+        conn = self.get_connection()
+        try:
+            cursor = self.get_cursor(conn)
+            p = "%s" if self.is_postgres else "?"
+            cursor.execute(f"""
+                SELECT id, word, short_definition, due_at, ease, interval_days, repetitions FROM words
+                WHERE user_id = {p} AND due_at <= CURRENT_TIMESTAMP
+                ORDER BY due_at LIMIT {p}
+            """, (user_id, limit))
+            return [dict(row) for row in cursor.fetchall()]
+        finally:
+            self.release_connection(conn)
+
+    def count_due_words(self, user_id: int) -> int:
+        """Сколько слов пользователя ждут повторения"""
+        conn = self.get_connection()
+        try:
+            cursor = self.get_cursor(conn)
+            p = "%s" if self.is_postgres else "?"
+            cursor.execute(f"SELECT COUNT(*) AS due FROM words WHERE user_id = {p} AND due_at <= CURRENT_TIMESTAMP",
+                           (user_id,))
+            return cursor.fetchone()['due']
+        finally:
+            self.release_connection(conn)
+
+    def get_users_with_due_words(self, min_due: int = 1) -> List[Dict]:
+        """
+        Подписчики, у которых накопились слова к повторению — одним запросом на всех
+        
+        Returns:
+            Список {'user_id', 'due'}
+        """
+        conn = self.get_connection()
+        try:
+            cursor = self.get_cursor(conn)
+            p = "%s" if self.is_postgres else "?"
+            subscribed = "TRUE" if self.is_postgres else "1"
+            cursor.execute(f"""
+                SELECT w.user_id, COUNT(*) AS due
+                FROM words w JOIN users u ON u.user_id = w.user_id
+                WHERE u.is_subscribed = {subscribed} AND w.due_at <= CURRENT_TIMESTAMP
+                GROUP BY w.user_id
+                HAVING COUNT(*) >= {p}
+            """, (min_due,))
+            return [dict(row) for row in cursor.fetchall()]
         finally:
             self.release_connection(conn)
 
@@ -304,110 +1080,442 @@ class Database:
             p = "%s" if self.is_postgres else "?"
             cursor.execute(f"DELETE FROM words WHERE id = {p} AND user_id = {p}", (word_id, user_id))
             deleted = cursor.rowcount > 0
+            if deleted:
+                self._stats_on_delete(cursor, user_id)
             conn.commit()
             return deleted
         finally:
             self.release_connection(conn)
 
-    def get_user_stats(self, user_id: int) -> Dict:
+    def _stats_on_add(self, cursor, user_id: int, added: int):
+        """Обновить статистику после сохранения слов (в транзакции вызывающего метода)"""
+        p = "%s" if self.is_postgres else "?"
+        cursor.execute(f"""
+            INSERT INTO user_stats (user_id, word_count, first_word_date, last_word_date)
+            VALUES ({p}, {p}, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+            ON CONFLICT (user_id) DO UPDATE SET
+                word_count = user_stats.word_count + EXCLUDED.word_count,
+                first_word_date = COALESCE(user_stats.first_word_date, EXCLUDED.first_word_date),
+                last_word_date = EXCLUDED.last_word_date
+        """, (user_id, added))
+        self._bump_streak(cursor, user_id)
+
+    def _stats_on_delete(self, cursor, user_id: int):
+        """Обновить статистику после удаления слова (MIN/MAX идут по индексу user_id, created_at)"""
+        p = "%s" if self.is_postgres else "?"
+        cursor.execute(f"""
+            UPDATE user_stats SET
+                word_count = word_count - 1,
+                first_word_date = (SELECT MIN(created_at) FROM words WHERE user_id = {p}),
+                last_word_date = (SELECT MAX(created_at) FROM words WHERE user_id = {p})
+            WHERE user_id = {p}
+        """, (user_id, user_id, user_id))
+
+    def _stats_on_review(self, cursor, user_id: int):
+        """Счетчик повторений и серия дней после ответа на повторение"""
+        p = "%s" if self.is_postgres else "?"
+        cursor.execute(f"""
+            INSERT INTO user_stats (user_id, reviews_done) VALUES ({p}, 1)
+            ON CONFLICT (user_id) DO UPDATE SET reviews_done = user_stats.reviews_done + 1
+        """, (user_id,))
+        self._bump_streak(cursor, user_id)
+    
+    def _bump_streak(self, cursor, user_id: int):
+        """Продлить серию дней подряд с занятиями (добавление или повторение слов)"""
+        p = "%s" if self.is_postgres else "?"
+        today = datetime.utcnow().date()
+        cursor.execute(f"SELECT streak_days, last_active_date FROM user_stats WHERE user_id = {p}", (user_id,))
+        row = cursor.fetchone()
+        last_active = row['last_active_date']
+        if isinstance(last_active, str):
+            last_active = date.fromisoformat(last_active)
+        
+        if last_active == today:
+            return
+        streak = row['streak_days'] + 1 if last_active == today - timedelta(days=1) else 1
+        cursor.execute(f"UPDATE user_stats SET streak_days = {p}, last_active_date = {p} WHERE user_id = {p}",
+                       (streak, today if self.is_postgres else today.isoformat(), user_id))
+
+    def rebuild_user_stats(self, user_id: int = None) -> int:
+        """
+        Пересчитать счетчики и даты по таблице words (исправление расхождений)
+        
+        reviews_done и серия дней из words не восстанавливаются и сохраняются как есть.
+        
+        Returns:
+            Сколько пользователей пересчитано
+        """
         conn = self.get_connection()
         try:
             cursor = self.get_cursor(conn)
             p = "%s" if self.is_postgres else "?"
+            user_filter = f"user_id = {p}" if user_id is not None else "TRUE"
+            params = (user_id,) if user_id is not None else ()
             
-            if self.is_postgres:
-                sql = f"SELECT COUNT(*) as total_words, MIN(created_at) as first_word_date, MAX(created_at) as last_word_date FROM words WHERE user_id = {p}"
-            else:
-                sql = f"SELECT COUNT(*) as total_words, MIN(datetime(created_at, 'localtime')) as first_word_date, MAX(datetime(created_at, 'localtime')) as last_word_date FROM words WHERE user_id = ?"
-                
-            cursor.execute(sql, (user_id,))
-            return dict(cursor.fetchone())
+            cursor.execute(f"""
+                INSERT INTO user_stats (user_id, word_count, first_word_date, last_word_date)
+                SELECT user_id, COUNT(*), MIN(created_at), MAX(created_at) FROM words
+                WHERE {user_filter} GROUP BY user_id
+                ON CONFLICT (user_id) DO UPDATE SET
+                    word_count = EXCLUDED.word_count,
+                    first_word_date = EXCLUDED.first_word_date,
+                    last_word_date = EXCLUDED.last_word_date
+            """, params)
+            rebuilt = cursor.rowcount
+            
+            # Пользователи, у которых слов не осталось
+            cursor.execute(f"""
+                UPDATE user_stats SET word_count = 0, first_word_date = NULL, last_word_date = NULL
+                WHERE {user_filter} AND NOT EXISTS (SELECT 1 FROM words w WHERE w.user_id = user_stats.user_id)
+            """, params)
+            rebuilt += cursor.rowcount
+            conn.commit()
+            return rebuilt
         finally:
             self.release_connection(conn)
 
-    def get_words_to_review(self, user_id: int, days: int = 7) -> List[Dict]:
+    def get_user_stats(self, user_id: int) -> Dict:
+        """Статистика пользователя — одно чтение по первичному ключу user_stats"""
         conn = self.get_connection()
         try:
             cursor = self.get_cursor(conn)
-            p = "%s" if self.is_postgres else "?"
             
             if self.is_postgres:
-                sql = f"SELECT id, word, definition, context, created_at, last_reviewed FROM words WHERE user_id = {p} AND (last_reviewed IS NULL OR last_reviewed <= CURRENT_TIMESTAMP - INTERVAL '{days} days') ORDER BY RANDOM() LIMIT 10"
-                cursor.execute(sql, (user_id,))
+                sql = """
+                    SELECT word_count as total_words, first_word_date, last_word_date,
+                           reviews_done, streak_days, last_active_date
+                    FROM user_stats WHERE user_id = %s
+                """
             else:
-                sql = f"SELECT id, word, definition, context, datetime(created_at, 'localtime') as created_at, last_reviewed FROM words WHERE user_id = ? AND (last_reviewed IS NULL OR julianday('now') - julianday(last_reviewed) >= ?) ORDER BY RANDOM() LIMIT 10"
-                cursor.execute(sql, (user_id, days))
+                sql = """
+                    SELECT word_count as total_words,
+                           datetime(first_word_date, 'localtime') as first_word_date,
+                           datetime(last_word_date, 'localtime') as last_word_date,
+                           reviews_done, streak_days, last_active_date
+                    FROM user_stats WHERE user_id = ?
+                """
                 
-            return [dict(row) for row in cursor.fetchall()]
+            cursor.execute(sql, (user_id,))
+            row = cursor.fetchone()
+            if not row:
+                return {'total_words': 0, 'first_word_date': None, 'last_word_date': None,
+                        'reviews_done': 0, 'streak_days': 0}
+            
+            stats = dict(row)
+            last_active = stats.pop('last_active_date')
+            if isinstance(last_active, str):
+                last_active = date.fromisoformat(last_active)
+            # Серия прервана, если вчера и сегодня занятий не было
+            if not last_active or last_active < datetime.utcnow().date() - timedelta(days=1):
+                stats['streak_days'] = 0
+            return stats
         finally:
             self.release_connection(conn)
 
+    def get_words_to_review(self, user_id: int, days: int = 7, with_definition: bool = True) -> List[Dict]:
+        if self.is_postgres:
+            return self._sample_words(user_id, 10, f"AND (last_reviewed IS NULL OR last_reviewed <= CURRENT_TIMESTAMP - INTERVAL '{int(days)} days')",
+                                      with_definition=with_definition)
+        return self._sample_words(user_id, 10, "AND (last_reviewed IS NULL OR julianday('now') - julianday(last_reviewed) >= ?)", (days,),
+                                  with_definition=with_definition)
 
-    def get_dictionary_data(self, user_id: int, limit: int = 5, offset: int = 0) -> Dict:
+
+    def get_dictionary_data(self, user_id: int, limit: int = 5, offset: int = 0,
+                            anchor: Tuple[int, int] = None, direction: str = "n") -> Dict:
         """
-        Получить все данные для словаря за ОДИН запрос (оптимизация)
+        Получить страницу словаря (новые слова первыми)
+        
+        Страницы листаются по курсору (keyset) — ключу слова-якоря (page_at, id),
+        который кнопки несут с собой. Строку якоря не ищем, поэтому курсор
+        работает и после того, как само слово удалено:
+            direction="n" — слова старше якоря (следующая страница)
+            direction="p" — слова новее якоря (предыдущая страница)
+            direction="a" — начиная с самого якоря (вернуться на ту же страницу)
+        Без курсора используется offset (первая страница и старые кнопки).
+        
+        Returns:
+            total_words, words (id, word, short_definition, page_at), has_next, has_prev
         """
         conn = self.get_connection()
         try:
             cursor = self.get_cursor(conn)
             p = "%s" if self.is_postgres else "?"
+            page_at, at_param = self._page_key()
+            columns = f"id, word, short_definition, {page_at} AS page_at"
             
-            # 1. Считаем статистику
-            if self.is_postgres:
-                sql_stats = f"SELECT COUNT(*) as total_words FROM words WHERE user_id = {p}"
-            else:
-                sql_stats = f"SELECT COUNT(*) as total_words FROM words WHERE user_id = ?"
-            
-            cursor.execute(sql_stats, (user_id,))
-            total_words = cursor.fetchone()['total_words']
+            # 1. Счетчик слов поддерживается при добавлении/удалении
+            cursor.execute(f"SELECT word_count FROM user_stats WHERE user_id = {p}", (user_id,))
+            row = cursor.fetchone()
+            total_words = row['word_count'] if row else 0
             
-            # 2. Получаем слова
-            if self.is_postgres:
-                sql_words = f"SELECT id, word FROM words WHERE user_id = {p} ORDER BY created_at DESC LIMIT {limit} OFFSET {offset}"
+            # 2. Страница слов по индексу (user_id, created_at, id)
+            if anchor is None:
+                cursor.execute(f"""
+                    SELECT {columns} FROM words WHERE user_id = {p}
+                    ORDER BY created_at DESC, id DESC LIMIT {p} OFFSET {p}
+                """, (user_id, limit + 1, offset))
+            elif direction == "p":
+                cursor.execute(f"""
+                    SELECT {columns} FROM words WHERE user_id = {p} AND (created_at, id) > ({at_param}, {p})
+                    ORDER BY created_at ASC, id ASC LIMIT {p}
+                """, (user_id, *anchor, limit + 1))
             else:
-                sql_words = f"SELECT id, word FROM words WHERE user_id = ? ORDER BY created_at DESC LIMIT {limit} OFFSET {offset}"
-                
-            cursor.execute(sql_words, (user_id,))
+                op = "<=" if direction == "a" else "<"
+                cursor.execute(f"""
+                    SELECT {columns} FROM words WHERE user_id = {p} AND (created_at, id) {op} ({at_param}, {p})
+                    ORDER BY created_at DESC, id DESC LIMIT {p}
+                """, (user_id, *anchor, limit + 1))
             words = [dict(row) for row in cursor.fetchall()]
             
+            has_more = len(words) > limit
+            words = words[:limit]
+            if direction == "p" and anchor is not None:
+                # Шли от якоря к новым словам — возвращаем в обычном порядке
+                words.reverse()
+                has_next, has_prev = True, has_more
+            else:
+                has_next = has_more
+                has_prev = offset > 0 if anchor is None else self._has_newer_words(cursor, user_id, words)
+            
             return {
                 'total_words': total_words,
-                'words': words
+                'words': words,
+                'has_next': has_next,
+                'has_prev': has_prev
             }
         finally:
             self.release_connection(conn)
 
-    def save_pending_suggestion(self, user_id: int, word: str, definition: str):
-        """Сохранить последнее предложенное слово (кэш в БД)"""
+    def _page_key(self) -> Tuple[str, str]:
+        """
+        Ключ created_at для курсора словаря в виде целого числа (для callback_data):
+        SQL, который его вычисляет, и SQL, который превращает параметр обратно в created_at.
+        В SQLite время хранится с точностью до секунды, в Postgres — до микросекунды.
+        """
+        if self.is_postgres:
+            return ("round(extract(epoch FROM created_at) * 1000000)::bigint",
+                    "TIMESTAMP 'epoch' + %s * INTERVAL '1 microsecond'")
+        return "CAST(strftime('%s', created_at) AS INTEGER)", "datetime(?, 'unixepoch')"
+
+    def _has_newer_words(self, cursor, user_id: int, words: List[Dict]) -> bool:
+        """Есть ли слова новее первого слова страницы"""
+        if not words:
+            return False
+        p = "%s" if self.is_postgres else "?"
+        _, at_param = self._page_key()
+        cursor.execute(f"""
+            SELECT 1 FROM words WHERE user_id = {p} AND (created_at, id) > ({at_param}, {p})
+            LIMIT 1
+        """, (user_id, words[0]['page_at'], words[0]['id']))
+        return cursor.fetchone() is not None
+
+    def put_state(self, key: str, value: str, ttl: int):
+        """Сохранить временное значение на ttl секунд (длинное — сжатым)"""
+        value, value_z = pack_definition(value)
+        conn = self.get_connection()
+        try:
+            cursor = self.get_cursor(conn)
+            if self.is_postgres:
+                cursor.execute("""
+                    INSERT INTO ephemeral_state (state_key, value, value_z, expires_at)
+                    VALUES (%s, %s, %s, CURRENT_TIMESTAMP + %s * INTERVAL '1 second')
+                    ON CONFLICT (state_key) DO UPDATE SET
+                        value = EXCLUDED.value, value_z = EXCLUDED.value_z, expires_at = EXCLUDED.expires_at
+                """, (key, value, value_z, ttl))
+            else:
+                cursor.execute("""
+                    INSERT OR REPLACE INTO ephemeral_state (state_key, value, value_z, expires_at)
+                    VALUES (?, ?, ?, datetime('now', ?))
+                """, (key, value, value_z, f"{int(ttl):+d} seconds"))
+            conn.commit()
+        finally:
+            self.release_connection(conn)
+
+    def get_state(self, key: str, delete: bool = False) -> Optional[str]:
+        """
+        Временное значение по ключу (None, если нет или истекло)
+        
+        Args:
+            delete: Удалить значение тем же запросом (одноразовые токены)
+        """
         conn = self.get_connection()
         try:
             cursor = self.get_cursor(conn)
             p = "%s" if self.is_postgres else "?"
-            
+            if delete:
+                cursor.execute(f"DELETE FROM ephemeral_state WHERE state_key = {p} RETURNING value, value_z, "
+                               f"expires_at > CURRENT_TIMESTAMP AS alive", (key,))
+            else:
+                cursor.execute(f"SELECT value, value_z, expires_at > CURRENT_TIMESTAMP AS alive "
+                               f"FROM ephemeral_state WHERE state_key = {p}", (key,))
+            row = cursor.fetchone()
+            conn.commit()
+            if not row or not row['alive']:
+                return None
+            return unpack_definition(row['value'], row['value_z'])
+        finally:
+            self.release_connection(conn)
+
+    def purge_state(self) -> int:
+        """Удалить истекшие временные значения. Возвращает число удаленных"""
+        conn = self.get_connection()
+        try:
+            cursor = self.get_cursor(conn)
+            cursor.execute("DELETE FROM ephemeral_state WHERE expires_at <= CURRENT_TIMESTAMP")
+            deleted = cursor.rowcount
+            conn.commit()
+            return deleted
+        finally:
+            self.release_connection(conn)
+
+    def get_cached_explanation(self, cache_key: str, max_age: int) -> Optional[Dict]:
+        """Получить объяснение из общего кэша, если оно не старше max_age секунд"""
+        conn = self.get_connection()
+        try:
+            cursor = self.get_cursor(conn)
             if self.is_postgres:
                 cursor.execute("""
-                    INSERT INTO pending_suggestions (user_id, word, definition, created_at)
-                    VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
-                    ON CONFLICT (user_id) DO UPDATE 
-                    SET word = EXCLUDED.word, definition = EXCLUDED.definition, created_at = CURRENT_TIMESTAMP
-                """, (user_id, word, definition))
+                    SELECT normalized_word, explanation FROM explanation_cache
+                    WHERE cache_key = %s AND created_at >= CURRENT_TIMESTAMP - make_interval(secs => %s)
+                """, (cache_key, max_age))
             else:
                 cursor.execute("""
-                    INSERT OR REPLACE INTO pending_suggestions (user_id, word, definition, created_at)
-                    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-                """, (user_id, word, definition))
+                    SELECT normalized_word, explanation FROM explanation_cache
+                    WHERE cache_key = ? AND created_at >= datetime('now', ?)
+                """, (cache_key, f"-{int(max_age)} seconds"))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+        finally:
+            self.release_connection(conn)
+
+    def save_cached_explanation(self, cache_keys: List[str], normalized_word: str, explanation: str):
+        """Сохранить объяснение в общий кэш сразу под несколькими ключами"""
+        conn = self.get_connection()
+        try:
+            cursor = self.get_cursor(conn)
+            for cache_key in set(cache_keys):
+                if self.is_postgres:
+                    cursor.execute("""
+                        INSERT INTO explanation_cache (cache_key, normalized_word, explanation, created_at)
+                        VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+                        ON CONFLICT (cache_key) DO UPDATE
+                        SET normalized_word = EXCLUDED.normalized_word, explanation = EXCLUDED.explanation, created_at = CURRENT_TIMESTAMP
+                    """, (cache_key, normalized_word, explanation))
+                else:
+                    cursor.execute("""
+                        INSERT OR REPLACE INTO explanation_cache (cache_key, normalized_word, explanation, created_at)
+                        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                    """, (cache_key, normalized_word, explanation))
             conn.commit()
         finally:
             self.release_connection(conn)
 
-    def get_pending_suggestion(self, user_id: int) -> Optional[Dict]:
-        """Получить последнее предложенное слово из кэша БД"""
+    def purge_explanation_cache(self, max_age: int) -> int:
+        """Удалить из кэша объяснения старше max_age секунд. Возвращает число удаленных"""
+        conn = self.get_connection()
+        try:
+            cursor = self.get_cursor(conn)
+            if self.is_postgres:
+                cursor.execute("DELETE FROM explanation_cache WHERE created_at < CURRENT_TIMESTAMP - make_interval(secs => %s)", (max_age,))
+            else:
+                cursor.execute("DELETE FROM explanation_cache WHERE created_at < datetime('now', ?)", (f"-{int(max_age)} seconds",))
+            deleted = cursor.rowcount
+            conn.commit()
+            return deleted
+        finally:
+            self.release_connection(conn)
+
+    def add_pool_words(self, theme: str, items: List[tuple]) -> int:
+        """
+        Добавить сгенерированные слова в пул темы (дубликаты пропускаются)
+        
+        Args:
+            theme: Тема
+            items: Список (word, explanation_html)
+        
+        Returns:
+            Сколько слов добавлено
+        """
+        conn = self.get_connection()
+        try:
+            cursor = self.get_cursor(conn)
+            added = 0
+            for word, explanation in items:
+                key = word_key(word)
+                if self.is_postgres:
+                    cursor.execute("""
+                        INSERT INTO word_pool (theme, word, word_key, explanation)
+                        VALUES (%s, %s, %s, %s)
+                        ON CONFLICT (theme, word_key) DO NOTHING
+                    """, (theme, word, key, explanation))
+                else:
+                    cursor.execute("""
+                        INSERT OR IGNORE INTO word_pool (theme, word, word_key, explanation)
+                        VALUES (?, ?, ?, ?)
+                    """, (theme, word, key, explanation))
+                added += cursor.rowcount
+            conn.commit()
+            return added
+        finally:
+            self.release_connection(conn)
+
+    def get_pool_counts(self) -> Dict[str, int]:
+        """Количество доступных слов в пуле по темам"""
+        conn = self.get_connection()
+        try:
+            cursor = self.get_cursor(conn)
+            cursor.execute("SELECT theme, COUNT(*) as total FROM word_pool GROUP BY theme")
+            return {row['theme']: row['total'] for row in cursor.fetchall()}
+        finally:
+            self.release_connection(conn)
+
+    def get_pool_words(self, theme: str) -> List[str]:
+        """Слова, которые уже лежат в пуле темы"""
+        conn = self.get_connection()
+        try:
+            cursor = self.get_cursor(conn)
+            p = "%s" if self.is_postgres else "?"
+            cursor.execute(f"SELECT word FROM word_pool WHERE theme = {p}", (theme,))
+            return [row['word'] for row in cursor.fetchall()]
+        finally:
+            self.release_connection(conn)
+
+    def draw_pool_word(self, user_id: int, exclude_words: List[str] = None, max_serves: int = 20) -> Optional[Dict]:
+        """
+        Выдать пользователю слово из пула, которого нет в его словаре
+        
+        Реже выданные слова идут первыми. Слово, выданное max_serves раз,
+        удаляется из пула, чтобы пул обновлялся.
+        """
         conn = self.get_connection()
         try:
             cursor = self.get_cursor(conn)
             p = "%s" if self.is_postgres else "?"
-            cursor.execute(f"SELECT word, definition FROM pending_suggestions WHERE user_id = {p}", (user_id,))
+            exclude_keys = [word_key(w) for w in (exclude_words or [])]
+            
+            # Сравнение по уникальному индексу слов пользователя
+            sql = f"""
+                SELECT id, theme, word, explanation, served_count FROM word_pool wp
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM words w WHERE w.user_id = {p} AND w.word_key = wp.word_key
+                )
+            """
+            params = [user_id]
+            if exclude_keys:
+                sql += f" AND wp.word_key NOT IN ({', '.join([p] * len(exclude_keys))})"
+                params.extend(exclude_keys)
+            sql += " ORDER BY wp.served_count, RANDOM() LIMIT 1"
+            
+            cursor.execute(sql, params)
             row = cursor.fetchone()
-            return dict(row) if row else None
+            if not row:
+                return None
+            
+            if row['served_count'] + 1 >= max_serves:
+                cursor.execute(f"DELETE FROM word_pool WHERE id = {p}", (row['id'],))
+            else:
+                cursor.execute(f"UPDATE word_pool SET served_count = served_count + 1 WHERE id = {p}", (row['id'],))
+            conn.commit()
+            return {'theme': row['theme'], 'word': row['word'], 'explanation': row['explanation']}
         finally:
             self.release_connection(conn)
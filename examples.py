@@ -5,6 +5,7 @@
 """
 
 from database import Database
+from importer import open_rows
 import google.generativeai as genai
 
 
@@ -46,15 +47,10 @@ def add_multiple_words(user_id: int, words_list: list):
     """
     db = Database()
     
-    for word in words_list:
-        # Получаем определение через Gemini
-        prompt = f"Объясни слово '{word}' кратко и понятно"
-        # response = model.generate_content(prompt)
-        # definition = response.text
-        
-        # Для примера просто добавим
-        db.add_word(user_id, word, f"Определение слова {word}")
-        print(f"✅ Добавлено: {word}")
+    # Определения можно получить через Gemini (см. WordImporter в importer.py),
+    # для примера просто добавим все слова одной транзакцией
+    added = db.add_words_bulk(user_id, [(word, f"Определение слова {word}") for word in words_list])
+    print(f"✅ Добавлено: {added}")
 
 
 # Пример 3: Экспорт словаря в текстовый файл
@@ -162,20 +158,17 @@ def import_from_file(user_id: int, filepath: str):
     слово1
     слово2
     слово3
+    
+    Полноценный импорт с объяснениями от AI: python importer.py USER_ID ФАЙЛ
     """
     db = Database()
     
-    with open(filepath, 'r', encoding='utf-8') as f:
-        words = [line.strip() for line in f if line.strip()]
-    
-    print(f"Импортируем {len(words)} слов...")
-    
-    for word in words:
-        # Здесь можно получить определение через Gemini
-        definition = f"Определение слова {word}"  # Placeholder
-        db.add_word(user_id, word, definition)
+    # Файл читается построчно, запись — одной транзакцией
+    rows = [(word, definition or f"Определение слова {word}") for word, definition in open_rows(filepath)]
+    print(f"Импортируем {len(rows)} слов...")
     
-    print("✅ Импорт завершен!")
+    added = db.add_words_bulk(user_id, rows)
+    print(f"✅ Импорт завершен! Добавлено: {added}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,87 @@
+"""
+Кэш объяснений слов
+
+Объяснение слова одинаково для всех пользователей, поэтому повторные
+запросы обслуживаются из памяти процесса (LRU) или из таблицы
+explanation_cache, не тратя квоту Gemini.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from config import EXPLANATION_CACHE_SIZE, EXPLANATION_CACHE_TTL
+
+
+def normalize_key(word: str) -> str:
+    """Ключ кэша: слово в нижнем регистре без лишних пробелов"""
+    return " ".join(word.lower().replace("ё", "е").split())
+
+
+class ExplanationCache:
+    """Двухуровневый кэш: LRU в памяти + постоянная таблица в БД"""
+
+    def __init__(self, db, max_size: int = None, ttl: int = None):
+        """
+        Args:
+            db: Экземпляр AsyncDatabase
+            max_size: Максимум записей в памяти процесса
+            ttl: Время жизни записи в секундах
+        """
+        self.db = db
+        self.max_size = max_size or EXPLANATION_CACHE_SIZE
+        self.ttl = ttl or EXPLANATION_CACHE_TTL
+        self._memory = OrderedDict()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    async def get(self, word: str) -> Optional[Tuple[str, str]]:
+        """Вернуть (normalized_word, explanation) или None"""
+        key = normalize_key(word)
+
+        entry = self._memory.get(key)
+        if entry:
+            normalized_word, explanation, stored_at = entry
+            if time.monotonic() - stored_at < self.ttl:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return normalized_word, explanation
+            del self._memory[key]
+
+        row = await self.db.get_cached_explanation(key, self.ttl)
+        if row:
+            self.db_hits += 1
+            self._remember(key, row['normalized_word'], row['explanation'])
+            return row['normalized_word'], row['explanation']
+
+        self.misses += 1
+        return None
+
+    async def put(self, word: str, normalized_word: str, explanation: str):
+        """Сохранить объяснение под ключом запроса и ключом нормализованного слова"""
+        keys = {normalize_key(word), normalize_key(normalized_word)}
+        for key in keys:
+            self._remember(key, normalized_word, explanation)
+        await self.db.save_cached_explanation(list(keys), normalized_word, explanation)
+
+    async def purge(self) -> int:
+        """Удалить устаревшие записи из БД. Возвращает число удаленных"""
+        return await self.db.purge_explanation_cache(self.ttl)
+
+    def stats(self) -> Dict:
+        """Счетчики попаданий/промахов"""
+        total = self.memory_hits + self.db_hits + self.misses
+        return {
+            'memory_hits': self.memory_hits,
+            'db_hits': self.db_hits,
+            'misses': self.misses,
+            'hit_rate': (self.memory_hits + self.db_hits) / total if total else 0.0,
+            'memory_size': len(self._memory),
+        }
+
+    def _remember(self, key: str, normalized_word: str, explanation: str):
+        self._memory[key] = (normalized_word, explanation, time.monotonic())
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
@@ -0,0 +1,146 @@
+"""
+Экспорт словаря в файл (CSV, Excel, Anki)
+
+Слова читаются из БД потоком (Database.iter_user_words) и сразу пишутся
+во временный файл, поэтому память не растет вместе со словарем.
+Функции блокирующие — из бота их нужно вызывать через AsyncDatabase.run.
+"""
+
+import csv
+import html
+import importlib.util
+import io
+import tempfile
+from typing import IO, Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+
+from sections import html_to_text
+
+# Файл до этого размера держится в памяти, больше — уходит на диск
+SPOOL_MAX_SIZE = 1024 * 1024
+
+HEADERS = ['Слово', 'Определение', 'Контекст', 'Дата добавления']
+
+
+class ExportError(Exception):
+    """Экспорт в выбранный формат недоступен (например, не установлена библиотека)"""
+
+
+def write_csv(rows: Iterable[Dict], out: IO[bytes]) -> int:
+    """CSV в UTF-8 с BOM (корректно открывается в Excel)"""
+    text = io.TextIOWrapper(out, encoding="utf-8-sig", newline="")
+    writer = csv.writer(text)
+    writer.writerow(HEADERS)
+    count = 0
+    for row in rows:
+        writer.writerow([row['word'], html_to_text(row['definition']), row['context'] or "", row['created_at']])
+        count += 1
+    text.flush()
+    # Файл остается открытым для отправки
+    text.detach()
+    return count
+
+
+def write_xlsx(rows: Iterable[Dict], out: IO[bytes]) -> int:
+    """
+    Excel в режиме write-only: строки не копятся в памяти
+
+    Установка: pip install openpyxl
+    """
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise ExportError("Для экспорта в Excel установи openpyxl: pip install openpyxl")
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Словарь")
+    ws.append(HEADERS)
+    count = 0
+    for row in rows:
+        ws.append([row['word'], html_to_text(row['definition']), row['context'] or "", str(row['created_at'])])
+        count += 1
+    wb.save(out)
+    return count
+
+
+# Постоянные ID модели и колоды Anki (чтобы повторный импорт обновлял, а не дублировал)
+ANKI_MODEL_ID = 1607392319
+ANKI_DECK_ID = 2059400110
+
+
+def write_apkg(rows: Iterable[Dict], out: IO[bytes]) -> int:
+    """
+    Колода Anki (.apkg): слово на лицевой стороне, объяснение на обороте
+
+    Установка: pip install genanki
+    """
+    try:
+        import genanki
+    except ImportError:
+        raise ExportError("Для экспорта в Anki установи genanki: pip install genanki")
+
+    model = genanki.Model(
+        ANKI_MODEL_ID, "myVocabulary",
+        fields=[{'name': 'Слово'}, {'name': 'Объяснение'}],
+        templates=[{
+            'name': 'Карточка',
+            'qfmt': '<h2>{{Слово}}</h2>',
+            'afmt': '{{FrontSide}}<hr id="answer">{{Объяснение}}',
+        }],
+    )
+    deck = genanki.Deck(ANKI_DECK_ID, "Мой словарь")
+    count = 0
+    for row in rows:
+        deck.add_note(genanki.Note(
+            model=model,
+            fields=[html.escape(row['word']), (row['definition'] or "").replace("\n", "<br>")],
+            guid=genanki.guid_for(row['word'].lower()),
+        ))
+        count += 1
+    genanki.Package(deck).write_to_file(out)
+    return count
+
+
+class ExportFormat(NamedTuple):
+    title: str
+    filename: str
+    write: Callable[[Iterable[Dict], IO[bytes]], int]
+    requires: Optional[str] = None  # необязательная библиотека формата
+
+
+FORMATS = {
+    'csv': ExportFormat("📄 CSV", "my_vocabulary.csv", write_csv),
+    'xlsx': ExportFormat("📊 Excel", "my_vocabulary.xlsx", write_xlsx, "openpyxl"),
+    'apkg': ExportFormat("🃏 Anki", "my_vocabulary.apkg", write_apkg, "genanki"),
+}
+
+
+def available_formats() -> Dict[str, ExportFormat]:
+    """Форматы, библиотеки которых установлены (их и показываем пользователю)"""
+    return {
+        key: export_format for key, export_format in FORMATS.items()
+        if export_format.requires is None or importlib.util.find_spec(export_format.requires)
+    }
+
+
+def export_words(db, user_id: int, fmt: str) -> Tuple[IO[bytes], int]:
+    """
+    Выгрузить словарь пользователя во временный файл
+
+    Args:
+        db: Экземпляр Database (синхронный)
+        fmt: Ключ из FORMATS
+
+    Returns:
+        (файл, открытый на чтение с начала, число слов). Файл закрывает вызывающий
+    """
+    if fmt not in FORMATS:
+        raise ExportError(f"Неизвестный формат: {fmt}")
+
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    try:
+        count = FORMATS[fmt].write(db.iter_user_words(user_id), out)
+    except BaseException:
+        out.close()
+        raise
+    out.seek(0)
+    return out, count
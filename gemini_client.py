@@ -0,0 +1,176 @@
+"""
+Асинхронный клиент Gemini
+
+Все обращения к Gemini идут через этот модуль, чтобы долгий ответ
+модели не блокировал цикл событий бота и обновления других пользователей.
+Здесь же квота по моделям, повторы временных ошибок и предохранитель
+(см. resilience.py).
+"""
+
+import asyncio
+import logging
+from typing import AsyncIterator, Dict
+
+from config import (
+    GEMINI_BACKOFF_BASE, GEMINI_BACKOFF_CAP, GEMINI_BREAKER_RESET, GEMINI_BREAKER_THRESHOLD,
+    GEMINI_MAX_CONCURRENCY, GEMINI_MAX_INTERACTIVE_WAIT, GEMINI_MAX_RETRIES, GEMINI_RPM,
+)
+from resilience import (
+    INTERACTIVE, GeminiUnavailable, ModelQuota, PriorityGate,
+    backoff_delay, is_transient, retry_after,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class GeminiClient:
+    """Неблокирующая обертка над genai.GenerativeModel с приоритетной очередью и повторами"""
+
+    def __init__(self, model=None, max_concurrency: int = None, rpm: float = None, max_retries: int = None):
+        """
+        Args:
+            model: Модель по умолчанию — genai.GenerativeModel (или совместимый объект);
+                ModelRouter передает модель в каждый запрос сам
+            max_concurrency: Максимум одновременных запросов к API
+            rpm: Квота модели (запросов в минуту)
+            max_retries: Сколько раз повторять временные ошибки
+        """
+        self.model = model
+        self.max_concurrency = max_concurrency or GEMINI_MAX_CONCURRENCY
+        self.rpm = rpm or GEMINI_RPM
+        self.max_retries = GEMINI_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = GEMINI_BACKOFF_BASE
+        self.backoff_cap = GEMINI_BACKOFF_CAP
+        self.max_interactive_wait = GEMINI_MAX_INTERACTIVE_WAIT
+        self.breaker_threshold = GEMINI_BREAKER_THRESHOLD
+        self.breaker_reset = GEMINI_BREAKER_RESET
+        self._gate = PriorityGate(self.max_concurrency)
+        self.quotas: Dict[str, ModelQuota] = {}
+
+    def quota(self, model_name: str) -> ModelQuota:
+        """Квота и предохранитель модели (создаются при первом обращении)"""
+        if model_name not in self.quotas:
+            self.quotas[model_name] = ModelQuota(self.rpm, self.breaker_threshold, self.breaker_reset)
+        return self.quotas[model_name]
+
+    def retry_in(self, model=None) -> float:
+        """Через сколько секунд модель снова примет запросы (0 — уже принимает)"""
+        return self.quota(model_name(model or self.model)).breaker.retry_in()
+
+    async def generate(self, prompt: str, priority: int = INTERACTIVE, model=None) -> str:
+        """Сгенерировать ответ и вернуть его текст (см. generate_response)"""
+        return (await self.generate_response(prompt, priority, model=model)).text
+
+    async def generate_response(self, prompt: str, priority: int = INTERACTIVE, model=None,
+                                fallback: bool = False):
+        """
+        Сгенерировать ответ модели (объект ответа с text и usage_metadata)
+
+        Временные ошибки повторяются с задержкой. Интерактивный запрос при
+        открытом предохранителе (или если API просит ждать дольше
+        max_interactive_wait) сразу получает GeminiUnavailable; фоновый
+        ждет, пока API снова начнет принимать запросы.
+
+        Args:
+            model: Модель для запроса (по умолчанию self.model)
+            fallback: Есть запасная модель — не повторять и не ждать, а сразу
+                отдать ошибку, чтобы вызывающий перешел к следующей модели
+        """
+        model = model or self.model
+        quota = self.quota(model_name(model))
+        attempt = 0
+        while True:
+            await self._admit(quota, priority, fallback)
+            try:
+                async with self._gate.slot(priority):
+                    response = await self._generate_content(model, prompt)
+                response.text  # заблокированный ответ бросает исключение уже здесь
+            except Exception as e:
+                await self._handle_failure(quota, e, attempt, priority, fallback)
+                attempt += 1
+            else:
+                quota.record_success()
+                return response
+
+    async def stream_response(self, prompt: str, priority: int = INTERACTIVE, model=None,
+                              fallback: bool = False) -> AsyncIterator:
+        """
+        Потоковый ответ: части ответа модели (с text) по мере генерации
+
+        Повторы и переход на запасную модель возможны только до первой части:
+        начатый ответ уже показан пользователю, ошибка после нее пробрасывается.
+        Модель без generate_content_async отдает ответ одной частью.
+        """
+        model = model or self.model
+        quota = self.quota(model_name(model))
+        attempt = 0
+        while True:
+            await self._admit(quota, priority, fallback)
+            started = False
+            try:
+                async with self._gate.slot(priority):
+                    if not hasattr(model, 'generate_content_async'):
+                        yield await self._generate_content(model, prompt)
+                        started = True
+                    else:
+                        async for chunk in await model.generate_content_async(prompt, stream=True):
+                            started = True
+                            yield chunk
+            except Exception as e:
+                if started:
+                    if is_transient(e):
+                        quota.record_failure(e)
+                    raise
+                await self._handle_failure(quota, e, attempt, priority, fallback)
+                attempt += 1
+            else:
+                quota.record_success()
+                return
+
+    async def _admit(self, quota: ModelQuota, priority: int, fallback: bool):
+        """Дождаться права на запрос: предохранитель и квота модели"""
+        while not quota.breaker.allow():
+            wait = quota.breaker.retry_in()
+            if priority == INTERACTIVE or fallback:
+                quota.rejected += 1
+                raise GeminiUnavailable(wait)
+            await asyncio.sleep(max(wait, 1.0))
+        await quota.acquire(priority)
+
+    async def _handle_failure(self, quota: ModelQuota, error: Exception, attempt: int,
+                              priority: int, fallback: bool):
+        """Пробросить ошибку или подождать перед повтором"""
+        if not is_transient(error):
+            # API ответило (пусть и ошибкой) — на предохранитель это не влияет
+            quota.record_success()
+            raise error
+        quota.record_failure(error)
+        if fallback or attempt >= self.max_retries:
+            raise error
+        delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap, retry_after(error))
+        if priority == INTERACTIVE and delay > self.max_interactive_wait:
+            quota.rejected += 1
+            raise GeminiUnavailable(delay) from error
+        logger.warning(f"⚠️ Gemini: {error.__class__.__name__}, повтор {attempt + 1} через {delay:.1f}с")
+        await asyncio.sleep(delay)
+
+    async def _generate_content(self, model, prompt: str):
+        # Нативный асинхронный вызов есть в google-generativeai >= 0.3
+        if hasattr(model, 'generate_content_async'):
+            return await model.generate_content_async(prompt)
+
+        # Запасной вариант: синхронный вызов в пуле потоков
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, model.generate_content, prompt)
+
+    def stats(self) -> Dict:
+        """Счетчики по моделям и длина очереди"""
+        return {
+            'queued': self._gate.waiting,
+            'models': {name: quota.stats() for name, quota in self.quotas.items()},
+        }
+
+
+def model_name(model) -> str:
+    """Имя модели для учета квоты (genai.GenerativeModel.model_name)"""
+    return getattr(model, 'model_name', None) or type(model).__name__
@@ -0,0 +1,252 @@
+"""
+Кэш горячих данных пользователя
+
+Страницы словаря, карточки слов и статистика читаются намного чаще, чем
+меняются: пользователь листает словарь туда-обратно. HotCache — фасад над
+AsyncDatabase: эти чтения обслуживаются из кэша, а любая запись слов
+пользователя (add_word, delete_word, импорт, повторение) сбрасывает его
+записи. Остальные методы передаются в БД как есть.
+
+Хранилище — LRU по пользователям в памяти процесса с лимитом по объему
+или Redis (REDIS_URL), чтобы несколько реплик бота видели одни и те же
+сбросы.
+"""
+
+import logging
+import pickle
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+from config import HOT_CACHE_MAX_BYTES, HOT_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBackend:
+    """LRU по пользователям: при превышении лимита выбрасывается весь самый давний пользователь"""
+
+    def __init__(self, max_bytes: int, ttl: int):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._users = OrderedDict()  # user_id -> {ключ: (данные, время записи)}
+        self._user_bytes = {}
+        self.size = 0
+
+    async def get(self, user_id: int, key: Hashable) -> Optional[bytes]:
+        entries = self._users.get(user_id)
+        entry = entries.get(key) if entries else None
+        if not entry:
+            return None
+        data, stored_at = entry
+        if time.monotonic() - stored_at >= self.ttl:
+            self._drop(user_id, key)
+            return None
+        self._users.move_to_end(user_id)
+        return data
+
+    async def set(self, user_id: int, key: Hashable, data: bytes):
+        self._drop(user_id, key)
+        self._users.setdefault(user_id, {})[key] = (data, time.monotonic())
+        self._users.move_to_end(user_id)
+        self._user_bytes[user_id] = self._user_bytes.get(user_id, 0) + len(data)
+        self.size += len(data)
+        while self.size > self.max_bytes and len(self._users) > 1:
+            oldest = next(iter(self._users))
+            await self.invalidate(oldest)
+
+    async def invalidate(self, user_id: int):
+        self._users.pop(user_id, None)
+        self.size -= self._user_bytes.pop(user_id, 0)
+
+    async def clear(self):
+        self._users.clear()
+        self._user_bytes.clear()
+        self.size = 0
+
+    def _drop(self, user_id: int, key: Hashable):
+        entries = self._users.get(user_id)
+        if entries and key in entries:
+            size = len(entries.pop(key)[0])
+            self._user_bytes[user_id] -= size
+            self.size -= size
+
+
+class RedisBackend:
+    """
+    Общий кэш в Redis: по хэшу на пользователя, сброс — одним DEL
+
+    Лимит памяти задается на стороне Redis (maxmemory + allkeys-lru).
+    Ошибки Redis не ломают бота: чтение становится промахом.
+    """
+
+    PREFIX = "hot:"
+
+    def __init__(self, client, ttl: int):
+        """
+        Args:
+            client: Асинхронный клиент redis.asyncio.Redis (или совместимый)
+        """
+        self.client = client
+        self.ttl = ttl
+        self.size = None
+
+    async def get(self, user_id: int, key: Hashable) -> Optional[bytes]:
+        try:
+            return await self.client.hget(f"{self.PREFIX}{user_id}", repr(key))
+        except Exception as e:
+            logger.warning(f"Redis недоступен при чтении кэша: {e}")
+            return None
+
+    async def set(self, user_id: int, key: Hashable, data: bytes):
+        name = f"{self.PREFIX}{user_id}"
+        try:
+            await self.client.hset(name, repr(key), data)
+            await self.client.expire(name, self.ttl)
+        except Exception as e:
+            logger.warning(f"Redis недоступен при записи кэша: {e}")
+
+    async def invalidate(self, user_id: int):
+        try:
+            await self.client.delete(f"{self.PREFIX}{user_id}")
+        except Exception as e:
+            # Запись доживет до TTL
+            logger.error(f"Не удалось сбросить кэш пользователя {user_id} в Redis: {e}")
+
+    async def clear(self):
+        try:
+            async for name in self.client.scan_iter(match=f"{self.PREFIX}*"):
+                await self.client.delete(name)
+        except Exception as e:
+            logger.error(f"Не удалось очистить кэш в Redis: {e}")
+
+
+def create_backend(redis_url: str = None, max_bytes: int = None, ttl: int = None):
+    """Redis, если задан redis_url и установлен пакет redis, иначе память процесса"""
+    ttl = ttl or HOT_CACHE_TTL
+    if redis_url:
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            logger.warning("REDIS_URL задан, но пакет redis не установлен (pip install redis) — кэш в памяти процесса")
+        else:
+            return RedisBackend(redis.from_url(redis_url), ttl)
+    return MemoryBackend(max_bytes or HOT_CACHE_MAX_BYTES, ttl)
+
+
+class HotCache:
+    """Фасад над AsyncDatabase с кэшем чтений словаря, карточек слов и статистики"""
+
+    def __init__(self, db, backend=None):
+        """
+        Args:
+            db: Экземпляр AsyncDatabase
+            backend: MemoryBackend или RedisBackend (по умолчанию — create_backend())
+        """
+        self.db = db
+        self.backend = backend or create_backend()
+        # Поколение данных пользователя (и всего кэша): чтение, начатое до записи, не попадет в кэш
+        self._generations = {}
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __getattr__(self, name):
+        # Все остальные методы AsyncDatabase — без кэша
+        return getattr(self.db, name)
+
+    async def _cached(self, user_id: int, key: Hashable, load):
+        data = await self.backend.get(user_id, key)
+        if data is not None:
+            self.hits += 1
+            return pickle.loads(data)
+        self.misses += 1
+        generation = self._generation(user_id)
+        value = await load()
+        if value is not None and self._generation(user_id) == generation:
+            await self.backend.set(user_id, key, pickle.dumps(value))
+        return value
+
+    def _generation(self, user_id: int) -> tuple:
+        return self._epoch, self._generations.get(user_id, 0)
+
+    async def invalidate(self, user_id: int):
+        """Сбросить кэш пользователя (локально и в общем хранилище)"""
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        await self.backend.invalidate(user_id)
+
+    # --- Кэшируемые чтения ---
+
+    async def get_dictionary_data(self, user_id: int, limit: int = 5, offset: int = 0,
+                                  anchor: Tuple[int, int] = None, direction: str = "n") -> Dict:
+        return await self._cached(
+            user_id, ('dict', limit, offset, anchor, direction),
+            lambda: self.db.get_dictionary_data(user_id, limit=limit, offset=offset,
+                                                anchor=anchor, direction=direction)
+        )
+
+    async def get_word_by_id(self, word_id: int, user_id: int = None) -> Optional[Dict]:
+        """
+        Слово по id. Кэшируется, только если передан user_id владельца:
+        в кэше пользователя не бывает чужих слов
+        """
+        if user_id is None:
+            return await self.db.get_word_by_id(word_id)
+
+        async def load():
+            word = await self.db.get_word_by_id(word_id)
+            return word if word and word['user_id'] == user_id else None
+
+        return await self._cached(user_id, ('word', word_id), load)
+
+    async def get_user_stats(self, user_id: int) -> Dict:
+        return await self._cached(user_id, ('stats',), lambda: self.db.get_user_stats(user_id))
+
+    # --- Записи: сначала БД, затем сброс кэша пользователя ---
+
+    async def add_word(self, user_id: int, *args, **kwargs):
+        try:
+            return await self.db.add_word(user_id, *args, **kwargs)
+        finally:
+            await self.invalidate(user_id)
+
+    async def add_words_bulk(self, user_id: int, items):
+        try:
+            return await self.db.add_words_bulk(user_id, items)
+        finally:
+            await self.invalidate(user_id)
+
+    async def delete_word(self, word_id: int, user_id: int):
+        try:
+            return await self.db.delete_word(word_id, user_id)
+        finally:
+            await self.invalidate(user_id)
+
+    async def review_word(self, word_id: int, user_id: int, grade: int):
+        try:
+            return await self.db.review_word(word_id, user_id, grade)
+        finally:
+            await self.invalidate(user_id)
+
+    async def update_last_reviewed(self, word_id: int):
+        word = await self.db.get_word_by_id(word_id)
+        await self.db.update_last_reviewed(word_id)
+        if word:
+            await self.invalidate(word['user_id'])
+
+    async def rebuild_user_stats(self, *args, **kwargs):
+        try:
+            return await self.db.rebuild_user_stats(*args, **kwargs)
+        finally:
+            self._epoch += 1
+            await self.backend.clear()
+
+    def stats(self) -> Dict:
+        """Счетчики попаданий/промахов и занятая память (для Redis — None)"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'memory_bytes': self.backend.size,
+        }
@@ -0,0 +1,237 @@
+"""
+Массовый импорт слов из файла
+
+Файл читается потоково (.txt — слово на строку, .csv — слово и необязательное
+определение). Слова, которые уже есть в словаре, отсеиваются одним запросом
+на пачку, объяснения запрашиваются у Gemini пакетами с ограниченной
+параллельностью, а запись идет одной транзакцией на пачку.
+
+Запуск из консоли: python importer.py USER_ID ФАЙЛ [DATABASE_URL]
+"""
+
+import asyncio
+import csv
+import html
+import logging
+from itertools import chain, islice
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config import IMPORT_MAX_WORDS, IMPORT_BATCH_SIZE, IMPORT_CONCURRENCY, IMPORT_CHUNK_SIZE
+from database import word_key
+from markdown_converter import md_to_telegram_html
+from resilience import BACKGROUND
+from suggestions import WORD_FORMAT_INSTRUCTIONS, extract_json
+
+logger = logging.getLogger(__name__)
+
+# Заголовки первой колонки CSV, которые не считаются словами
+HEADER_WORDS = {"word", "слово", "слова", "термин"}
+# Длиннее — это уже не слово, а предложение (как в handle_word)
+MAX_WORD_PARTS = 3
+
+# progress(stats) вызывается после каждой записанной пачки
+Progress = Callable[[Dict], Awaitable[None]]
+
+
+def read_rows(lines: Iterable[str], csv_format: bool = False) -> Iterator[Tuple[str, Optional[str]]]:
+    """
+    Разобрать строки файла в пары (word, definition или None)
+
+    Пустые строки, комментарии (#), заголовок, слишком длинные фразы и
+    повторы внутри файла пропускаются. Определение из CSV экранируется для HTML.
+    """
+    if csv_format:
+        lines = iter(lines)
+        first = next(lines, "")
+        # Excel с русской локалью сохраняет CSV через ";"
+        delimiter = ";" if first.count(";") > first.count(",") else ","
+        rows = csv.reader(chain([first], lines), delimiter=delimiter)
+    else:
+        rows = ([line] for line in lines)
+
+    seen = set()
+    for row in rows:
+        if not row:
+            continue
+        word = " ".join(row[0].split())
+        key = word_key(word)
+        if not word or word.startswith("#") or key in HEADER_WORDS or key in seen:
+            continue
+        if len(word.split()) > MAX_WORD_PARTS:
+            continue
+        seen.add(key)
+        definition = row[1].strip() if len(row) > 1 else ""
+        yield word, html.escape(definition) if definition else None
+
+
+def build_explanations_prompt(words: List[str]) -> str:
+    """Один запрос к Gemini на несколько слов"""
+    words_text = "\n".join(f"{i}. {word}" for i, word in enumerate(words, 1))
+    return f"""Ты - эксперт по русскому языку.
+Объясни КАЖДОЕ слово или фразу из списка.
+
+СЛОВА:
+{words_text}
+
+{WORD_FORMAT_INSTRUCTIONS}
+
+ВЕРНИ ОТВЕТ ТОЛЬКО В JSON-массиве, по одному объекту на слово (слово пиши как в списке):
+[
+    {{"word": "слово", "explanation": "Текст объяснения в формате Markdown"}}
+]"""
+
+
+def parse_explanations(data, words: List[str]) -> Dict[str, str]:
+    """
+    Проверить пакетный ответ модели
+
+    Returns:
+        {слово из запроса: объяснение в Markdown} — только для слов из запроса
+    """
+    by_key = {word_key(word): word for word in words}
+    result = {}
+    if not isinstance(data, list):
+        return result
+    for entry in data:
+        if not isinstance(entry, dict):
+            continue
+        word, explanation = entry.get('word'), entry.get('explanation')
+        if not isinstance(word, str) or not isinstance(explanation, str) or not explanation.strip():
+            continue
+        original = by_key.get(word_key(word))
+        if original and original not in result:
+            result[original] = explanation
+    return result
+
+
+class WordImporter:
+    """Потоковый импорт слов с пакетными объяснениями от Gemini"""
+
+    def __init__(self, db, gemini, cache=None, max_words: int = None, batch_size: int = None,
+                 concurrency: int = None, chunk_size: int = None):
+        """
+        Args:
+            db: Экземпляр AsyncDatabase
+            gemini: Экземпляр GeminiClient
+            cache: ExplanationCache (необязательно) — уже объясненные слова не тратят квоту
+            max_words: Максимум слов за один импорт
+            batch_size: Слов в одном запросе к Gemini
+            concurrency: Одновременных запросов к Gemini от одного импорта
+            chunk_size: Строк в одной транзакции записи
+        """
+        self.db = db
+        self.gemini = gemini
+        self.cache = cache
+        self.max_words = max_words or IMPORT_MAX_WORDS
+        self.batch_size = batch_size or IMPORT_BATCH_SIZE
+        self.chunk_size = chunk_size or IMPORT_CHUNK_SIZE
+        self._semaphore = asyncio.Semaphore(concurrency or IMPORT_CONCURRENCY)
+
+    async def run(self, user_id: int, rows: Iterable[Tuple[str, Optional[str]]],
+                  progress: Progress = None) -> Dict:
+        """
+        Импортировать слова
+
+        Args:
+            rows: Пары (word, definition или None), например из read_rows
+            progress: Корутина, получающая статистику после каждой пачки
+
+        Returns:
+            Статистика: processed, added, existing, failed, truncated
+        """
+        stats = {'processed': 0, 'added': 0, 'existing': 0, 'failed': 0, 'truncated': False}
+        rows = iter(rows)
+
+        while stats['processed'] < self.max_words:
+            chunk = list(islice(rows, min(self.chunk_size, self.max_words - stats['processed'])))
+            if not chunk:
+                break
+            stats['processed'] += len(chunk)
+
+            existing = await self.db.get_existing_word_keys(user_id, [word for word, _ in chunk])
+            chunk = [(word, definition) for word, definition in chunk if word_key(word) not in existing]
+            stats['existing'] += len(existing)
+
+            explanations = await self.explain([word for word, definition in chunk if not definition])
+            items = []
+            for word, definition in chunk:
+                definition = definition or explanations.get(word)
+                if definition:
+                    items.append((word, definition))
+                else:
+                    stats['failed'] += 1
+
+            stats['added'] += await self.db.add_words_bulk(user_id, items)
+            if progress:
+                await progress(dict(stats))
+
+        stats['truncated'] = next(rows, None) is not None
+        return stats
+
+    async def explain(self, words: List[str]) -> Dict[str, str]:
+        """Объяснения для слов: сначала из кэша, остальное — пакетами у Gemini"""
+        result = {}
+        if self.cache:
+            for word in words:
+                cached = await self.cache.get(word)
+                if cached:
+                    result[word] = cached[1]
+        missing = [word for word in words if word not in result]
+
+        batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+        for explained in await asyncio.gather(*(self._explain_batch(batch) for batch in batches)):
+            result.update(explained)
+        return result
+
+    async def _explain_batch(self, words: List[str]) -> Dict[str, str]:
+        async with self._semaphore:
+            try:
+                data = extract_json(await self.gemini.generate(build_explanations_prompt(words), priority=BACKGROUND))
+            except Exception as e:
+                logger.error(f"Ошибка пакетного объяснения {len(words)} слов: {e}")
+                return {}
+
+        result = {}
+        for word, explanation in parse_explanations(data, words).items():
+            result[word] = md_to_telegram_html(explanation)
+            if self.cache:
+                await self.cache.put(word, word, result[word])
+        return result
+
+
+def open_rows(path: str) -> Iterator[Tuple[str, Optional[str]]]:
+    """Потоково прочитать файл импорта (.csv или текст)"""
+    with open(path, encoding="utf-8-sig", errors="replace") as f:
+        yield from read_rows(f, csv_format=path.lower().endswith(".csv"))
+
+
+if __name__ == "__main__":
+    import os
+    import sys
+
+    import google.generativeai as genai
+
+    from async_database import AsyncDatabase
+    from database import Database
+    from gemini_client import GeminiClient
+
+    logging.basicConfig(level=logging.INFO)
+
+    if len(sys.argv) < 3:
+        print("Использование: python importer.py USER_ID ФАЙЛ [DATABASE_URL]")
+        sys.exit(1)
+
+    user_id, path = int(sys.argv[1]), sys.argv[2]
+    db = AsyncDatabase(Database(sys.argv[3] if len(sys.argv) > 3 else os.getenv('DATABASE_URL')))
+    genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+    importer = WordImporter(db, GeminiClient(genai.GenerativeModel('gemini-2.0-flash')))
+
+    async def report(stats: Dict):
+        print(f"Обработано {stats['processed']}, добавлено {stats['added']}, "
+              f"уже было {stats['existing']}, без объяснения {stats['failed']}")
+
+    try:
+        result = asyncio.run(importer.run(user_id, open_rows(path), progress=report))
+        print(f"✅ Импорт завершен: {result}")
+    finally:
+        db.shutdown()
@@ -1,8 +1,12 @@
 import os
+import html
 import logging
 import asyncio
 import json
 import random
+import tempfile
+from functools import partial
+from typing import Tuple
 from datetime import datetime, time, timezone
 from aiohttp import web
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
@@ -15,10 +19,36 @@ from telegram.ext import (
     ContextTypes,
 )
 from telegram.constants import ParseMode
+from telegram.error import Forbidden, RetryAfter
 import google.generativeai as genai
 from database import Database
-from config import check_environment
-from markdown_converter import md_to_telegram_html
+from async_database import AsyncDatabase
+from hot_cache import HotCache, create_backend
+from config import (
+    check_environment,
+    BROADCAST_BATCH_SIZE,
+    WORD_POOL_REFILL_INTERVAL,
+    REVIEW_REMINDER_HOUR,
+    REVIEW_MIN_DUE,
+    REDIS_URL,
+    STATE_CLEANUP_INTERVAL,
+    GEMINI_STREAMING,
+)
+from gemini_client import GeminiClient
+from model_router import ModelRouter
+from check_models import probe_models
+from resilience import BACKGROUND, INTERACTIVE, GeminiUnavailable
+from explanation_cache import ExplanationCache, normalize_key
+from single_flight import SingleFlight
+from state_store import SAVE_CALLBACK_PREFIX, StateStore
+from broadcast import BroadcastEngine
+from suggestions import THEMES, WORD_FORMAT_INSTRUCTIONS, exclusion_list, extract_json, parse_suggestion_batch
+from word_pool import WordPool
+from srs import GRADE_LABELS, format_delay
+from importer import WordImporter, open_rows
+from exporter import FORMATS, ExportError, available_formats, export_words
+from markdown_converter import md_to_telegram_html, split_message
+from streaming import ProgressiveMessage, completed_part, partial_json_string
 
 # Настройка логирования
 logging.basicConfig(
@@ -31,15 +61,62 @@ logger = logging.getLogger(__name__)
 if not check_environment():
     exit(1)
 
-# Инициализация
-db = Database(os.getenv('DATABASE_URL'))
+# Инициализация (запросы к БД выполняются в пуле потоков, не блокируя цикл событий).
+# Страницы словаря, карточки и статистика кэшируются; записи слов сбрасывают кэш пользователя
+db = HotCache(AsyncDatabase(Database(os.getenv('DATABASE_URL'))), create_backend(REDIS_URL))
 
 # Конфигурация Gemini
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 # Инициализация Gemini
 genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
-model = genai.GenerativeModel('gemini-2.0-flash')
+# Все вызовы моделей идут через асинхронный клиент (не блокируют цикл событий)
+gemini = GeminiClient()
+# Задачи распределяются по моделям: дешевые — в легкую, объяснения — в сильную
+router = ModelRouter(gemini, genai.GenerativeModel)
+# Общий кэш объяснений (повторные слова не тратят квоту API)
+explanation_cache = ExplanationCache(db)
+# Одновременные запросы одного слова ждут один вызов Gemini
+explanation_flights = SingleFlight()
+# Предложенные слова за кнопками "Сохранить" (токен в callback_data, с временем жизни)
+state = StateStore(db)
+# Импорт слов из файла (/import): объяснения пакетами, запись пачками
+importer = WordImporter(db, router.route('import'), cache=explanation_cache)
+# Пользователи, у которых сейчас идет импорт (не больше одного на человека)
+active_imports = set()
+# Как часто обновлять сообщение с прогрессом импорта (секунды)
+IMPORT_PROGRESS_INTERVAL = 3
+# Рассылка слов дня подписчикам (параллельно, в рамках квот Gemini и Telegram)
+broadcast = BroadcastEngine()
+
+
+async def send_long_message(send, text: str, reply_markup=None):
+    """
+    Отправить HTML, нарезанный под лимит Telegram
+
+    send — функция отправки (reply_text или partial от send_message);
+    клавиатура прикрепляется к последней части.
+    """
+    chunks = split_message(text)
+    for chunk in chunks[:-1]:
+        await send_with_retry(send, text=chunk, parse_mode=ParseMode.HTML)
+    await send_with_retry(send, text=chunks[-1], reply_markup=reply_markup, parse_mode=ParseMode.HTML)
+
+
+async def send_with_retry(send, attempts: int = 2, **kwargs):
+    """
+    Отправить одну часть; на RetryAfter подождать и повторить только ее
+
+    Уже доставленные части длинного сообщения повторно не отправляются.
+    """
+    for attempt in range(attempts):
+        try:
+            return await send(**kwargs)
+        except RetryAfter as e:
+            if attempt == attempts - 1:
+                raise
+            # Telegram просит подождать — ждем и пробуем еще раз
+            await asyncio.sleep(e.retry_after)
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -63,6 +140,10 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /dictionary - 📚 Мой словарь
 /random - ✨ Новое умное слово
 /stats - 📊 Статистика
+/search - 🔍 Поиск по словарю
+/review - 🧠 Повторение слов
+/import - 📥 Импорт слов из файла
+/export - 📦 Выгрузить словарь
 /subscribe - 🔔 Включить умные слова
 /unsubscribe - 🔕 Выключить умные слова
 /help - ℹ️ Помощь
@@ -83,6 +164,10 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /dictionary - Посмотреть все сохраненные слова
 /random - Получить новое умное слово от AI ✨
 /stats - Твоя статистика 📊
+/search слово - Поиск по твоему словарю 🔍
+/review - Повторить слова, которые пора вспомнить 🧠
+/import - Загрузить слова из .txt или .csv файла 📥
+/export - Выгрузить словарь в CSV, Excel или Anki 📦
 /subscribe - Включить ежедневную рассылку новых слов 🔔
 /unsubscribe - Выключить рассылку 🔕
 /help - Эта справка ℹ️
@@ -94,36 +179,74 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(help_text, parse_mode=ParseMode.HTML)
 
 
-# Единый формат объяснения для AI
-WORD_FORMAT_INSTRUCTIONS = """
-СТРОГИЕ ПРАВИЛА ФОРМАТИРОВАНИЯ ЭКСПЛАНАЦИИ:
-- Используй Markdown (**, *, `).
-- Каждый заголовок раздела начинай с эмодзи.
-- Пункты отмечай точкой •.
-- НЕ пиши приветствий и прощаний.
-
-СТРУКТУРА ОБЪЯСНЕНИЯ (СТРОГО СОБЛЮДАЙ ПОРЯДОК И ЭМОДЗИ):
-**📝 Краткое определение:**
-(твой текст)
-
-**🔍 Контекст использования:**
-• (твой текст)
-
-**💬 Примеры предложений:**
-• (твой текст)
+async def get_word_explanation(word: str, on_progress=None) -> tuple[str, str]:
+    """
+    Получить объяснение слова от Gemini с нормализацией формы
 
-**🔄 Синонимы:**
-• (твой текст)
+    on_progress(слово, markdown) получает готовое начало объяснения, пока оно генерируется
+    """
+    cached = await explanation_cache.get(word)
+    if cached:
+        return cached
+    # Если это слово уже запрашивается другим пользователем — ждем тот же ответ
+    # (и нормализация, и объяснение — один раз на слово)
+    return await explanation_flights.run(
+        ('word', normalize_key(word)), lambda: resolve_word_explanation(word, on_progress)
+    )
 
-**🧠 Происхождение слова:**
-(твой текст)
 
-**💡 Интересный факт:**
-(твой текст)
-"""
+async def resolve_word_explanation(word: str, on_progress=None) -> tuple[str, str]:
+    """
+    Промах кэша: объяснение сильной моделью запрашивается сразу, а легкая
+    модель параллельно ищет начальную форму слова (опечатка или другая форма
+    уже объясненного слова). Ее ответ используется, только если пришел раньше
+    первой части объяснения: тогда объяснение берется из кэша, а запрос отменяется
+    """
+    started = asyncio.Event()
+    explain = asyncio.create_task(fetch_word_explanation(word, on_progress, started))
+    normalize = asyncio.create_task(normalize_word(word))
+    first_part = asyncio.create_task(started.wait())
+    try:
+        await asyncio.wait({explain, normalize, first_part}, return_when=asyncio.FIRST_COMPLETED)
+        if normalize.done() and not started.is_set():
+            normalized = normalize.result()
+            if normalize_key(normalized) != normalize_key(word):
+                cached = await explanation_cache.get(normalized)
+                if cached and not started.is_set():
+                    explain.cancel()
+                    await explanation_cache.put(word, *cached)
+                    return cached
+        # Объяснение уже идет (или сработал кэш) — в кэш его положит fetch_word_explanation
+        # под ключами и запроса, и normalized_word из ответа
+        return await explain
+    except asyncio.CancelledError:
+        explain.cancel()
+        raise
+    finally:
+        normalize.cancel()
+        first_part.cancel()
+
+
+async def normalize_word(word: str) -> str:
+    """Исправить опечатку и привести слово к начальной форме (легкая модель, быстрый путь)"""
+    prompt = f"""Исправь орфографические ошибки в слове или фразе "{word}" и приведи к начальной форме
+(именительный падеж, единственное число, инфинитив для глаголов).
+Верни ТОЛЬКО исправленное слово или фразу, без пояснений и кавычек."""
+    try:
+        text = (await router.generate('normalize', prompt)).strip().strip('"«»').strip()
+    except Exception as e:
+        logger.warning(f"Не удалось нормализовать «{word}»: {e}")
+        return word
+    # Модель ответила не словом, а текстом — не доверяем
+    return text if text and len(text.split()) <= 3 and "\n" not in text else word
+
+
+async def fetch_word_explanation(word: str, on_progress=None, started: asyncio.Event = None) -> tuple[str, str]:
+    """
+    Запрос объяснения у Gemini (потоком, если есть on_progress) и запись в кэш
 
-async def get_word_explanation(word: str) -> tuple[str, str]:
-    """Получить объяснение слова от Gemini с нормализацией формы"""
+    started выставляется, как только получена первая часть ответа
+    """
     prompt = f"""Ты - эксперт по русскому языку. 
 Твоя задача: проанализировать слово или фразу "{word}" и вернуть ответ СТРОГО в формате JSON.
 
@@ -140,67 +263,54 @@ async def get_word_explanation(word: str) -> tuple[str, str]:
     "explanation": "Текст объяснения в формате Markdown"
 }}"""
 
-    # Сначалапробуем Gemini
-    retry_delays = [10, 20, 30]
-    for attempt, delay in enumerate(retry_delays + [0]):
-        try:
-            response = model.generate_content(prompt)
-            text = response.text
-            
-            # Очистка от markdown блоков json
-            if text.startswith("```json"):
-                text = text.replace("```json", "").replace("```", "")
-            elif text.startswith("```"):
-                text = text.replace("```", "")
-                
-            data = json.loads(text.strip())
-            norm_word = data.get('normalized_word', word)
-            explanation_html = md_to_telegram_html(data.get('explanation', "Ошибка получения объяснения"))
-            
-            return norm_word, explanation_html
-            
-        except Exception as e:
-            error_msg = str(e)
-            if ("429" in error_msg or "Resource exhausted" in error_msg) and attempt < len(retry_delays):
-                wait_time = retry_delays[attempt]
-                logger.warning(f"⚠️ Gemini API 429, ждем {wait_time}с... (Попытка {attempt + 1})")
-                await asyncio.sleep(wait_time)
-                continue
+    # Повторы при 429 и перегрузке делает GeminiClient
+    try:
+        if on_progress and GEMINI_STREAMING:
+            # Показываем начало объяснения, не дожидаясь конца JSON
+            text = ""
+            async for part in router.stream('explain', prompt):
+                if started:
+                    started.set()
+                text += part
+                norm_word, word_done = partial_json_string(text, 'normalized_word')
+                if word_done:
+                    markdown, _ = partial_json_string(text, 'explanation')
+                    await on_progress(norm_word, markdown or "")
+        else:
+            text = await router.generate('explain', prompt)
+            if started:
+                started.set()
+        
+        # Очистка от markdown блоков json
+        if text.startswith("```json"):
+            text = text.replace("```json", "").replace("```", "")
+        elif text.startswith("```"):
+            text = text.replace("```", "")
             
-            logger.error(f"Ошибка Gemini API: {e}")
-            break
+        data = json.loads(text.strip())
+        norm_word = data.get('normalized_word', word)
+        explanation_html = md_to_telegram_html(data.get('explanation', "Ошибка получения объяснения"))
+        
+        await explanation_cache.put(word, norm_word, explanation_html)
+        return norm_word, explanation_html
+        
+    except GeminiUnavailable as e:
+        logger.warning(f"⚠️ {e}")
+    except Exception as e:
+        logger.error(f"Ошибка Gemini API: {e}")
 
     # Если всё упало
     return word, "ERROR_FALLBACK"
 
 
-async def get_smart_word_suggestion(existing_words: list, exclude_words: list = None) -> tuple[str, str] | None:
+async def get_smart_word_suggestion(existing_words: list, exclude_words: list = None,
+                                    priority: int = INTERACTIVE) -> tuple[str, str] | None:
     """Генерация умного слова на основе контекста с защитой от повторений"""
     # Собираем список всех слов, которые нужно исключить
-    context_words = [w['word'].lower() for w in existing_words] if existing_words else []
-    if exclude_words:
-        context_words.extend([w.lower() for w in exclude_words])
-    
-    # Список клише "умных слов", которые часто предлагает AI по умолчанию
-    cliche_words = [
-        "эмпатия", "амбивалентность", "анамнез", "апроприация", "когнитивный", 
-        "интроспекция", "экзистенциальный", "парадигма", "дихотомия", "абстрактный",
-        "апробация", "рефлексия", "трансцендентный", "паллиатив", "эвфемизм"
-    ]
-    
-    # Если словарь пуст, используем расширенный список клише как "уже известные", чтобы форсить новизну
-    if not context_words:
-        context_text = ", ".join(cliche_words)
-    else:
-        context_text = ", ".join(context_words)
+    context_text = ", ".join(exclusion_list(existing_words, exclude_words))
     
     # Фактор случайности: выбираем случайную область знаний
-    themes = [
-        "Философия и логика", "Психология и нейронауки", "Социология и культура", 
-        "Лингвистика и литература", "Экономика и право", "Искусство и архитектура",
-        "Естественные науки", "Технологии и инновации", "Политология"
-    ]
-    random_theme = random.choice(themes)
+    random_theme = random.choice(THEMES)
     random_seed = f"{datetime.now().strftime('%H:%M:%S')}-{random.randint(1, 1000)}"
     
     prompt = f"""
@@ -221,79 +331,205 @@ async def get_smart_word_suggestion(existing_words: list, exclude_words: list =
     }}
     """
     
-    # Ретраи с экспоненциальной задержкой
-    retry_delays = [10, 20, 30]
-    
-    for attempt, delay in enumerate(retry_delays + [0]):
-        try:
-            response = model.generate_content(prompt)
-            text = response.text
-            # Очистка от markdown блоков json
-            if "```json" in text:
-                text = text.split("```json")[1].split("```")[0]
-            elif "```" in text:
-                text = text.split("```")[1].split("```")[0]
-                
-            data = json.loads(text.strip())
-            return data['word'], md_to_telegram_html(data['explanation'])
-        except Exception as e:
-            error_msg = str(e)
-            if ("429" in error_msg or "Resource exhausted" in error_msg) and attempt < len(retry_delays):
-                wait_time = retry_delays[attempt]
-                logger.warning(f"⚠️ API 429 при генерации предложения, ждем {wait_time}с... (Попытка {attempt + 1})")
-                await asyncio.sleep(wait_time)
-                continue
-                
-            logger.error(f"Ошибка генерации умного слова: {e}")
-            break
-            
+    # Повторы при 429 и перегрузке делает GeminiClient
+    try:
+        data = extract_json(await router.generate('suggest', prompt, priority))
+        return data['word'], md_to_telegram_html(data['explanation'])
+    except Exception as e:
+        logger.error(f"Ошибка генерации умного слова: {e}")
     return None
 
 
+async def get_smart_word_suggestions_batch(contexts: list, themes: list = None) -> list:
+    """
+    Пакетная генерация: одно обращение к Gemini на несколько пользователей
+    
+    Args:
+        contexts: Списки слов пользователей (как get_word_briefs) — по одному на пользователя
+        themes: Темы для каждого пользователя (по умолчанию случайные)
+    
+    Returns:
+        Список (word, explanation_html) или None для пользователей, которым слово не досталось
+    """
+    exclusions = [exclusion_list(words) for words in contexts]
+    themes = themes or [random.choice(THEMES) for _ in contexts]
+    users_text = "\n".join(
+        f"Пользователь {i}: область «{theme}»; исключи слова: {', '.join(excluded)}"
+        for i, (excluded, theme) in enumerate(zip(exclusions, themes), 1)
+    )
+    random_seed = f"{datetime.now().strftime('%H:%M:%S')}-{random.randint(1, 1000)}"
+    
+    prompt = f"""
+    Ты - эксперт по русскому языку и эрудит. Твоя задача: предложить КАЖДОМУ пользователю из списка одно интересное, "умное", книжное или малоизвестное слово.
+    
+    ПОЛЬЗОВАТЕЛИ:
+    {users_text}
+    
+    УСЛОВИЯ:
+    1. Каждому пользователю — свое слово, не входящее в его список исключений.
+    2. БУДЬ ОРИГИНАЛЬНЫМ. Не предлагай самые затертые "умные" слова вроде "эмпатия" или "апробация".
+    3. Сделай акцент на области, указанной для пользователя.
+    4. Случайное число для генерации: {random_seed}.
+    
+    {WORD_FORMAT_INSTRUCTIONS}
+    
+    Ответ верни СТРОГО в формате JSON-массива, по одному объекту на пользователя:
+    [
+        {{"user": 1, "word": "СЛОВО", "explanation": "Текст объяснения в формате Markdown"}}
+    ]
+    """
+    
+    try:
+        results = parse_suggestion_batch(extract_json(await router.generate('suggest_batch', prompt, BACKGROUND)), exclusions)
+    except Exception as e:
+        logger.error(f"Ошибка пакетной генерации слов: {e}")
+        results = [None] * len(contexts)
+    
+    return [(item[0], md_to_telegram_html(item[1])) if item else None for item in results]
+
+
+async def generate_pool_words(theme: str, count: int, existing_words: list) -> list:
+    """Сгенерировать слова для пула темы (один пакетный запрос к Gemini)"""
+    await broadcast.gemini.acquire()
+    contexts = [[{'word': w} for w in existing_words]] * count
+    results = await get_smart_word_suggestions_batch(contexts, themes=[theme] * count)
+    return [item for item in results if item]
+
+
+# Пул готовых слов для /random и рассылки
+word_pool = WordPool(db, generate_pool_words)
+
+
+async def word_pool_refill_job(context: ContextTypes.DEFAULT_TYPE):
+    """Фоновое пополнение пула слов"""
+    try:
+        await word_pool.refill()
+    except Exception as e:
+        logger.error(f"Ошибка пополнения пула слов: {e}")
+
+
 async def daily_word_job(context: ContextTypes.DEFAULT_TYPE):
     """Задача рассылки ежедневных слов"""
-    users = db.get_subscribed_users()
+    if broadcast.running:
+        logger.warning("⏭ Предыдущая рассылка еще идет, пропускаем слот")
+        return
     
-    for user_id in users:
-        try:
-            # Берем последние 20 слов для контекста
-            words = db.get_user_words(user_id, limit=20)
-            
-            suggestion = await get_smart_word_suggestion(words)
+    users = await db.get_subscribed_users()
+    # Слова генерируются пачками: один запрос к Gemini на BROADCAST_BATCH_SIZE пользователей
+    batches = [users[i:i + BROADCAST_BATCH_SIZE] for i in range(0, len(users), BROADCAST_BATCH_SIZE)]
+    
+    async def send_word(user_id: int, words: list, suggestion):
+        if not suggestion:
+            # Элемент пакета не прошел проверку — генерируем слово отдельно
+            await broadcast.gemini.acquire()
+            suggestion = await get_smart_word_suggestion(words, priority=BACKGROUND)
             if not suggestion:
-                continue
-                
-            word, explanation = suggestion
-            
-            # Сохраняем данные в кэш БД (решает проблему mappingproxy)
-            db.save_pending_suggestion(user_id, word, explanation)
-            
-            # Кнопка сохранения
-            keyboard = [[InlineKeyboardButton("💾 Сохранить в словарь", callback_data="save_word")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+                raise RuntimeError("Gemini не вернул слово")
             
+        word, explanation = suggestion
+        
+        # Кнопка сохранения со своим токеном: слово берется из хранилища состояния
+        save_data = await state.put_suggestion(word, explanation)
+        keyboard = [[InlineKeyboardButton("💾 Сохранить в словарь", callback_data=save_data)]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        text = f"🔔 <b>Слово дня</b>\n\n📖 <b>{word.upper()}</b>\n\n{explanation}"
+        
+        send = partial(context.bot.send_message, chat_id=user_id)
+        await broadcast.telegram.acquire()
+        try:
+            # RetryAfter повторяется внутри по частям
+            await send_long_message(send, text, reply_markup)
+        except Forbidden:
+            # Бот заблокирован пользователем — отписываем его
+            await db.subscribe_user(user_id, False)
+            raise
+    
+    async def deliver(batch: list):
+        # Берем последние 20 слов каждого пользователя для контекста
+        contexts = await asyncio.gather(*(db.get_word_briefs(user_id, limit=20) for user_id in batch))
+        
+        # Сначала раздаем готовые слова из пула, генерируем только недостающие
+        suggestions = list(await asyncio.gather(*(word_pool.draw(user_id) for user_id in batch)))
+        missing = [i for i, suggestion in enumerate(suggestions) if not suggestion]
+        if missing:
+            await broadcast.gemini.acquire()
+            generated = await get_smart_word_suggestions_batch([contexts[i] for i in missing])
+            for i, suggestion in zip(missing, generated):
+                suggestions[i] = suggestion
+        
+        results = await asyncio.gather(
+            *(send_word(user_id, words, suggestion) for user_id, words, suggestion in zip(batch, contexts, suggestions)),
+            return_exceptions=True
+        )
+        errors = [(user_id, e) for user_id, e in zip(batch, results) if isinstance(e, Exception)]
+        for user_id, e in errors:
+            logger.error(f"Ошибка отправки слова юзеру {user_id}: {e}")
+        # Статистика по пользователям, а не по пачкам
+        return len(batch) - len(errors), len(errors)
+    
+    stats = await broadcast.run(batches, deliver)
+    logger.info(f"📬 Рассылка завершена ({len(users)} подписчиков, пачки по {BROADCAST_BATCH_SIZE}): {stats}")
+
+
+async def review_reminder_job(context: ContextTypes.DEFAULT_TYPE):
+    """Напомнить подписчикам о словах, которые пора повторить"""
+    if broadcast.running:
+        logger.warning("⏭ Идет рассылка, напоминание о повторении пропущено")
+        return
+    
+    # Один запрос на всех: кто из подписчиков накопил слова к повторению
+    due_users = await db.get_users_with_due_words(min_due=REVIEW_MIN_DUE)
+    keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("🧠 Повторить", callback_data="review_start")]])
+    
+    async def remind(row: dict):
+        await broadcast.telegram.acquire()
+        try:
             await context.bot.send_message(
-                chat_id=user_id,
-                text=f"🔔 <b>Слово дня</b>\n\n📖 <b>{word.upper()}</b>\n\n{explanation}",
-                reply_markup=reply_markup,
+                chat_id=row['user_id'],
+                text=f"🧠 Пора повторить слова: <b>{row['due']}</b> ждут тебя.",
+                reply_markup=keyboard,
                 parse_mode=ParseMode.HTML
             )
-            # Небольшая пауза между пользователями, чтобы не спамить API слишком быстро
-            await asyncio.sleep(2)
-            
-        except Exception as e:
-            logger.error(f"Ошибка отправки слова юзеру {user_id}: {e}")
-            # Если бот заблокирован пользователем, можно отписать его
-            if "Forbidden" in str(e):
-                db.subscribe_user(user_id, False)
+        except Forbidden:
+            await db.subscribe_user(row['user_id'], False)
+            raise
+    
+    stats = await broadcast.run(due_users, remind)
+    logger.info(f"🧠 Напоминания о повторении: {stats}")
+
+
+async def state_cleanup_job(context: ContextTypes.DEFAULT_TYPE):
+    """Удаление истекших кнопок "Сохранить" и прочего временного состояния"""
+    deleted = await state.purge()
+    logger.info(f"🧹 Временное состояние: удалено {deleted} истекших записей")
+
+
+async def cache_cleanup_job(context: ContextTypes.DEFAULT_TYPE):
+    """Очистка устаревших записей кэша объяснений"""
+    deleted = await explanation_cache.purge()
+    logger.info(f"🧹 Кэш объяснений: удалено {deleted} устаревших записей, статистика: {explanation_cache.stats()}")
+    logger.info(f"🔥 Кэш словарей: {db.stats()}")
+    logger.info(f"🤝 Объединение одинаковых запросов: {explanation_flights.stats()}")
+    logger.info(f"🛡 Квоты Gemini: {gemini.stats()}")
+    logger.info(f"🧭 Маршруты моделей: {router.stats()}")
 
 
 async def post_init(application: Application):
-    """Установка команд бота при запуске"""
+    """Установка команд бота и проверка доступных моделей при запуске"""
+    # Список моделей ключа (кэш на диске, к API — раз в MODEL_PROBE_TTL)
+    models = await asyncio.get_running_loop().run_in_executor(None, probe_models, GEMINI_API_KEY)
+    router.set_available(models)
+    logger.info(f"🧭 Модели Gemini: {', '.join(models) if models else 'список недоступен'}; "
+                f"объяснения — {router.chain('explain')}, нормализация — {router.chain('normalize')}")
+    
     await application.bot.set_my_commands([
         ("dictionary", "📚 Мой словарь"),
         ("random", "✨ Новое слово"),
         ("stats", "📊 Статистика"),
+        ("search", "🔍 Поиск по словарю"),
+        ("review", "🧠 Повторение слов"),
+        ("import", "📥 Импорт слов из файла"),
+        ("export", "📦 Выгрузить словарь"),
         ("subscribe", "🔔 Включить умные слова"),
         ("unsubscribe", "🔕 Выключить умные слова"),
         ("help", "ℹ️ Помощь"),
@@ -319,7 +555,7 @@ async def handle_word(update: Update, context: ContextTypes.DEFAULT_TYPE, word:
         return
     
     # Гарантируем, что пользователь есть в базе (важно для Postgres)
-    db.add_user(user_id, update.effective_user.username, update.effective_user.first_name)
+    await db.add_user(user_id, update.effective_user.username, update.effective_user.first_name)
     
     # Показываем индикатор печати (в сообщении или в колбэке)
     if update.message:
@@ -327,8 +563,18 @@ async def handle_word(update: Update, context: ContextTypes.DEFAULT_TYPE, word:
     elif update.callback_query:
         await update.callback_query.message.chat.send_chat_action("typing")
     
+    # Ответ дописывается в одно сообщение по мере генерации
+    # (для ретрая — новое сообщение под кнопкой, так проще и понятнее)
+    message = update.message or update.callback_query.message
+    progress = ProgressiveMessage(message.reply_text)
+    
+    async def show_progress(streamed_word: str, markdown: str):
+        ready = completed_part(markdown)
+        body = md_to_telegram_html(ready) if ready else "⏳"
+        await progress.update(f"📖 <b>{streamed_word.upper()}</b>\n\n{body}")
+    
     # Получаем объяснение и нормализованное слово
-    normalized_word, explanation = await get_word_explanation(word)
+    normalized_word, explanation = await get_word_explanation(word, on_progress=show_progress)
     
     if explanation == "ERROR_FALLBACK":
         keyboard = [
@@ -337,41 +583,27 @@ async def handle_word(update: Update, context: ContextTypes.DEFAULT_TYPE, word:
             ]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.message.reply_text(
-            f"📖 <b>{word.upper()}</b>\n\n⚠️ Превышен лимит запросов к Google Gemini (ошибка 429).\nПопробуйте нажать кнопку ниже через 30-60 секунд.",
-            reply_markup=reply_markup,
-            parse_mode=ParseMode.HTML
+        # Предохранитель знает, когда API снова примет запросы
+        wait = max(10, round(router.retry_in('explain')))
+        await progress.finish(
+            f"📖 <b>{word.upper()}</b>\n\n⚠️ Google Gemini сейчас перегружен.\nПопробуйте нажать кнопку ниже через {wait} секунд.",
+            reply_markup
         )
         return
 
-    # Сохраняем последнее слово в контекст для возможности сохранения
-    context.user_data['last_word'] = normalized_word
-    context.user_data['last_explanation'] = explanation
+    # Слово для кнопки сохранения — под токеном этого сообщения
+    save_data = await state.put_suggestion(normalized_word, explanation)
     
     # Создаем клавиатуру с кнопкой сохранения
     keyboard = [
         [
-            InlineKeyboardButton("💾 Сохранить в словарь", callback_data="save_word")
+            InlineKeyboardButton("💾 Сохранить в словарь", callback_data=save_data)
         ]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    # Отправка результата
-    reply_text = f"📖 <b>{normalized_word.upper()}</b>\n\n{explanation}"
-    
-    if update.message:
-        await update.message.reply_text(
-            reply_text,
-            reply_markup=reply_markup,
-            parse_mode=ParseMode.HTML
-        )
-    elif update.callback_query:
-        # Для ретрая отправляем новое сообщение (так проще и понятнее)
-        await update.callback_query.message.reply_text(
-            reply_text,
-            reply_markup=reply_markup,
-            parse_mode=ParseMode.HTML
-        )
+    # Итоговый текст: правка показанного сообщения или новое сообщение
+    await progress.finish(f"📖 <b>{normalized_word.upper()}</b>\n\n{explanation}", reply_markup)
 
 
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -382,28 +614,34 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     data = query.data
     
-    if data == "save_word":
+    if data.startswith(SAVE_CALLBACK_PREFIX):
         # ОБНОВЛЯЕМ КНОПКУ МГНОВЕННО (Оптимистичный UI)
+        original_markup = query.message.reply_markup
         new_keyboard = [[InlineKeyboardButton("✅ Сохранено", callback_data="noop")]]
         await query.edit_message_reply_markup(reply_markup=InlineKeyboardMarkup(new_keyboard))
-        await query.answer("Слово сохранено!")
         
-        # Сохранение слова в базу в фоновом режиме (уже не блокируем пользователя)
-        word = context.user_data.get('last_word')
-        explanation = context.user_data.get('last_explanation')
-        
-        if not word or not explanation:
-            # Fallback: пробуем взять из БД, если память бота пуста
-            pending = db.get_pending_suggestion(user_id)
-            if pending:
-                word = pending['word']
-                explanation = pending['definition']
-        
-        if word and explanation:
-            # db.add_word сам гарантирует наличие пользователя (add_user внутри не нужен)
-            db.add_word(user_id, word, explanation)
+        # Слово этого сообщения по токену; токен удаляем только после сохранения
+        suggestion = await state.get_suggestion(data)
+        if suggestion:
+            try:
+                # db.add_word сам гарантирует наличие пользователя (add_user внутри не нужен)
+                await db.add_word(user_id, *suggestion)
+            except Exception as e:
+                logger.error(f"Error saving word for user {user_id}: {e}")
+                # Возвращаем кнопку "Сохранить", чтобы можно было попробовать снова
+                await query.edit_message_reply_markup(reply_markup=original_markup)
+                await query.message.reply_text("⚠️ Не удалось сохранить слово. Попробуй нажать кнопку еще раз.")
+                return
+            await state.discard_suggestion(data)
         else:
-            logger.warning(f"Failed save for user {user_id}: data missing in memory and DB")
+            logger.warning(f"Failed save for user {user_id}: suggestion expired or already saved")
+            await query.edit_message_reply_markup(reply_markup=None)
+            await query.message.reply_text("⌛ Кнопка устарела. Отправь слово еще раз, чтобы сохранить его.")
+    
+    elif data == "save_word":
+        # Кнопки старого формата (без токена) — слово уже не восстановить
+        await query.edit_message_reply_markup(reply_markup=None)
+        await query.message.reply_text("⌛ Кнопка устарела. Отправь слово еще раз, чтобы сохранить его.")
             
     elif data.startswith("retry_"):
         # Повторить запрос слова
@@ -428,28 +666,64 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Статистика
         await stats_command(update, context)
         
+    elif data.startswith("export_"):
+        # Выгрузка словаря: export_{формат}
+        await send_export(update, context, data.split("_", 1)[1])
+    
+    elif data == "review_start":
+        await show_review_card(update, context)
+    
+    elif data.startswith("review_show_"):
+        # Показать значение и кнопки оценки: review_show_{id}
+        await show_review_answer(update, context, int(data.split("_")[2]))
+    
+    elif data.startswith("review_grade_"):
+        # Оценка ответа: review_grade_{id}_{оценка}
+        parts = data.split("_")
+        try:
+            word_id, grade = int(parts[2]), int(parts[3])
+        except (IndexError, ValueError):
+            word_id, grade = None, None
+        if grade not in GRADE_LABELS:
+            # Устаревшая или подделанная кнопка: next_schedule не примет такую оценку
+            logger.warning(f"Invalid review grade from user {user_id}: {data}")
+            await query.edit_message_text("⌛ Кнопка устарела. Начни повторение заново: /review")
+            return
+        schedule = await db.review_word(word_id, user_id, grade)
+        note = f"✅ Следующий показ через {format_delay(schedule.delay_minutes)}\n\n" if schedule else ""
+        await show_review_card(update, context, note=note)
+        
     elif data.startswith("dict_page_"):
-        # Пагинация словаря
-        page = int(data.split("_")[2])
-        await show_dictionary(update, context, page=page)
+        # Пагинация словаря: dict_page_{страница}[_{направление}_{время якоря}_{id якоря}]
+        parts = data.split("_")
+        page = int(parts[2])
+        if len(parts) > 5:
+            await show_dictionary(update, context, page=page, direction=parts[3],
+                                  anchor=(int(parts[4]), int(parts[5])))
+        else:
+            # Старые кнопки (без курсора или только с id якоря) — по номеру страницы
+            await show_dictionary(update, context, page=page)
         
     elif data.startswith("view_word_"):
         # Просмотр слова из словаря (ИНЛАЙН - редактируем текущее сообщение)
         parts = data.split("_")
         word_id = int(parts[2])
         page = int(parts[3]) if len(parts) > 3 else 0 # Запоминаем страницу
+        # и ключ ее первого слова (курсор): {время}_{id}
+        page_suffix = "_".join(parts[3:]) or "0"
+        back_data = f"dict_page_{page}_a_{parts[4]}_{parts[5]}" if len(parts) > 5 else f"dict_page_{page}"
         
-        word_data = db.get_word_by_id(word_id)
+        word_data = await db.get_word_by_id(word_id, user_id)
         
         if word_data:
             keyboard = [
-                [InlineKeyboardButton("🗑️ Удалить", callback_data=f"delete_word_{word_id}_{page}")],
-                [InlineKeyboardButton("⬅️ Назад к списку", callback_data=f"dict_page_{page}")]
+                [InlineKeyboardButton("🗑️ Удалить", callback_data=f"delete_word_{word_id}_{page_suffix}")],
+                [InlineKeyboardButton("⬅️ Назад к списку", callback_data=back_data)]
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
             
             await query.edit_message_text(
-                text=f"📖 <b>{word_data['word'].upper()}</b>\n\n{word_data['definition']}",
+                text=split_message(f"📖 <b>{word_data['word'].upper()}</b>\n\n{word_data['definition']}")[0],
                 reply_markup=reply_markup,
                 parse_mode=ParseMode.HTML
             )
@@ -461,22 +735,36 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parts = data.split("_")
         word_id = int(parts[2])
         page = int(parts[3]) if len(parts) > 3 else 0
+        anchor = (int(parts[4]), int(parts[5])) if len(parts) > 5 else None
         
-        if db.delete_word(word_id, user_id):
+        if await db.delete_word(word_id, user_id):
             await query.answer("Слово удалено")
             # Сразу показываем обновленный список на этой же странице
-            await show_dictionary(update, context, page=page)
+            # (курсор не зависит от строки якоря — даже если удалено само первое слово)
+            if anchor:
+                await show_dictionary(update, context, page=page, direction="a", anchor=anchor)
+            else:
+                await show_dictionary(update, context, page=page)
         else:
             await query.answer("Ошибка удаления", show_alert=True)
 
 
-async def show_dictionary(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 0):
-    """Показать словарь пользователя с пагинацией"""
+async def show_dictionary(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 0,
+                          direction: str = "n", anchor: Tuple[int, int] = None):
+    """Показать словарь пользователя с пагинацией по курсору (ключ слова-якоря)"""
     user_id = update.effective_user.id
     PER_PAGE = 5
     
-    # Получаем ВСЕ данные одним махом (оптимизация)
-    dict_data = db.get_dictionary_data(user_id, limit=PER_PAGE, offset=page * PER_PAGE)
+    # Страница по индексу: без OFFSET, стоимость не зависит от номера страницы
+    if anchor is not None:
+        dict_data = await db.get_dictionary_data(user_id, limit=PER_PAGE, anchor=anchor, direction=direction)
+        if not dict_data['words']:
+            # Страница опустела (удалены все слова после якоря) — начинаем сначала
+            page = 0
+            dict_data = await db.get_dictionary_data(user_id, limit=PER_PAGE)
+    else:
+        # Первая страница (или старая кнопка без курсора)
+        dict_data = await db.get_dictionary_data(user_id, limit=PER_PAGE, offset=page * PER_PAGE)
     total_words = dict_data['total_words']
     words = dict_data['words']
     
@@ -484,25 +772,35 @@ async def show_dictionary(update: Update, context: ContextTypes.DEFAULT_TYPE, pa
         text = "📚 Твой словарь пока пуст.\nОтправь мне слово, чтобы начать!"
         reply_markup = None
     else:
-        text = f"📚 <b>Твой словарь (всего {total_words}):</b>\n\nВыберите слово, чтобы прочитать его значение:"
+        # Краткие определения под заголовком: полный HTML объяснений для списка не читаем
+        briefs = "\n".join(
+            f"• <b>{html.escape(w['word'])}</b> — {html.escape(w['short_definition'])}" if w.get('short_definition')
+            else f"• <b>{html.escape(w['word'])}</b>"
+            for w in words
+        )
+        text = (f"📚 <b>Твой словарь (всего {total_words}):</b>\n\n{briefs}\n\n"
+                f"Выберите слово, чтобы прочитать его значение:")
         
         keyboard = []
-        # Кнопки со словами (передаем текущую страницу, чтобы вернуться назад именно на неё)
+        # Курсор страницы — ключ слова (время добавления, id): его не нужно искать в базе
+        first_key = f"{words[0]['page_at']}_{words[0]['id']}" if words else "0_0"
+        last_key = f"{words[-1]['page_at']}_{words[-1]['id']}" if words else "0_0"
+        # Кнопки со словами (передаем страницу и ее первое слово, чтобы вернуться назад именно на неё)
         for word_data in words:
             keyboard.append([
-                InlineKeyboardButton(f"📖 {word_data['word']}", callback_data=f"view_word_{word_data['id']}_{page}")
+                InlineKeyboardButton(f"📖 {word_data['word']}", callback_data=f"view_word_{word_data['id']}_{page}_{first_key}")
             ])
             
         # Пагинация
         nav_buttons = []
-        if page > 0:
-            nav_buttons.append(InlineKeyboardButton("⬅️", callback_data=f"dict_page_{page-1}"))
+        if dict_data['has_prev']:
+            nav_buttons.append(InlineKeyboardButton("⬅️", callback_data=f"dict_page_{max(page - 1, 0)}_p_{first_key}"))
             
-        total_pages = (total_words + PER_PAGE - 1) // PER_PAGE
+        total_pages = max((total_words + PER_PAGE - 1) // PER_PAGE, page + 1)
         nav_buttons.append(InlineKeyboardButton(f"{page+1}/{total_pages}", callback_data="noop"))
         
-        if (page + 1) * PER_PAGE < total_words:
-            nav_buttons.append(InlineKeyboardButton("➡️", callback_data=f"dict_page_{page+1}"))
+        if dict_data['has_next']:
+            nav_buttons.append(InlineKeyboardButton("➡️", callback_data=f"dict_page_{page+1}_n_{last_key}"))
             
         if nav_buttons:
             keyboard.append(nav_buttons)
@@ -548,39 +846,32 @@ async def random_word_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     # Показываем индикатор печати
     await context.bot.send_chat_action(chat_id=chat_id, action="typing")
     
-    # Инициализируем кэш предложенных слов в сессии, если его нет
-    if 'suggested_cache' not in context.user_data:
-        context.user_data['suggested_cache'] = []
+    # Недавно предложенные слова (переживают перезапуск бота)
+    recent = await state.recent_suggestions(user_id)
     
-    # Берем слова из базы для контекста
-    existing_words = db.get_user_words(user_id, limit=30)
+    # Сначала берем готовое слово из пула (мгновенно)
+    suggestion = await word_pool.draw(user_id, exclude_words=recent)
     
-    # Генерируем новое слово, исключая и базу, и текущий кэш сессии
-    suggestion = await get_smart_word_suggestion(existing_words, exclude_words=context.user_data['suggested_cache'])
+    if not suggestion:
+        # Пул пуст — генерируем новое слово, исключая и базу, и недавние предложения
+        existing_words = await db.get_word_briefs(user_id, limit=30)
+        suggestion = await get_smart_word_suggestion(existing_words, exclude_words=recent)
     
     if suggestion:
         word, explanation = suggestion
+        await state.remember_suggestion(user_id, word)
         
-        # Добавляем в кэш сессии (храним последние 15)
-        context.user_data['suggested_cache'].append(word)
-        if len(context.user_data['suggested_cache']) > 15:
-            context.user_data['suggested_cache'].pop(0)
-            
-        # Сохраняем в контекст и в БД для надежности кнопки "Сохранить"
-        context.user_data['last_word'] = word
-        context.user_data['last_explanation'] = explanation
-        db.save_pending_suggestion(user_id, word, explanation)
-        
-        keyboard = [[InlineKeyboardButton("💾 Сохранить в словарь", callback_data="save_word")]]
+        # Кнопка "Сохранить" с токеном этого сообщения
+        save_data = await state.put_suggestion(word, explanation)
+        keyboard = [[InlineKeyboardButton("💾 Сохранить в словарь", callback_data=save_data)]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         # Если это была кнопка в словаре, можно было бы редактировать, 
         # но лучше прислать новым сообщением, чтобы не терять словарь.
-        await context.bot.send_message(
-            chat_id=chat_id,
-            text=f"✨ <b>Рекомендация для тебя</b>\n\n📖 <b>{word.upper()}</b>\n\n{explanation}",
-            reply_markup=reply_markup,
-            parse_mode=ParseMode.HTML
+        await send_long_message(
+            partial(context.bot.send_message, chat_id=chat_id),
+            f"✨ <b>Рекомендация для тебя</b>\n\n📖 <b>{word.upper()}</b>\n\n{explanation}",
+            reply_markup
         )
     else:
         await context.bot.send_message(
@@ -589,10 +880,79 @@ async def random_word_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
 
 
+async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Поиск по словарю: /search запрос"""
+    user_id = update.effective_user.id
+    query = " ".join(context.args) if context.args else ""
+    
+    if not query:
+        await update.message.reply_text("🔍 Напиши, что искать: /search синтез")
+        return
+    
+    results = await db.search_words(user_id, query, limit=10)
+    if not results:
+        await update.message.reply_text(f"🔍 По запросу «{query}» ничего не нашлось.")
+        return
+    
+    keyboard = [
+        [InlineKeyboardButton(f"📖 {word_data['word']}", callback_data=f"view_word_{word_data['id']}_0")]
+        for word_data in results
+    ]
+    await update.message.reply_text(
+        f"🔍 <b>Найдено по запросу «{html.escape(query)}»:</b>",
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode=ParseMode.HTML
+    )
+
+
+async def show_review_card(update: Update, context: ContextTypes.DEFAULT_TYPE, note: str = ""):
+    """Показать следующее слово из очереди повторения (без ответа)"""
+    user_id = update.effective_user.id
+    due = await db.get_due_words(user_id, limit=1)
+    
+    if due:
+        left = await db.count_due_words(user_id)
+        word = due[0]
+        text = (f"{note}🧠 <b>Повторение</b> (осталось {left})\n\n📖 <b>{word['word'].upper()}</b>\n\n"
+                f"Вспомни значение и проверь себя.")
+        reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("👀 Показать ответ", callback_data=f"review_show_{word['id']}")]])
+    else:
+        text = f"{note}🎉 На сейчас повторять нечего. Загляни позже!"
+        reply_markup = None
+    
+    if update.callback_query:
+        await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
+    else:
+        await update.message.reply_text(text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
+
+
+async def show_review_answer(update: Update, context: ContextTypes.DEFAULT_TYPE, word_id: int):
+    """Показать значение слова и кнопки оценки"""
+    word_data = await db.get_word_by_id(word_id, update.effective_user.id)
+    if not word_data:
+        await update.callback_query.answer("Слово не найдено", show_alert=True)
+        return
+    
+    keyboard = [[
+        InlineKeyboardButton(label, callback_data=f"review_grade_{word_id}_{grade}")
+        for grade, label in GRADE_LABELS.items()
+    ]]
+    await update.callback_query.edit_message_text(
+        text=split_message(f"📖 <b>{word_data['word'].upper()}</b>\n\n{word_data['definition']}")[0],
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode=ParseMode.HTML
+    )
+
+
+async def review_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Повторение слов по интервалам (SM-2)"""
+    await show_review_card(update, context)
+
+
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать статистику пользователя"""
     user_id = update.effective_user.id
-    stats = db.get_user_stats(user_id)
+    stats = await db.get_user_stats(user_id)
     
     text = f"""
 📊 Твоя статистика:
@@ -600,6 +960,8 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 📚 Всего слов: {stats['total_words']}
 📅 Первое слово: {stats['first_word_date'] or 'нет данных'}
 🆕 Последнее слово: {stats['last_word_date'] or 'нет данных'}
+🔁 Повторений: {stats['reviews_done']}
+🔥 Дней подряд: {stats['streak_days']}
 
 Продолжай в том же духе! 🚀
 """
@@ -610,10 +972,111 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(text, parse_mode=ParseMode.HTML)
 
 
+async def import_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Инструкция по импорту слов из файла"""
+    await update.message.reply_text(
+        "📥 <b>Импорт слов</b>\n\n"
+        "Пришли мне файл:\n"
+        "• <b>.txt</b> — по одному слову на строку\n"
+        "• <b>.csv</b> — слово в первой колонке, определение во второй (необязательно)\n\n"
+        f"Слова без определения я объясню сам. За один раз — до {importer.max_words} слов, "
+        "уже сохраненные слова пропускаются.",
+        parse_mode=ParseMode.HTML
+    )
+
+
+async def handle_import_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Принять файл для импорта и запустить импорт в фоне"""
+    user_id = update.effective_user.id
+    if user_id in active_imports:
+        await update.message.reply_text("⏳ Предыдущий импорт еще идет, дождись его окончания.")
+        return
+    
+    document = update.message.document
+    suffix = ".csv" if document.file_name and document.file_name.lower().endswith(".csv") else ".txt"
+    status = await update.message.reply_text("📥 Файл получен, начинаю импорт...")
+    
+    # Файл сохраняется на диск и читается построчно, а не целиком в память
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        path = tmp.name
+    try:
+        file = await document.get_file()
+        await file.download_to_drive(path)
+    except Exception:
+        os.remove(path)
+        raise
+    
+    active_imports.add(user_id)
+    context.application.create_task(run_import(user_id, path, status), update=update)
+
+
+async def run_import(user_id: int, path: str, status):
+    """Импорт с обновлением сообщения о прогрессе (не чаще раза в IMPORT_PROGRESS_INTERVAL секунд)"""
+    last_update = 0.0
+    
+    async def report(stats: dict):
+        nonlocal last_update
+        if asyncio.get_running_loop().time() - last_update < IMPORT_PROGRESS_INTERVAL:
+            return
+        last_update = asyncio.get_running_loop().time()
+        try:
+            await status.edit_text(f"📥 Импорт... обработано {stats['processed']}, добавлено {stats['added']}")
+        except Exception as e:
+            logger.warning(f"Не удалось обновить прогресс импорта: {e}")
+    
+    try:
+        stats = await importer.run(user_id, open_rows(path), progress=report)
+        text = (f"✅ <b>Импорт завершен</b>\n\n"
+                f"➕ Добавлено: {stats['added']}\n"
+                f"📚 Уже были в словаре: {stats['existing']}\n"
+                f"⚠️ Не удалось объяснить: {stats['failed']}")
+        if stats['truncated']:
+            text += f"\n\n✂️ Обработаны первые {importer.max_words} слов — остальные пришли отдельным файлом."
+        await status.edit_text(text, parse_mode=ParseMode.HTML)
+        logger.info(f"📥 Импорт для {user_id}: {stats}")
+    except Exception as e:
+        logger.error(f"Ошибка импорта для {user_id}: {e}")
+        await status.edit_text("⚠️ Не удалось импортировать файл. Проверь, что это текст в UTF-8.")
+    finally:
+        active_imports.discard(user_id)
+        os.remove(path)
+
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Выбор формата выгрузки словаря"""
+    keyboard = [[
+        InlineKeyboardButton(export_format.title, callback_data=f"export_{key}")
+        for key, export_format in available_formats().items()
+    ]]
+    await update.message.reply_text(
+        "📦 В каком формате выгрузить словарь?",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+
+async def send_export(update: Update, context: ContextTypes.DEFAULT_TYPE, fmt: str):
+    """Собрать файл выгрузки (в пуле потоков БД, потоково) и отправить его"""
+    query = update.callback_query
+    await query.edit_message_text("⏳ Готовлю файл...")
+    
+    try:
+        out, count = await db.run(export_words, update.effective_user.id, fmt)
+    except ExportError as e:
+        await query.edit_message_text(f"⚠️ {e}")
+        return
+    
+    with out:
+        if not count:
+            await query.edit_message_text("📚 Словарь пока пуст — выгружать нечего.")
+            return
+        await query.message.reply_document(document=out, filename=FORMATS[fmt].filename, caption=f"📦 Слов: {count}")
+    await query.edit_message_text("✅ Словарь выгружен")
+
+
 async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Подписаться на ежедневные слова"""
     user_id = update.effective_user.id
-    db.subscribe_user(user_id, True)
+    await db.subscribe_user(user_id, True)
     await update.message.reply_text(
         "✅ <b>Подписка включена!</b>\n\n"
         "Теперь я буду присылать тебе новые умные слова каждые 3 часа с 6:00 до 21:00.\n"
@@ -624,7 +1087,7 @@ async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def unsubscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Отписаться от ежедневных слов"""
     user_id = update.effective_user.id
-    db.subscribe_user(user_id, False)
+    await db.subscribe_user(user_id, False)
     await update.message.reply_text(
         "🔕 <b>Подписка выключена.</b>\n"
         "Больше не буду беспокоить тебя автоматическими сообщениями.",
@@ -643,6 +1106,10 @@ def main():
     application.add_handler(CommandHandler("dictionary", dictionary_command))
     application.add_handler(CommandHandler("random", random_word_command))
     application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CommandHandler("search", search_command))
+    application.add_handler(CommandHandler("review", review_command))
+    application.add_handler(CommandHandler("import", import_command))
+    application.add_handler(CommandHandler("export", export_command))
     application.add_handler(CommandHandler("subscribe", subscribe_command))
     application.add_handler(CommandHandler("unsubscribe", unsubscribe_command))
     
@@ -660,10 +1127,28 @@ def main():
     
     for t in times:
         application.job_queue.run_daily(daily_word_job, time=t)
+    
+    # Вечернее напоминание о словах к повторению
+    application.job_queue.run_daily(review_reminder_job, time=time(hour=REVIEW_REMINDER_HOUR, tzinfo=timezone.utc))
+    
+    # Раз в сутки чистим устаревшие объяснения из кэша
+    application.job_queue.run_repeating(cache_cleanup_job, interval=24 * 3600, first=3600)
+    
+    # Очистка истекшего временного состояния
+    application.job_queue.run_repeating(state_cleanup_job, interval=STATE_CLEANUP_INTERVAL, first=60)
+    
+    # Поддерживаем запас готовых слов в пуле
+    application.job_queue.run_repeating(word_pool_refill_job, interval=WORD_POOL_REFILL_INTERVAL, first=10)
 
     # Обработчик кнопок
     application.add_handler(CallbackQueryHandler(button_callback))
     
+    # Файлы для импорта слов
+    application.add_handler(MessageHandler(
+        filters.Document.FileExtension("txt") | filters.Document.FileExtension("csv"),
+        handle_import_document
+    ))
+    
     # Обработчик текстовых сообщений (слов)
     application.add_handler(MessageHandler(
         filters.TEXT & ~filters.COMMAND, 
@@ -680,7 +1165,7 @@ def main():
             """Обработчик для пинга: будит и бота, и базу данных"""
             try:
                 # Делаем фиктивный запрос к базе, чтобы Supabase не уснул
-                db.init_db() 
+                await db.ping()
                 return web.Response(text="OK - Bot and DB are alive", content_type="text/plain")
             except Exception as e:
                 logger.error(f"Health check DB error: {e}")
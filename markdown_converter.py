@@ -2,61 +2,171 @@
 Конвертер Markdown → Telegram HTML
 
 Преобразует стандартный Markdown (от Gemini API) в HTML,
-поддерживаемый Telegram Bot API.
+поддерживаемый Telegram Bot API, и режет длинный HTML на сообщения
+в пределах лимита Telegram.
 """
 
+import html
 import re
+from typing import List
+
+# Лимит длины сообщения Telegram (символов после разбора разметки)
+MESSAGE_LIMIT = 4096
+
+# Все конструкции разметки одним выражением: текст просматривается за один проход,
+# порядок альтернатив задает приоритет (** раньше *, код раньше всего остального).
+# Опережающая проверка сразу отбрасывает позиции без символов разметки.
+# Строчные конструкции не переходят через перевод строки: одиночные ** в тексте
+# не должны съедать следующий заголовок раздела. Через строки идет только ```
+_TOKEN = re.compile(r"""
+    (?=[`*_~\[\#])
+    (?:
+      ```(?:\w+)?\n?(?P<pre>(?s:.*?))```
+    | `(?P<code>[^`]+)`
+    | \*\*\*(?P<bold_italic>[^\n]+?)\*\*\*
+    | \*\*(?P<bold>[^\n]+?)\*\*
+    | __(?P<bold2>[^\n]+?)__
+    | ~~(?P<strike>[^\n]+?)~~
+    | \[(?P<link_text>[^\]]+)\]\((?P<link_url>[^)]+)\)
+    | ^\#{1,6}[ \t]+(?P<header>[^\n]+)$
+    | (?<!\w)\*(?P<italic>[^*\n]+?)\*(?!\w)
+    | (?<!\w)_(?P<italic2>[^_\n]+?)_(?!\w)
+    )
+""", re.MULTILINE | re.VERBOSE)
+
+# Теги, которые оборачивают разобранное (вложенная разметка внутри разрешена)
+_WRAP = {
+    'bold': 'b', 'bold2': 'b', 'header': 'b',
+    'italic': 'i', 'italic2': 'i',
+    'strike': 's',
+}
+
+# Разбор готового HTML для нарезки: теги, сущности, строки текста
+_HTML_PIECE = re.compile(r"<(?P<close>/?)(?P<tag>\w+)[^>]*>|&#?\w+;|[^<&\n]+\n?|\n|[<&]")
+# Последний пробельный символ (место переноса длинной строки)
+_LAST_SPACE = re.compile(r"\s(?=\S*$)")
+
+
+def _escape(text: str) -> str:
+    return html.escape(text, quote=False)
+
+
+def _replace(match: re.Match) -> str:
+    kind = match.lastgroup
+    if kind == 'pre':
+        return f"<pre>{_escape(match.group('pre'))}</pre>"
+    if kind == 'code':
+        return f"<code>{_escape(match.group('code'))}</code>"
+    if kind in ('link_text', 'link_url'):
+        url = html.escape(match.group('link_url'), quote=True)
+        return f'<a href="{url}">{_convert(match.group("link_text"))}</a>'
+    if kind == 'bold_italic':
+        return f"<b><i>{_convert(match.group(kind))}</i></b>"
+    tag = _WRAP[kind]
+    return f"<{tag}>{_convert(match.group(kind))}</{tag}>"
+
+
+def _convert(text: str) -> str:
+    """Один проход по тексту: между конструкциями — экранированный текст"""
+    parts = []
+    position = 0
+    for match in _TOKEN.finditer(text):
+        parts.append(_escape(text[position:match.start()]))
+        parts.append(_replace(match))
+        position = match.end()
+    parts.append(_escape(text[position:]))
+    return "".join(parts)
 
 
 def md_to_telegram_html(text: str) -> str:
     """
     Конвертирует Markdown-текст в Telegram-совместимый HTML.
-    
+
     Поддерживает:
     - **bold** → <b>bold</b>
+    - ***bold italic*** → <b><i>bold italic</i></b>
     - *italic* → <i>italic</i>
-    - `code` → <code>code</code>
-    - ```code block``` → <pre>code block</pre>
+    - `code` → <code>code</code> (содержимое не форматируется)
+    - ```code block``` → <pre>code block</pre> (содержимое не форматируется)
     - # Заголовки → <b>Заголовки</b>
     - [text](url) → <a href="url">text</a>
     - ~~strikethrough~~ → <s>strikethrough</s>
     """
     if not text:
         return text
-    
-    # Шаг 1: Экранируем HTML-спецсимволы
-    text = text.replace('&', '&amp;')
-    text = text.replace('<', '&lt;')
-    text = text.replace('>', '&gt;')
-    
-    # Шаг 2: Блоки кода (``` ... ```) — обрабатываем первыми
-    # Убираем необязательное имя языка после ```
-    text = re.sub(
-        r'```(?:\w+)?\n?(.*?)```',
-        r'<pre>\1</pre>',
-        text,
-        flags=re.DOTALL
-    )
-    
-    # Шаг 3: Инлайн-код (` ... `)
-    text = re.sub(r'`([^`]+)`', r'<code>\1</code>', text)
-    
-    # Шаг 4: Жирный текст (**text** или __text__)
-    text = re.sub(r'\*\*(.+?)\*\*', r'<b>\1</b>', text)
-    text = re.sub(r'__(.+?)__', r'<b>\1</b>', text)
-    
-    # Шаг 5: Курсив (*text* или _text_)
-    # Не ловим одиночные * в середине текста
-    text = re.sub(r'(?<!\w)\*([^*]+?)\*(?!\w)', r'<i>\1</i>', text)
-    text = re.sub(r'(?<!\w)_([^_]+?)_(?!\w)', r'<i>\1</i>', text)
-    
-    # Шаг 6: Зачеркнутый (~~text~~)
-    text = re.sub(r'~~(.+?)~~', r'<s>\1</s>', text)
-    
-    # Шаг 7: Ссылки [text](url)
-    text = re.sub(r'\[([^\]]+)\]\(([^)]+)\)', r'<a href="\2">\1</a>', text)
-    
-    # Шаг 8: Заголовки (# Header) → жирный текст
-    text = re.sub(r'^#{1,6}\s+(.+)$', r'<b>\1</b>', text, flags=re.MULTILINE)
-    
-    return text
+    return _convert(text)
+
+
+def visible_length(html_text: str) -> int:
+    """Длина текста сообщения так, как ее считает Telegram (без тегов, сущность — один символ)"""
+    length = 0
+    for piece in _HTML_PIECE.finditer(html_text):
+        if piece.group('tag'):
+            continue
+        length += 1 if piece.group().startswith('&') and len(piece.group()) > 1 else len(piece.group())
+    return length
+
+
+def split_message(html_text: str, limit: int = MESSAGE_LIMIT) -> List[str]:
+    """
+    Разрезать HTML на сообщения не длиннее limit видимых символов
+
+    Режет по границам строк (длинные строки — по последнему пробелу
+    до limit, строки без пробелов — ровно по limit). Незакрытые на
+    границе теги закрываются в конце части и открываются заново в следующей.
+    """
+    # Видимая длина не больше полной — короткие сообщения не разбираем
+    if not html_text or len(html_text) <= limit or visible_length(html_text) <= limit:
+        return [html_text]
+
+    chunks = []
+    current = []
+    length = 0
+    open_tags = []  # (имя, открывающий тег)
+    line_start = True  # часть заканчивается на границе строки
+
+    def flush():
+        nonlocal current, length
+        closing = "".join(f"</{name}>" for name, _ in reversed(open_tags))
+        chunks.append("".join(current) + closing)
+        current = [opening for _, opening in open_tags]
+        length = 0
+
+    for piece in _HTML_PIECE.finditer(html_text):
+        token = piece.group()
+        if piece.group('tag'):
+            name = piece.group('tag').lower()
+            if piece.group('close'):
+                if open_tags and open_tags[-1][0] == name:
+                    open_tags.pop()
+            else:
+                open_tags.append((name, token))
+            current.append(token)
+            continue
+
+        size = 1 if token.startswith('&') and len(token) > 1 else len(token)
+        while size > limit - length:
+            if length and line_start:
+                # Строка не влезает — переносим ее в следующую часть целиком
+                flush()
+                continue
+            # Середина строки или строка длиннее лимита: режем по последнему
+            # пробелу, а без пробелов — жестко по лимиту
+            space = _LAST_SPACE.search(token, 0, limit - length) if size == len(token) else None
+            if space and (length or token[:space.start()].strip()):
+                cut = space.end()
+            elif length:
+                flush()
+                continue
+            else:
+                cut = limit
+            current.append(token[:cut])
+            token, size = token[cut:], size - cut
+            flush()
+        current.append(token)
+        length += size
+        line_start = token.endswith("\n")
+
+    if length or len(current) > len(open_tags):
+        flush()
+    return chunks
@@ -0,0 +1,366 @@
+"""
+Перенос данных между базами (SQLite -> Postgres, Postgres -> Postgres)
+
+Схему в целевой базе создает Database.init_db. Таблицы читаются потоком
+(серверный курсор в Postgres) в порядке ключа и пишутся пачками
+(execute_values в Postgres, executemany в SQLite). После каждой пачки
+в целевой базе сохраняется контрольная точка — последний перенесенный
+ключ, поэтому упавший перенос продолжается с места остановки. В конце
+сравниваются число строк и контрольные суммы таблиц.
+
+В старой SQLite lower() понимал только ASCII, поэтому у пользователя могут
+быть "Слово" и "слово" одновременно. В целевой базе они нарушили бы
+уникальный индекс (user_id, word_key): переносится самая свежая версия,
+остальные пропускаются (их id пишутся в лог) и не учитываются при проверке.
+"""
+
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set
+
+from compression import unpack_definition
+from database import Database, word_key
+
+logger = logging.getLogger(__name__)
+
+# Строк в одной пачке записи (и одной транзакции)
+MIGRATION_BATCH_SIZE = 1000
+
+
+class Table(NamedTuple):
+    name: str
+    key: str
+    columns: List[str]
+    serial: bool = False
+    numeric_key: bool = True
+
+
+# Порядок важен: пользователи раньше слов (внешний ключ)
+TABLES = [
+    Table('users', 'user_id', ['user_id', 'username', 'first_name', 'is_subscribed', 'created_at']),
+    Table('words', 'id', ['id', 'user_id', 'word', 'definition', 'context', 'created_at', 'last_reviewed',
+                          'rand_key', 'ease', 'interval_days', 'repetitions', 'due_at',
+                          'short_definition', 'sections', 'definition_z'], serial=True),
+    Table('user_stats', 'user_id', ['user_id', 'word_count', 'first_word_date', 'last_word_date',
+                                    'reviews_done', 'streak_days', 'last_active_date']),
+    Table('explanation_cache', 'cache_key', ['cache_key', 'normalized_word', 'explanation', 'created_at'],
+          numeric_key=False),
+    Table('word_pool', 'id', ['id', 'theme', 'word', 'word_key', 'explanation', 'served_count', 'created_at'],
+          serial=True),
+]
+
+# В SQLite булевы значения хранятся как 0/1, Postgres ждет настоящий boolean
+BOOLEAN_COLUMNS = {'is_subscribed'}
+
+
+class MigrationError(Exception):
+    """Данные в целевой базе не совпали с исходной"""
+
+
+def normalize(value) -> str:
+    """Значение для контрольной суммы: одинаковое в SQLite и Postgres"""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, datetime):
+        return value.isoformat(" ")
+    if isinstance(value, float):
+        return f"{value:.6f}"
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value).hex()
+    return str(value)
+
+
+class Migrator:
+    """Потоковый перенос с контрольными точками и проверкой"""
+
+    def __init__(self, source: Database, target: Database, batch_size: int = None):
+        """
+        Args:
+            source: Исходная база
+            target: Целевая база (схема уже создана конструктором Database)
+            batch_size: Строк в одной пачке записи
+        """
+        self.source = source
+        self.target = target
+        self.batch_size = batch_size or MIGRATION_BATCH_SIZE
+        self._skipped = {}
+        self._init_checkpoints()
+
+    def run(self, verify: bool = True) -> Dict[str, int]:
+        """
+        Перенести все таблицы (продолжая с контрольных точек)
+
+        Returns:
+            Сколько строк перенесено в этом запуске по таблицам
+        """
+        copied = {}
+        for table in TABLES:
+            columns = self._common_columns(table)
+            if not columns:
+                logger.info(f"⏭ {table.name}: нет в исходной базе")
+                continue
+            copied[table.name] = self._copy_table(table, columns)
+            logger.info(f"✅ {table.name}: перенесено {copied[table.name]}")
+
+        self._finish()
+        if verify:
+            self.verify()
+        return copied
+
+    def verify(self) -> Dict[str, Dict]:
+        """
+        Сравнить число строк и контрольные суммы таблиц
+
+        Raises:
+            MigrationError: Если хотя бы одна таблица не совпала
+        """
+        report = {}
+        for table in TABLES:
+            columns = self._common_columns(table)
+            if not columns:
+                continue
+            # Счетчики user_stats пересчитываются в целевой базе — сравниваем только состав
+            if table.name == 'user_stats':
+                columns = [table.key]
+            source = self._checksum(self.source, table, columns, skip=self._skipped_keys(table))
+            target = self._checksum(self.target, table, columns)
+            report[table.name] = {'source': source, 'target': target, 'ok': source == target}
+
+        failed = [name for name, result in report.items() if not result['ok']]
+        if failed:
+            raise MigrationError(f"Не совпали таблицы: {', '.join(failed)} ({report})")
+        return report
+
+    def reset(self):
+        """Забыть контрольные точки: следующий run пройдет все таблицы заново (дубликаты пропускаются)"""
+        conn = self.target.get_connection()
+        try:
+            self.target.get_cursor(conn).execute("DELETE FROM migration_checkpoints")
+            conn.commit()
+        finally:
+            self.target.release_connection(conn)
+
+    def _init_checkpoints(self):
+        conn = self.target.get_connection()
+        try:
+            cursor = self.target.get_cursor(conn)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS migration_checkpoints (
+                    table_name TEXT PRIMARY KEY,
+                    last_key TEXT NOT NULL,
+                    rows_copied INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.commit()
+        finally:
+            self.target.release_connection(conn)
+
+    def _columns(self, db: Database, table: Table) -> Optional[List[str]]:
+        conn = db.get_connection()
+        try:
+            cursor = db.get_cursor(conn)
+            if not db._table_exists(cursor, table.name):
+                return None
+            cursor.execute(f"SELECT * FROM {table.name} LIMIT 0")
+            return [column[0] for column in cursor.description]
+        finally:
+            if db.is_postgres:
+                conn.rollback()
+            db.release_connection(conn)
+
+    def _common_columns(self, table: Table) -> List[str]:
+        """Колонки таблицы, которые есть и в исходной, и в целевой базе (старые схемы беднее)"""
+        source = self._columns(self.source, table) or []
+        target = self._columns(self.target, table) or []
+        return [column for column in table.columns if column in source and column in target]
+
+    def _skipped_keys(self, table: Table) -> Set:
+        """
+        Ключи строк источника, которые не переносятся: старые версии слов,
+        совпадающих без учета регистра (остается строка с наибольшим id)
+        """
+        if table.name != 'words':
+            return set()
+        if table.name not in self._skipped:
+            conn = self.source.get_connection()
+            try:
+                if self.source.is_postgres:
+                    key_sql = r"lower(regexp_replace(btrim(word), '\s+', ' ', 'g'))"
+                else:
+                    # lower() SQLite не знает кириллицы — ключ считает Python
+                    conn.create_function("py_word_key", 1, word_key, deterministic=True)
+                    key_sql = "py_word_key(word)"
+                cursor = self.source.get_cursor(conn)
+                cursor.execute(f"""
+                    SELECT id FROM words
+                    WHERE id NOT IN (SELECT MAX(id) FROM words GROUP BY user_id, {key_sql})
+                    ORDER BY id
+                """)
+                self._skipped[table.name] = {row['id'] for row in cursor.fetchall()}
+            finally:
+                if self.source.is_postgres:
+                    conn.rollback()
+                self.source.release_connection(conn)
+            if self._skipped[table.name]:
+                logger.warning(f"⚠️ words: пропущены старые дубликаты слов (без учета регистра), "
+                               f"id: {sorted(self._skipped[table.name])}")
+        return self._skipped[table.name]
+
+    def _iter_rows(self, db: Database, table: Table, columns: List[str], after=None) -> Iterator[tuple]:
+        """Строки таблицы по возрастанию ключа, потоком"""
+        conn = db.get_connection()
+        p = "%s" if db.is_postgres else "?"
+        # Текстовые ключи — в побайтовом порядке, как в SQLite: иначе порядок зависит
+        # от правил сортировки базы, и контрольные суммы не совпадут
+        key = f'{table.key} COLLATE "C"' if db.is_postgres and not table.numeric_key else table.key
+        where = f"WHERE {key} > {p}" if after is not None else ""
+        sql = f"SELECT {', '.join(columns)} FROM {table.name} {where} ORDER BY {key}"
+        try:
+            if db.is_postgres:
+                cursor = conn.cursor(name=f"migrate_{table.name}")
+                cursor.itersize = self.batch_size
+            else:
+                cursor = conn.cursor()
+            cursor.execute(sql, (after,) if after is not None else ())
+            for row in cursor:
+                yield tuple(row)
+            cursor.close()
+        finally:
+            if db.is_postgres:
+                conn.rollback()
+            db.release_connection(conn)
+
+    def _get_checkpoint(self, table: Table):
+        conn = self.target.get_connection()
+        try:
+            cursor = self.target.get_cursor(conn)
+            p = "%s" if self.target.is_postgres else "?"
+            cursor.execute(f"SELECT last_key FROM migration_checkpoints WHERE table_name = {p}", (table.name,))
+            row = cursor.fetchone()
+            if not row:
+                return None
+            # Ключи хранятся текстом; числовые id возвращаем числом для сравнения
+            return int(row['last_key']) if table.numeric_key else row['last_key']
+        finally:
+            self.target.release_connection(conn)
+
+    def _copy_table(self, table: Table, columns: List[str]) -> int:
+        after = self._get_checkpoint(table)
+        if after is not None:
+            logger.info(f"↪️ {table.name}: продолжаем после ключа {after}")
+
+        # Ключ слова для уникального индекса (user_id, word_key) считается в Python
+        add_word_key = table.name == 'words'
+        insert_columns = columns + (['word_key'] if add_word_key else [])
+        key_index = columns.index(table.key)
+        booleans = [i for i, column in enumerate(columns) if column in BOOLEAN_COLUMNS] if self.target.is_postgres else []
+
+        skipped = self._skipped_keys(table)
+        copied = 0
+        batch = []
+        for row in self._iter_rows(self.source, table, columns, after):
+            if row[key_index] in skipped:
+                continue
+            if booleans:
+                row = tuple(bool(value) if i in booleans and value is not None else value for i, value in enumerate(row))
+            if add_word_key:
+                row = row + (word_key(row[columns.index('word')]),)
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                copied += self._write_batch(table, insert_columns, batch, key_index)
+                batch = []
+        if batch:
+            copied += self._write_batch(table, insert_columns, batch, key_index)
+        return copied
+
+    def _write_batch(self, table: Table, columns: List[str], rows: List[tuple], key_index: int) -> int:
+        """Записать пачку и контрольную точку одной транзакцией"""
+        conn = self.target.get_connection()
+        try:
+            cursor = self.target.get_cursor(conn)
+            names = ", ".join(columns)
+            if self.target.is_postgres:
+                from psycopg2.extras import execute_values
+                execute_values(cursor, f"INSERT INTO {table.name} ({names}) VALUES %s ON CONFLICT DO NOTHING",
+                               rows, page_size=len(rows))
+            else:
+                placeholders = ", ".join("?" * len(columns))
+                cursor.executemany(f"INSERT INTO {table.name} ({names}) VALUES ({placeholders}) ON CONFLICT DO NOTHING",
+                                   rows)
+
+            p = "%s" if self.target.is_postgres else "?"
+            cursor.execute(f"""
+                INSERT INTO migration_checkpoints (table_name, last_key, rows_copied) VALUES ({p}, {p}, {p})
+                ON CONFLICT (table_name) DO UPDATE SET
+                    last_key = EXCLUDED.last_key,
+                    rows_copied = migration_checkpoints.rows_copied + EXCLUDED.rows_copied
+            """, (table.name, str(rows[-1][key_index]), len(rows)))
+            conn.commit()
+            return len(rows)
+        finally:
+            self.target.release_connection(conn)
+
+    def _finish(self):
+        """Сдвинуть счетчики id в Postgres, дозаполнить новые колонки и пересчитать статистику"""
+        if self.target.is_postgres:
+            conn = self.target.get_connection()
+            try:
+                cursor = self.target.get_cursor(conn)
+                for table in TABLES:
+                    if table.serial:
+                        cursor.execute(f"""
+                            SELECT setval(pg_get_serial_sequence('{table.name}', '{table.key}'),
+                                          COALESCE((SELECT MAX({table.key}) FROM {table.name}), 0) + 1, false)
+                        """)
+                conn.commit()
+            finally:
+                self.target.release_connection(conn)
+
+        # Старые исходные схемы без rand_key/due_at/разделов: новые колонки перенесенных
+        # строк заполняют разовые переносы (заново, по всем строкам)
+        self.target.run_data_migrations(force=True)
+        self.target.rebuild_user_stats()
+
+    def _checksum(self, db: Database, table: Table, columns: List[str], skip: Set = frozenset()) -> Dict:
+        """Число строк и md5 по всем строкам в порядке ключа (кроме ключей из skip)"""
+        # Определение сравниваем распакованным: в старой базе оно не сжато, в новой может быть сжато
+        packed = 'definition' in columns and 'definition_z' in (self._columns(db, table) or [])
+        columns = [column for column in columns if column != 'definition_z']
+        index = columns.index('definition') if packed else None
+        digest = hashlib.md5()
+        count = 0
+        key_index = columns.index(table.key)
+        for row in self._iter_rows(db, table, columns + (['definition_z'] if packed else [])):
+            if row[key_index] in skip:
+                continue
+            if packed:
+                row = row[:index] + (unpack_definition(row[index], row[-1]),) + row[index + 1:-1]
+            digest.update("\x1f".join(normalize(value) for value in row).encode("utf-8"))
+            digest.update(b"\x1e")
+            count += 1
+        return {'rows': count, 'md5': digest.hexdigest()}
+
+
+def migrate(source_url: str, target_url: str, batch_size: int = None, verify: bool = True,
+            restart: bool = False) -> Dict[str, int]:
+    """
+    Перенести данные из source_url в target_url
+
+    Схема цели создается через Database.init_db, исходная база не меняется.
+
+    Args:
+        restart: Начать заново, не продолжая с контрольных точек
+    """
+    source = Database(source_url, init_schema=False)
+    target = Database(target_url)
+    try:
+        migrator = Migrator(source, target, batch_size)
+        if restart:
+            migrator.reset()
+        return migrator.run(verify=verify)
+    finally:
+        source.close()
+        target.close()
@@ -0,0 +1,192 @@
+"""
+Маршрутизация запросов по моделям Gemini
+
+Каждая задача бота (маршрут) закреплена за уровнем моделей: дешевые
+задачи (исправить опечатку и привести слово к начальной форме) идут в
+легкую модель, полные объяснения — в сильную. Если у модели исчерпана
+квота или открыт предохранитель, запрос сразу уходит в модель другого
+уровня. По каждому маршруту считаются задержка (для потоковых ответов —
+и до первой части), токены и оценка расходов.
+"""
+
+import logging
+import time
+from typing import AsyncIterator, Dict, List
+
+from config import GEMINI_MODEL_LIGHT, GEMINI_MODEL_PRICES, GEMINI_MODEL_STRONG
+from resilience import INTERACTIVE, GeminiUnavailable, is_transient
+
+logger = logging.getLogger(__name__)
+
+LIGHT = 'light'
+STRONG = 'strong'
+
+# Маршрут -> уровень модели
+ROUTES = {
+    'normalize': LIGHT,       # исправление опечатки и начальная форма слова
+    'explain': STRONG,        # полное объяснение слова
+    'suggest': STRONG,        # умное слово для /random и рассылки
+    'suggest_batch': STRONG,  # пакет умных слов для рассылки и пула
+    'import': STRONG,         # объяснения при импорте
+}
+
+
+class Route:
+    """Маршрут с интерфейсом GeminiClient (generate) — для WordImporter и т.п."""
+
+    def __init__(self, router: 'ModelRouter', name: str):
+        self.router = router
+        self.name = name
+
+    async def generate(self, prompt: str, priority: int = INTERACTIVE) -> str:
+        return await self.router.generate(self.name, prompt, priority)
+
+
+class ModelRouter:
+    """Выбор модели по маршруту с переходом на запасную модель"""
+
+    def __init__(self, client, factory, tiers: Dict[str, List[str]] = None,
+                 routes: Dict[str, str] = None, prices: Dict = None):
+        """
+        Args:
+            client: GeminiClient (очередь, квоты, повторы)
+            factory: Создает модель по имени (genai.GenerativeModel)
+            tiers: Уровень -> имена моделей по порядку предпочтения
+            routes: Маршрут -> уровень (по умолчанию ROUTES)
+            prices: Модель -> (USD за 1 млн токенов ввода, вывода)
+        """
+        self.client = client
+        self.factory = factory
+        self.tiers = tiers or {LIGHT: [GEMINI_MODEL_LIGHT], STRONG: [GEMINI_MODEL_STRONG]}
+        self.routes = routes or ROUTES
+        self.prices = GEMINI_MODEL_PRICES if prices is None else prices
+        self.available = None  # модели ключа по данным check_models (None — не проверяли)
+        self._models = {}
+        self._stats = {}
+
+    def set_available(self, names):
+        """Ограничить маршруты моделями, доступными ключу (None — без ограничений)"""
+        self.available = set(names) if names is not None else None
+
+    def chain(self, route: str) -> List[str]:
+        """Модели маршрута по порядку: свой уровень, затем остальные как запасные"""
+        tier = self.routes[route]
+        names = list(self.tiers[tier])
+        for other, models in self.tiers.items():
+            if other != tier:
+                names += models
+        names = list(dict.fromkeys(names))
+        if self.available is not None:
+            # Если ни одной модели нет в списке, пробуем настроенные — пусть ответит API
+            names = [name for name in names if name in self.available] or names
+        return names
+
+    def model(self, name: str):
+        """Экземпляр модели (создается при первом обращении)"""
+        if name not in self._models:
+            self._models[name] = self.factory(name)
+        return self._models[name]
+
+    def route(self, name: str) -> Route:
+        return Route(self, name)
+
+    def retry_in(self, route: str) -> float:
+        """Через сколько секунд хоть одна модель маршрута примет запрос"""
+        return min(self.client.retry_in(self.model(name)) for name in self.chain(route))
+
+    async def generate(self, route: str, prompt: str, priority: int = INTERACTIVE) -> str:
+        """Ответ модели маршрута (при исчерпании квоты — запасной модели)"""
+        stats = self._route_stats(route)
+        chain = self.chain(route)
+        started = time.monotonic()
+        for i, name in enumerate(chain):
+            has_fallback = i < len(chain) - 1
+            try:
+                response = await self.client.generate_response(
+                    prompt, priority, model=self.model(name), fallback=has_fallback
+                )
+            except Exception as e:
+                if has_fallback and (isinstance(e, GeminiUnavailable) or is_transient(e)):
+                    stats['fallbacks'] += 1
+                    logger.warning(f"⚠️ {name} недоступна для «{route}» ({e}), переходим на {chain[i + 1]}")
+                    continue
+                stats['errors'] += 1
+                stats['seconds'] += time.monotonic() - started
+                raise
+
+            self._record(stats, name, prompt, response.text, getattr(response, 'usage_metadata', None),
+                         time.monotonic() - started)
+            return response.text
+
+    async def stream(self, route: str, prompt: str, priority: int = INTERACTIVE) -> AsyncIterator[str]:
+        """
+        Текст ответа по частям по мере генерации
+
+        На запасную модель переходим, только пока не получена первая часть.
+        """
+        stats = self._route_stats(route)
+        chain = self.chain(route)
+        started = time.monotonic()
+        for i, name in enumerate(chain):
+            has_fallback = i < len(chain) - 1
+            parts, usage, first_chunk = [], None, 0.0
+            try:
+                async for chunk in self.client.stream_response(
+                    prompt, priority, model=self.model(name), fallback=has_fallback
+                ):
+                    if not parts:
+                        first_chunk = time.monotonic() - started
+                    parts.append(chunk.text)
+                    # В потоке итоговое число токенов приходит с последней частью
+                    usage = getattr(chunk, 'usage_metadata', None) or usage
+                    yield chunk.text
+            except Exception as e:
+                if not parts and has_fallback and (isinstance(e, GeminiUnavailable) or is_transient(e)):
+                    stats['fallbacks'] += 1
+                    logger.warning(f"⚠️ {name} недоступна для «{route}» ({e}), переходим на {chain[i + 1]}")
+                    continue
+                stats['errors'] += 1
+                stats['seconds'] += time.monotonic() - started
+                raise
+
+            stats['streams'] += 1
+            stats['first_chunk_seconds'] += first_chunk
+            self._record(stats, name, prompt, "".join(parts), usage, time.monotonic() - started)
+            return
+
+    def _route_stats(self, route: str) -> Dict:
+        if route not in self._stats:
+            self._stats[route] = {
+                'calls': 0, 'errors': 0, 'fallbacks': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                'streams': 0, 'first_chunk_seconds': 0.0,
+                'input_tokens': 0, 'output_tokens': 0, 'cost_usd': 0.0, 'models': {},
+            }
+        return self._stats[route]
+
+    def _record(self, stats: Dict, name: str, prompt: str, text: str, usage, seconds: float):
+        # Без usage_metadata оцениваем грубо: ~4 символа на токен
+        input_tokens = getattr(usage, 'prompt_token_count', None) or len(prompt) // 4
+        output_tokens = getattr(usage, 'candidates_token_count', None) or len(text) // 4
+        input_price, output_price = self.prices.get(name, (0.0, 0.0))
+
+        stats['calls'] += 1
+        stats['seconds'] += seconds
+        stats['max_seconds'] = max(stats['max_seconds'], seconds)
+        stats['input_tokens'] += input_tokens
+        stats['output_tokens'] += output_tokens
+        stats['cost_usd'] += (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+        stats['models'][name] = stats['models'].get(name, 0) + 1
+
+    def stats(self) -> Dict:
+        """По маршрутам: вызовы, ошибки, переходы на запасную модель, задержка, токены, расходы"""
+        result = {}
+        for route, stats in self._stats.items():
+            finished = stats['calls'] + stats['errors']
+            result[route] = {
+                **stats,
+                'models': dict(stats['models']),
+                'avg_seconds': stats['seconds'] / finished if finished else 0.0,
+                'avg_first_chunk_seconds': stats['first_chunk_seconds'] / stats['streams'] if stats['streams'] else 0.0,
+                'cost_usd': round(stats['cost_usd'], 6),
+            }
+        return result
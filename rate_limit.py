@@ -0,0 +1,47 @@
+"""
+Ограничение частоты запросов (token bucket)
+
+Ведро пополняется со скоростью rate токенов в секунду и вмещает
+не больше capacity токенов. Каждый запрос забирает токен или ждет,
+пока он появится.
+"""
+
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Асинхронный token bucket"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        """
+        Args:
+            rate: Скорость пополнения (токенов в секунду)
+            capacity: Размер ведра (допустимый всплеск), по умолчанию max(1, rate)
+        """
+        if rate <= 0:
+            raise ValueError("rate должен быть положительным")
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Забрать токены без ожидания. False, если их не хватает"""
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    async def acquire(self, tokens: float = 1.0):
+        """Дождаться и забрать токены (ожидающие обслуживаются по очереди)"""
+        async with self._lock:
+            while not self.try_acquire(tokens):
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
@@ -0,0 +1,233 @@
+"""
+Устойчивость обращений к Gemini
+
+Квота считается по каждой модели отдельно (token bucket), ошибки 429 и
+перегрузки API повторяются с экспоненциальной задержкой со случайным
+разбросом (или через столько, сколько просит сам API), а после серии
+неудач срабатывает предохранитель (circuit breaker): пока он открыт,
+интерактивные запросы сразу получают отказ, и пользователь видит кнопку
+"Повторить", вместо того чтобы ждать минуту.
+
+Очередь к API приоритетная: запрос слова пользователем обгоняет
+генерацию рассылки и импорт.
+"""
+
+import asyncio
+import heapq
+import itertools
+import random
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from rate_limit import TokenBucket
+
+# Приоритеты очереди (меньше — раньше)
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# Классы исключений google.api_core, после которых запрос имеет смысл повторить
+_TRANSIENT_ERRORS = {'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable',
+                     'InternalServerError', 'DeadlineExceeded'}
+_RETRY_HINTS = (
+    re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE),
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)"),
+)
+
+
+class GeminiUnavailable(Exception):
+    """API перегружено: предохранитель открыт или ждать ответа слишком долго"""
+
+    def __init__(self, retry_in: float):
+        super().__init__(f"Gemini недоступен, повтор через {retry_in:.0f} с")
+        self.retry_in = retry_in
+
+
+def is_rate_limit(error: Exception) -> bool:
+    """Ошибка превышения квоты (429)"""
+    text = str(error)
+    return (type(error).__name__ in ('ResourceExhausted', 'TooManyRequests')
+            or "429" in text or "Resource exhausted" in text)
+
+
+def is_transient(error: Exception) -> bool:
+    """Временная ошибка API: квота, перегрузка, таймаут"""
+    text = str(error)
+    return (is_rate_limit(error) or type(error).__name__ in _TRANSIENT_ERRORS
+            or "503" in text or "500 Internal" in text)
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Сколько секунд просит подождать API (атрибут retry_after или текст ошибки)"""
+    value = getattr(error, 'retry_after', None)
+    if isinstance(value, (int, float)):
+        return float(value)
+    for pattern in _RETRY_HINTS:
+        match = pattern.search(str(error))
+        if match:
+            return float(match.group(1))
+    return None
+
+
+def backoff_delay(attempt: int, base: float, cap: float, hint: float = None) -> float:
+    """
+    Задержка перед повтором номер attempt (с нуля)
+
+    Экспонента с полным разбросом (0..base*2^attempt, не больше cap), чтобы
+    одновременно упавшие запросы не вернулись в API одной волной. Подсказку
+    API (retry-after) соблюдаем всегда, даже если она больше cap.
+    """
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    return max(delay, hint) if hint else delay
+
+
+class CircuitBreaker:
+    """
+    Предохранитель: closed -> open после failure_threshold неудач подряд
+    (или сразу на время, которое назвал API), open -> half-open по истечении
+    срока: пропускается один пробный запрос, успех закрывает предохранитель
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_until = 0.0
+        self.opens = 0
+        self._probe_started = None
+
+    @property
+    def state(self) -> str:
+        if not self.opened_until:
+            return 'closed'
+        return 'open' if time.monotonic() < self.opened_until else 'half-open'
+
+    def retry_in(self) -> float:
+        """Сколько секунд до пробного запроса (при закрытом предохранителе — 0)"""
+        return max(0.0, self.opened_until - time.monotonic())
+
+    def allow(self) -> bool:
+        """Можно ли отправить запрос сейчас"""
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'open':
+            return False
+        # half-open: один пробный запрос; зависший пробный через reset_timeout уступает место
+        now = time.monotonic()
+        if self._probe_started is not None and now - self._probe_started < self.reset_timeout:
+            return False
+        self._probe_started = now
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_until = 0.0
+        self._probe_started = None
+
+    def record_failure(self, hint: float = None):
+        """Учесть временную ошибку; hint — задержка, которую назвал API"""
+        self.failures += 1
+        probe_failed = self._probe_started is not None
+        self._probe_started = None
+        if self.failures >= self.failure_threshold or probe_failed:
+            self._open(max(self.reset_timeout, hint or 0))
+        elif hint:
+            self._open(hint)
+
+    def _open(self, seconds: float):
+        if self.state != 'open':
+            self.opens += 1
+        self.opened_until = max(self.opened_until, time.monotonic() + seconds)
+
+
+class PriorityGate:
+    """Семафор, в котором ожидающие обслуживаются по приоритету (при равном — по очереди)"""
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.active = 0
+        self._waiters = []  # куча (приоритет, номер, future)
+        self._counter = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def acquire(self, priority: int = INTERACTIVE):
+        if self.active < self.max_concurrency and not self.waiting:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Место уже передали нам — отдаем следующему
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        # Место переходит первому живому ожидающему, иначе освобождается
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int = INTERACTIVE):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class ModelQuota:
+    """Квота и предохранитель одной модели со счетчиками запросов"""
+
+    def __init__(self, rpm: float, failure_threshold: int, reset_timeout: float):
+        """
+        Args:
+            rpm: Лимит запросов к модели в минуту
+            failure_threshold: Неудач подряд до срабатывания предохранителя
+            reset_timeout: Сколько секунд предохранитель открыт
+        """
+        # Квота API минутная: небольшой всплеск (запросы за 6 секунд) допустим
+        self.bucket = TokenBucket(rpm / 60, capacity=max(1.0, rpm / 10))
+        # Токены квоты раздаются по приоритету: интерактивный запрос не стоит за рассылкой
+        self._turn = PriorityGate(1)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.requests = 0
+        self.rate_limited = 0
+        self.failures = 0
+        self.rejected = 0
+
+    async def acquire(self, priority: int = INTERACTIVE):
+        """Дождаться токена квоты"""
+        async with self._turn.slot(priority):
+            await self.bucket.acquire()
+        self.requests += 1
+
+    def record_success(self):
+        self.breaker.record_success()
+
+    def record_failure(self, error: Exception):
+        self.failures += 1
+        if is_rate_limit(error):
+            self.rate_limited += 1
+        self.breaker.record_failure(retry_after(error))
+
+    def stats(self) -> Dict:
+        return {
+            'requests': self.requests,
+            'rate_limited': self.rate_limited,
+            'failures': self.failures,
+            'rejected': self.rejected,
+            'breaker': self.breaker.state,
+            'breaker_opens': self.breaker.opens,
+        }
@@ -0,0 +1,72 @@
+"""
+Бенчмарк конвертера Markdown: старый (8 проходов re.sub) против однопроходного
+
+Тексты берутся из эталонного корпуса test_data/markdown.
+
+Запуск: python scripts/bench_markdown.py [кол-во повторов]
+"""
+
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from markdown_converter import md_to_telegram_html, split_message
+
+CORPUS_DIR = os.path.join(ROOT, "test_data", "markdown")
+
+
+def legacy_md_to_telegram_html(text: str) -> str:
+    """Старое поведение: экранирование и восемь последовательных re.sub"""
+    if not text:
+        return text
+    text = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    text = re.sub(r'```(?:\w+)?\n?(.*?)```', r'<pre>\1</pre>', text, flags=re.DOTALL)
+    text = re.sub(r'`([^`]+)`', r'<code>\1</code>', text)
+    text = re.sub(r'\*\*(.+?)\*\*', r'<b>\1</b>', text)
+    text = re.sub(r'__(.+?)__', r'<b>\1</b>', text)
+    text = re.sub(r'(?<!\w)\*([^*]+?)\*(?!\w)', r'<i>\1</i>', text)
+    text = re.sub(r'(?<!\w)_([^_]+?)_(?!\w)', r'<i>\1</i>', text)
+    text = re.sub(r'~~(.+?)~~', r'<s>\1</s>', text)
+    text = re.sub(r'\[([^\]]+)\]\(([^)]+)\)', r'<a href="\2">\1</a>', text)
+    text = re.sub(r'^#{1,6}\s+(.+)$', r'<b>\1</b>', text, flags=re.MULTILINE)
+    return text
+
+
+def load_corpus() -> list:
+    texts = []
+    for name in sorted(os.listdir(CORPUS_DIR)):
+        if name.endswith(".md"):
+            with open(os.path.join(CORPUS_DIR, name), encoding="utf-8") as f:
+                texts.append(f.read())
+    return texts
+
+
+def measure(convert, texts: list, rounds: int) -> float:
+    """Среднее время конвертации одного текста в микросекундах"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text in texts:
+            convert(text)
+    return (time.perf_counter() - start) / (rounds * len(texts)) * 1_000_000
+
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    texts = load_corpus()
+    # Длинный ответ (склейка корпуса) — проверяем и конвертацию, и нарезку под лимит Telegram
+    long_text = "\n\n".join(texts * 10)
+
+    print(f"Корпус: {len(texts)} текстов, повторов: {rounds}\n")
+    print(f"{'Вариант':>16} | {'корпус, мкс':>12} | {'длинный, мкс':>13}")
+    for title, convert in (("старый", legacy_md_to_telegram_html), ("однопроходный", md_to_telegram_html)):
+        short = measure(convert, texts, rounds)
+        long = measure(convert, [long_text], max(1, rounds // 50))
+        print(f"{title:>16} | {short:>12.1f} | {long:>13.1f}")
+
+    html_text = md_to_telegram_html(long_text)
+    split = measure(split_message, [html_text], max(1, rounds // 50))
+    print(f"\nsplit_message ({len(split_message(html_text))} сообщений): {split:.1f} мкс")
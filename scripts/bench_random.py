@@ -0,0 +1,81 @@
+"""
+Бенчмарк случайной выборки: ORDER BY RANDOM() против индекса (user_id, rand_key)
+
+Запуск: python scripts/bench_random.py [кол-во выборок]
+"""
+
+import os
+import sys
+import random
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database, word_key
+
+SIZES = [10_000, 50_000, 100_000]
+
+
+class LegacyDatabase(Database):
+    """Старое поведение: сортировка всего словаря пользователя"""
+
+    def get_random_word(self, user_id: int):
+        conn = self.get_connection()
+        try:
+            cursor = self.get_cursor(conn)
+            cursor.execute("SELECT id, word, definition, context, created_at FROM words "
+                           "WHERE user_id = ? ORDER BY RANDOM() LIMIT 1", (user_id,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+        finally:
+            self.release_connection(conn)
+
+
+def fill(db: Database, user_id: int, count: int):
+    """Быстро залить count слов одному пользователю (плюс шум от соседа)"""
+    conn = db.get_connection()
+    try:
+        conn.execute("INSERT OR IGNORE INTO users (user_id) VALUES (?)", (user_id,))
+        rows = []
+        for owner in (user_id, user_id + 1):
+            for i in range(count):
+                word = f"слово{i}"
+                rows.append((owner, word, word_key(word), "определение " * 20, random.random()))
+        conn.executemany("INSERT INTO words (user_id, word, word_key, definition, rand_key) VALUES (?, ?, ?, ?, ?)", rows)
+        conn.commit()
+    finally:
+        db.release_connection(conn)
+
+
+def measure(db: Database, user_id: int, samples: int) -> float:
+    """Среднее время одной выборки в миллисекундах"""
+    start = time.perf_counter()
+    for _ in range(samples):
+        db.get_random_word(user_id)
+    return (time.perf_counter() - start) / samples * 1000
+
+
+if __name__ == "__main__":
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    user_id = 1
+
+    print(f"Выборок на замер: {samples}")
+    print(f"{'слов':>8} {'RANDOM(), мс':>14} {'rand_key, мс':>14} {'ускорение':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in SIZES:
+            path = os.path.join(tmp, f"bench_{size}.db")
+            db = Database(path)
+            try:
+                fill(db, user_id, size)
+                after = measure(db, user_id, samples)
+            finally:
+                db.close()
+
+            legacy = LegacyDatabase(path)
+            try:
+                before = measure(legacy, user_id, samples)
+            finally:
+                legacy.close()
+
+            print(f"{size:>8} {before:>14.3f} {after:>14.3f} {before / after:>9.0f}x")
@@ -0,0 +1,69 @@
+"""
+Бенчмарк SQLite: соединение на каждый вызов против долгоживущего соединения с WAL
+
+Запуск: python scripts/bench_sqlite.py [кол-во операций]
+"""
+
+import os
+import sys
+import sqlite3
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+
+class LegacyDatabase(Database):
+    """Старое поведение: новое соединение на каждый вызов, без PRAGMA"""
+
+    def get_connection(self):
+        conn = sqlite3.connect(self.db_url)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def release_connection(self, conn):
+        conn.close()
+
+
+def run_workload(db: Database, operations: int) -> float:
+    """Смесь типичных операций бота. Возвращает операций в секунду"""
+    user_id = 1
+    for i in range(50):
+        db.add_word(user_id, f"слово{i}", "определение " * 50)
+
+    start = time.perf_counter()
+    for i in range(operations):
+        kind = i % 4
+        if kind == 0:
+            db.get_dictionary_data(user_id, limit=5, offset=(i % 10) * 5)
+        elif kind == 1:
+            db.get_word_by_id(1 + i % 50)
+        elif kind == 2:
+            db.get_user_stats(user_id)
+        else:
+            db.add_word(user_id, f"новое{i}", "определение")
+    elapsed = time.perf_counter() - start
+    return operations / elapsed
+
+
+def bench(cls, operations: int) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        db = cls(os.path.join(tmp, "bench.db"))
+        try:
+            return run_workload(db, operations)
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    ops = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    before = bench(LegacyDatabase, ops)
+    after = bench(Database, ops)
+
+    print(f"Операций: {ops}")
+    print(f"До  (connect на вызов): {before:10.0f} оп/с")
+    print(f"После (WAL + PRAGMA):   {after:10.0f} оп/с")
+    print(f"Ускорение: x{after / before:.1f}")
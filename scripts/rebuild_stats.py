@@ -0,0 +1,28 @@
+"""
+Пересчет таблицы user_stats по таблице words (если счетчики разошлись)
+
+Использование: python scripts/rebuild_stats.py [DATABASE_URL] [USER_ID]
+Без DATABASE_URL берется переменная окружения или vocabulary.db
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+
+def rebuild(db_url: str = None, user_id: int = None):
+    db = Database(db_url or os.getenv('DATABASE_URL'))
+    try:
+        rebuilt = db.rebuild_user_stats(user_id)
+        print(f"✅ Пересчитана статистика пользователей: {rebuilt}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    url = sys.argv[1] if len(sys.argv) > 1 else None
+    uid = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    rebuild(url, uid)
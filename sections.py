@@ -0,0 +1,79 @@
+"""
+Разделы объяснения слова
+
+Объяснение от Gemini строится по WORD_FORMAT_INSTRUCTIONS: заголовки
+разделов с эмодзи (**📝 Краткое определение:** и т.д.). Готовый HTML
+хранится целиком для показа, а рядом — разделы по отдельности (JSON) и
+краткое определение обычным текстом для списков, квизов и поиска.
+"""
+
+import html
+import json
+import re
+from typing import Dict, Tuple
+
+# Ключ раздела по эмодзи из WORD_FORMAT_INSTRUCTIONS (порядок как в объяснении)
+SECTION_KEYS = {
+    '📝': 'short',
+    '🔍': 'context',
+    '💬': 'examples',
+    '🔄': 'synonyms',
+    '🧠': 'etymology',
+    '💡': 'fact',
+}
+
+# Максимальная длина краткого определения (символов)
+SHORT_DEFINITION_LENGTH = 200
+
+_TAG = re.compile(r"<[^>]+>")
+# Строка-заголовок раздела: <b>📝 Краткое определение:</b> (текст может идти следом)
+_HEADER = re.compile(r"^<b>\s*(?P<emoji>\S+)\s[^<]*</b>:?[ \t]*(?P<rest>.*)$")
+
+
+def html_to_text(text: str) -> str:
+    """HTML Telegram -> обычный текст"""
+    return html.unescape(_TAG.sub("", text or ""))
+
+
+def parse_sections(html_text: str) -> Dict[str, str]:
+    """
+    Разбить HTML объяснения на разделы
+
+    Returns:
+        {ключ из SECTION_KEYS: HTML раздела без заголовка}. Текст до первого
+        заголовка попадает в 'intro'. Пустой словарь, если заголовков нет.
+    """
+    sections = {}
+    key, lines = 'intro', []
+    found = False
+    for line in (html_text or "").splitlines():
+        header = _HEADER.match(line.strip())
+        if header and header.group('emoji') in SECTION_KEYS:
+            if "\n".join(lines).strip():
+                sections[key] = "\n".join(lines).strip()
+            key, lines = SECTION_KEYS[header.group('emoji')], [header.group('rest')]
+            found = True
+        else:
+            lines.append(line)
+    if not found:
+        return {}
+    if "\n".join(lines).strip():
+        sections[key] = "\n".join(lines).strip()
+    return sections
+
+
+def short_definition(html_text: str, sections: Dict[str, str] = None) -> str:
+    """Краткое определение обычным текстом: раздел 📝 или первая непустая строка"""
+    if sections is None:
+        sections = parse_sections(html_text)
+    source = sections.get('short') or html_text or ""
+    text = next((line.strip() for line in html_to_text(source).splitlines() if line.strip()), "")
+    if len(text) > SHORT_DEFINITION_LENGTH:
+        text = text[:SHORT_DEFINITION_LENGTH - 1].rstrip() + "…"
+    return text
+
+
+def split_explanation(html_text: str) -> Tuple[str, str]:
+    """Поля для БД: (краткое определение, разделы в JSON)"""
+    sections = parse_sections(html_text)
+    return short_definition(html_text, sections), json.dumps(sections, ensure_ascii=False)
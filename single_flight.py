@@ -0,0 +1,52 @@
+"""
+Объединение одинаковых одновременных запросов (single-flight)
+
+Когда одно слово в тренде, десятки пользователей присылают его почти
+одновременно. Первый запрос по ключу выполняется, остальные ждут его
+результат, а не идут в Gemini сами: одна попытка на уникальное слово.
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """Один выполняющийся запрос на ключ, остальные вызовы ждут его результат"""
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.executed = 0
+        self.coalesced = 0
+        self.coalesced_wait = 0.0  # суммарное ожидание присоединившихся (секунды)
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Выполнить func() или дождаться уже идущего вызова с тем же ключом
+
+        Ошибка выполнения получают все ожидающие; следующий вызов начнет заново.
+        Отмена одного ожидающего не отменяет общий запрос.
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            self.executed += 1
+            task = asyncio.ensure_future(func())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+            return await asyncio.shield(task)
+
+        self.coalesced += 1
+        started = time.monotonic()
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self.coalesced_wait += time.monotonic() - started
+
+    def stats(self) -> Dict:
+        """Счетчики: выполнено запросов, присоединилось к идущим, среднее ожидание"""
+        return {
+            'executed': self.executed,
+            'coalesced': self.coalesced,
+            'in_flight': len(self._in_flight),
+            'avg_coalesced_wait': self.coalesced_wait / self.coalesced if self.coalesced else 0.0,
+        }
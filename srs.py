@@ -0,0 +1,71 @@
+"""
+Интервальные повторения (алгоритм SM-2)
+
+У каждого слова есть легкость (ease), интервал в днях и число успешных
+повторений подряд. По оценке ответа считается следующий интервал, а в БД
+хранится момент следующего показа (due_at).
+"""
+
+from typing import NamedTuple
+
+# Оценки ответа (шкала SM-2: 0-5, ниже 3 — слово забыто)
+AGAIN, HARD, GOOD, EASY = 0, 3, 4, 5
+
+GRADE_LABELS = {
+    AGAIN: "❌ Забыл",
+    HARD: "😓 Трудно",
+    GOOD: "🙂 Хорошо",
+    EASY: "😎 Легко",
+}
+
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+# Забытое слово возвращается в ту же сессию повторения
+RELEARN_MINUTES = 10
+
+
+class Schedule(NamedTuple):
+    """Состояние слова после ответа"""
+    ease: float
+    interval_days: int
+    repetitions: int
+
+    @property
+    def delay_minutes(self) -> int:
+        """Через сколько минут показать слово снова"""
+        return self.interval_days * 24 * 60 if self.interval_days else RELEARN_MINUTES
+
+
+def next_schedule(ease: float, interval_days: int, repetitions: int, grade: int) -> Schedule:
+    """
+    Рассчитать следующий показ по оценке ответа
+
+    Args:
+        ease: Текущая легкость слова
+        interval_days: Текущий интервал (дни)
+        repetitions: Успешных повторений подряд
+        grade: Оценка 0-5 (AGAIN, HARD, GOOD, EASY)
+    """
+    if not 0 <= grade <= 5:
+        raise ValueError("grade должен быть от 0 до 5")
+
+    ease = max(MIN_EASE, ease + 0.1 - (5 - grade) * (0.08 + (5 - grade) * 0.02))
+
+    if grade < 3:
+        return Schedule(round(ease, 2), 0, 0)
+
+    if repetitions == 0:
+        interval_days = 1
+    elif repetitions == 1:
+        interval_days = 6
+    else:
+        interval_days = max(interval_days + 1, round(interval_days * ease))
+
+    return Schedule(round(ease, 2), interval_days, repetitions + 1)
+
+
+def format_delay(minutes: int) -> str:
+    """Человекочитаемый интервал: '10 мин', '6 дн.'"""
+    if minutes < 24 * 60:
+        return f"{minutes} мин"
+    return f"{minutes // (24 * 60)} дн."
@@ -0,0 +1,74 @@
+"""
+Временное состояние диалогов с временем жизни
+
+Предложенное слово хранится под коротким случайным токеном, который
+передается в callback_data кнопки "Сохранить": у каждого сообщения свой
+токен, поэтому кнопка сохраняет именно свое слово, даже если открыто
+несколько предложений, и переживает перезапуск бота. Записи живут в
+таблице ephemeral_state и удаляются фоновой задачей после истечения срока.
+"""
+
+import json
+import secrets
+from typing import Any, List, Optional, Tuple
+
+from config import SUGGESTION_TTL, SUGGESTED_WORDS_TTL
+
+# Префикс callback_data кнопки сохранения: save_word:<токен>
+SAVE_CALLBACK_PREFIX = "save_word:"
+# Сколько последних предложенных слов помнить, чтобы не повторяться
+RECENT_SUGGESTIONS_LIMIT = 15
+
+
+def new_token() -> str:
+    """Короткий непредсказуемый токен (8 символов, влезает в лимит callback_data)"""
+    return secrets.token_urlsafe(6)
+
+
+class StateStore:
+    """Ключ-значение с TTL поверх AsyncDatabase (значения — JSON)"""
+
+    def __init__(self, db):
+        """
+        Args:
+            db: Экземпляр AsyncDatabase
+        """
+        self.db = db
+
+    async def put(self, key: str, value: Any, ttl: int):
+        await self.db.put_state(key, json.dumps(value, ensure_ascii=False), ttl)
+
+    async def get(self, key: str, delete: bool = False) -> Any:
+        raw = await self.db.get_state(key, delete=delete)
+        return json.loads(raw) if raw is not None else None
+
+    async def purge(self) -> int:
+        """Удалить истекшие записи. Возвращает число удаленных"""
+        return await self.db.purge_state()
+
+    async def put_suggestion(self, word: str, explanation: str) -> str:
+        """Запомнить предложенное слово. Возвращает callback_data для кнопки "Сохранить" """
+        token = new_token()
+        await self.put(f"suggestion:{token}", {'word': word, 'explanation': explanation}, SUGGESTION_TTL)
+        return SAVE_CALLBACK_PREFIX + token
+
+    async def get_suggestion(self, callback_data: str) -> Optional[Tuple[str, str]]:
+        """(word, explanation) по callback_data кнопки. Токен остается до discard_suggestion"""
+        payload = await self.get(self._suggestion_key(callback_data))
+        return (payload['word'], payload['explanation']) if payload else None
+
+    async def discard_suggestion(self, callback_data: str):
+        """Удалить токен после того, как слово сохранено"""
+        await self.get(self._suggestion_key(callback_data), delete=True)
+
+    @staticmethod
+    def _suggestion_key(callback_data: str) -> str:
+        return f"suggestion:{callback_data[len(SAVE_CALLBACK_PREFIX):]}"
+
+    async def recent_suggestions(self, user_id: int) -> List[str]:
+        """Слова, недавно предложенные пользователю через /random"""
+        return await self.get(f"suggested:{user_id}") or []
+
+    async def remember_suggestion(self, user_id: int, word: str):
+        recent = (await self.recent_suggestions(user_id) + [word])[-RECENT_SUGGESTIONS_LIMIT:]
+        await self.put(f"suggested:{user_id}", recent, SUGGESTED_WORDS_TTL)
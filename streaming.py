@@ -0,0 +1,152 @@
+"""
+Потоковый показ объяснения
+
+Gemini отдает ответ частями. Пока JSON ответа еще не дописан, из него
+можно достать готовое начало строки "explanation": слово с кратким
+определением появляется в чате через секунду-две, а сообщение
+дописывается правками (edit_message_text) по мере готовности разделов.
+Правки не чаще раза в STREAM_EDIT_INTERVAL секунд — лимиты Telegram.
+"""
+
+import asyncio
+import logging
+import re
+import time
+from typing import Optional, Tuple
+
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from config import STREAM_EDIT_INTERVAL
+from markdown_converter import split_message
+
+logger = logging.getLogger(__name__)
+
+_ESCAPES = {'n': "\n", 't': "\t", 'r': "\r", 'b': "\b", 'f': "\f", '"': '"', '\\': "\\", '/': "/"}
+
+
+def partial_json_string(text: str, key: str) -> Tuple[Optional[str], bool]:
+    """
+    Значение строкового поля key из недописанного JSON
+
+    Returns:
+        (текст, полностью ли получено значение); (None, False), если поле еще не началось.
+        Оборванная escape-последовательность в конце отбрасывается до следующей части.
+    """
+    match = re.search(r'"%s"\s*:\s*"' % re.escape(key), text)
+    if not match:
+        return None, False
+
+    out = []
+    i = match.end()
+    while i < len(text):
+        ch = text[i]
+        if ch == '"':
+            return "".join(out), True
+        if ch != '\\':
+            out.append(ch)
+            i += 1
+            continue
+        if i + 1 >= len(text):
+            break
+        if text[i + 1] != 'u':
+            out.append(_ESCAPES.get(text[i + 1], text[i + 1]))
+            i += 2
+            continue
+        code = _hex(text[i + 2:i + 6])
+        if code is None:
+            break
+        i += 6
+        if 0xD800 <= code < 0xDC00:
+            # Суррогатная пара (📝): ждем вторую половину
+            low = _hex(text[i + 2:i + 6]) if text[i:i + 2] == '\\u' else None
+            if low is None:
+                i -= 6
+                break
+            code = 0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)
+            i += 6
+        out.append(chr(code))
+    return "".join(out), False
+
+
+def _hex(digits: str) -> Optional[int]:
+    if len(digits) < 4:
+        return None
+    try:
+        return int(digits, 16)
+    except ValueError:
+        return None
+
+
+def completed_part(markdown: str) -> str:
+    """Законченные абзацы (до последней пустой строки) — их можно показывать"""
+    end = markdown.rfind("\n\n")
+    return markdown[:end] if end > 0 else ""
+
+
+class ProgressiveMessage:
+    """Сообщение, которое дописывается правками с ограничением частоты"""
+
+    def __init__(self, send, interval: float = None):
+        """
+        Args:
+            send: Функция отправки нового сообщения (reply_text)
+            interval: Минимальный промежуток между правками (секунды)
+        """
+        self.send = send
+        self.interval = STREAM_EDIT_INTERVAL if interval is None else interval
+        self.message = None
+        self.edits = 0
+        self._text = None
+        self._next_edit = 0.0
+
+    async def update(self, html_text: str):
+        """Показать промежуточный текст (первый — сразу, дальше — не чаще interval)"""
+        html_text = split_message(html_text)[0]
+        if html_text == self._text or time.monotonic() < self._next_edit:
+            return
+        try:
+            if self.message is None:
+                self.message = await self.send(text=html_text, parse_mode=ParseMode.HTML)
+            else:
+                await self.message.edit_text(text=html_text, parse_mode=ParseMode.HTML)
+                self.edits += 1
+            self._text = html_text
+            self._next_edit = time.monotonic() + self.interval
+        except RetryAfter as e:
+            self._next_edit = time.monotonic() + e.retry_after
+        except TelegramError as e:
+            # Промежуточный кадр не обязателен — итог все равно будет показан
+            logger.warning(f"Не удалось обновить сообщение: {e}")
+            self._next_edit = time.monotonic() + self.interval
+
+    async def finish(self, html_text: str, reply_markup=None):
+        """
+        Итоговый текст: первая часть — правкой сообщения, остальные — новыми
+        сообщениями. Клавиатура прикрепляется к последней части.
+        """
+        chunks = split_message(html_text)
+        if self.message is not None:
+            markup = reply_markup if len(chunks) == 1 else None
+            if await self._edit_final(chunks[0], markup):
+                chunks = chunks[1:]
+        for i, chunk in enumerate(chunks):
+            markup = reply_markup if i == len(chunks) - 1 else None
+            await self.send(text=chunk, reply_markup=markup, parse_mode=ParseMode.HTML)
+
+    async def _edit_final(self, html_text: str, reply_markup) -> bool:
+        """Дописать сообщение итогом. False — не вышло, итог нужно отправить заново"""
+        for _ in range(2):
+            try:
+                await self.message.edit_text(text=html_text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
+                return True
+            except RetryAfter as e:
+                # Итог важнее промежуточных кадров: ждем и пробуем еще раз
+                await asyncio.sleep(e.retry_after)
+            except BadRequest as e:
+                if "not modified" in str(e).lower():
+                    return True
+                # Сообщение удалено или недоступно
+                logger.warning(f"Не удалось дописать сообщение: {e}")
+                return False
+        return False
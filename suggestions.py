@@ -0,0 +1,107 @@
+"""
+Общие данные и разбор ответов для генерации "умных слов"
+
+Используются и одиночной генерацией (/random), и пакетной (рассылка).
+"""
+
+import json
+from typing import Dict, List, Optional, Tuple
+
+# Список клише "умных слов", которые часто предлагает AI по умолчанию
+CLICHE_WORDS = [
+    "эмпатия", "амбивалентность", "анамнез", "апроприация", "когнитивный",
+    "интроспекция", "экзистенциальный", "парадигма", "дихотомия", "абстрактный",
+    "апробация", "рефлексия", "трансцендентный", "паллиатив", "эвфемизм"
+]
+
+# Области знаний, из которых случайно выбирается тема
+THEMES = [
+    "Философия и логика", "Психология и нейронауки", "Социология и культура",
+    "Лингвистика и литература", "Экономика и право", "Искусство и архитектура",
+    "Естественные науки", "Технологии и инновации", "Политология"
+]
+
+
+# Единый формат объяснения для AI
+WORD_FORMAT_INSTRUCTIONS = """
+СТРОГИЕ ПРАВИЛА ФОРМАТИРОВАНИЯ ЭКСПЛАНАЦИИ:
+- Используй Markdown (**, *, `).
+- Каждый заголовок раздела начинай с эмодзи.
+- Пункты отмечай точкой •.
+- НЕ пиши приветствий и прощаний.
+
+СТРУКТУРА ОБЪЯСНЕНИЯ (СТРОГО СОБЛЮДАЙ ПОРЯДОК И ЭМОДЗИ):
+**📝 Краткое определение:**
+(твой текст)
+
+**🔍 Контекст использования:**
+• (твой текст)
+
+**💬 Примеры предложений:**
+• (твой текст)
+
+**🔄 Синонимы:**
+• (твой текст)
+
+**🧠 Происхождение слова:**
+(твой текст)
+
+**💡 Интересный факт:**
+(твой текст)
+"""
+
+
+def exclusion_list(existing_words: List[Dict], exclude_words: List[str] = None) -> List[str]:
+    """
+    Слова, которые нельзя предлагать пользователю.
+
+    Если словарь пуст, возвращает клише, чтобы форсить новизну.
+    """
+    context_words = [w['word'].lower() for w in existing_words] if existing_words else []
+    if exclude_words:
+        context_words.extend([w.lower() for w in exclude_words])
+    return context_words or list(CLICHE_WORDS)
+
+
+def extract_json(text: str):
+    """Достать JSON из ответа модели (с очисткой от ```json блоков)"""
+    if "```json" in text:
+        text = text.split("```json")[1].split("```")[0]
+    elif "```" in text:
+        text = text.split("```")[1].split("```")[0]
+    return json.loads(text.strip())
+
+
+def parse_suggestion_batch(data, exclusions: List[List[str]]) -> List[Optional[Tuple[str, str]]]:
+    """
+    Проверить пакетный ответ модели по каждому элементу.
+
+    Args:
+        data: Разобранный JSON — массив объектов {"user": N, "word": ..., "explanation": ...}
+        exclusions: Списки исключений по порядку пользователей в запросе
+
+    Returns:
+        Список (word, explanation_markdown) или None для невалидных/пропущенных элементов
+    """
+    results = [None] * len(exclusions)
+    if not isinstance(data, list):
+        return results
+
+    for entry in data:
+        if not isinstance(entry, dict):
+            continue
+        index = entry.get('user')
+        word = entry.get('word')
+        explanation = entry.get('explanation')
+        if not isinstance(index, int) or not 1 <= index <= len(exclusions):
+            continue
+        if not isinstance(word, str) or not word.strip() or not isinstance(explanation, str) or not explanation.strip():
+            continue
+
+        word = word.strip()
+        if results[index - 1] is not None or word.lower() in exclusions[index - 1]:
+            continue
+
+        results[index - 1] = (word, explanation)
+
+    return results
@@ -6,7 +6,42 @@
 
 import unittest
 import os
+import asyncio
+import json
+import csv
+import io
+import importlib.util
+import sqlite3
+from unittest.mock import patch
 from database import Database
+from async_database import AsyncDatabase
+from gemini_client import GeminiClient
+from model_router import LIGHT, STRONG, ModelRouter
+from check_models import probe_models
+from resilience import BACKGROUND, INTERACTIVE, CircuitBreaker, GeminiUnavailable, PriorityGate, backoff_delay, retry_after
+from explanation_cache import ExplanationCache
+from single_flight import SingleFlight
+from hot_cache import HotCache, MemoryBackend, RedisBackend
+from state_store import SAVE_CALLBACK_PREFIX, RECENT_SUGGESTIONS_LIMIT, StateStore
+from rate_limit import TokenBucket
+from broadcast import BroadcastEngine
+from suggestions import CLICHE_WORDS, THEMES, exclusion_list, extract_json, parse_suggestion_batch
+from word_pool import WordPool
+from importer import WordImporter, read_rows, parse_explanations
+from exporter import FORMATS, ExportError, available_formats, export_words, html_to_text
+from migration import Migrator, MigrationError
+from markdown_converter import md_to_telegram_html, split_message, visible_length
+from streaming import ProgressiveMessage, completed_part, partial_json_string
+from compression import COMPRESS_MIN_LENGTH, compress_text, decompress_text
+from sections import parse_sections, short_definition, SHORT_DEFINITION_LENGTH
+from srs import AGAIN, HARD, GOOD, EASY, DEFAULT_EASE, MIN_EASE, RELEARN_MINUTES, next_schedule
+
+
+def remove_test_db(path: str):
+    """Удалить файл тестовой БД вместе с файлами журнала WAL"""
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
 
 
 class TestDatabase(unittest.TestCase):
@@ -20,8 +55,8 @@ class TestDatabase(unittest.TestCase):
     
     def tearDown(self):
         """Удаляем тестовую БД после каждого теста"""
-        if os.path.exists(self.test_db_path):
-            os.remove(self.test_db_path)
+        self.db.close()
+        remove_test_db(self.test_db_path)
     
     def test_add_word(self):
         """Тест добавления слова"""
@@ -70,6 +105,32 @@ class TestDatabase(unittest.TestCase):
         self.assertIsNotNone(word)
         self.assertEqual(word['word'], "случайное")
     
+    def test_random_word_wraps_around(self):
+        """Если после случайной точки слов нет, выборка идет с начала"""
+        for i in range(3):
+            self.db.add_word(self.test_user_id, f"слово{i}", "определение")
+        self.db.add_word(999, "чужое", "определение")
+        conn = self.db.get_connection()
+        conn.execute("UPDATE words SET rand_key = 0.1 * id")
+        conn.commit()
+        self.db.release_connection(conn)
+        
+        with patch('database.random.random', return_value=0.99):
+            word = self.db.get_random_word(self.test_user_id)
+        self.assertEqual(word['word'], "слово0")
+    
+    def test_words_to_review(self):
+        """На повторение попадают только давно не повторенные слова"""
+        for i in range(12):
+            self.db.add_word(self.test_user_id, f"слово{i}", "определение")
+        fresh_id = self.db.add_word(self.test_user_id, "свежее", "определение")
+        self.db.update_last_reviewed(fresh_id)
+    
+        words = self.db.get_words_to_review(self.test_user_id)
+        self.assertEqual(len(words), 10)
+        self.assertEqual(len({w['id'] for w in words}), 10)
+        self.assertNotIn(fresh_id, [w['id'] for w in words])
+    
     def test_get_user_stats(self):
         """Тест получения статистики"""
         # Добавляем слова
@@ -107,6 +168,1635 @@ class TestDatabase(unittest.TestCase):
         words = self.db.get_user_words(self.test_user_id)
         self.assertEqual(len(words), 1)
         self.assertEqual(words[0]['definition'], "второе")
+        self.assertEqual(word_id1, word_id2)
+    
+    def test_duplicate_word_case_insensitive(self):
+        """Регистр кириллицы не создает дубликат"""
+        self.db.add_word(self.test_user_id, "Апробация", "первое")
+        self.db.add_word(self.test_user_id, "АПРОБАЦИЯ", "второе")
+        
+        words = self.db.get_user_words(self.test_user_id)
+        self.assertEqual(len(words), 1)
+        self.assertEqual(self.db.get_user_stats(self.test_user_id)['total_words'], 1)
+    
+    def test_new_word_counted_when_id_matches_user(self):
+        """Новое слово учитывается, даже если его id совпал с rowid только что добавленного пользователя"""
+        self.db.add_word(1, "первое", "определение")
+        
+        self.assertEqual(self.db.get_user_stats(1)['total_words'], 1)
+    
+    def test_duplicates_merged_on_migration(self):
+        """Старая БД с дубликатами: слова сливаются, дата добавления и повторения сохраняются"""
+        conn = self.db.get_connection()
+        conn.execute("DROP INDEX idx_words_user_key")
+        conn.execute("""
+            INSERT INTO words (user_id, word, definition, created_at, repetitions, last_reviewed)
+            VALUES (?, 'Слово', 'старое', '2024-01-01 10:00:00', 3, '2024-02-01 10:00:00')
+        """, (self.test_user_id,))
+        conn.execute("INSERT INTO words (user_id, word, definition) VALUES (?, 'слово ', 'новое')", (self.test_user_id,))
+        conn.execute("UPDATE words SET word_key = NULL")
+        conn.execute("DELETE FROM schema_migrations WHERE name = 'word_keys'")
+        conn.commit()
+        self.db.release_connection(conn)
+        
+        self.db.init_db()
+        words = self.db.get_user_words(self.test_user_id)
+        self.assertEqual(len(words), 1)
+        self.assertEqual(words[0]['definition'], "новое")
+        self.assertTrue(words[0]['created_at'].startswith("2024-01-01"))
+        conn = self.db.get_connection()
+        repetitions = conn.execute("SELECT repetitions FROM words").fetchone()[0]
+        self.db.release_connection(conn)
+        self.assertEqual(repetitions, 3)
+        self.assertEqual(self.db.get_user_stats(self.test_user_id)['total_words'], 1)
+    
+    def test_data_migrations_run_once(self):
+        """Повторный init_db не выполняет разовые переносы данных заново"""
+        self.assertEqual(self.db.run_data_migrations(), [])
+        with patch.object(Database, '_migrate_word_keys') as keys, patch.object(Database, '_migrate_sections') as sections:
+            self.db.init_db()
+        keys.assert_not_called()
+        sections.assert_not_called()
+    
+    def test_ping(self):
+        """Пинг /health — простой запрос к базе"""
+        self.assertTrue(self.db.ping())
+
+
+class TestDictionaryPagination(unittest.TestCase):
+    """Тесты постраничного просмотра словаря по курсору"""
+    
+    def setUp(self):
+        self.test_db_path = "test_pages.db"
+        self.db = Database(self.test_db_path)
+        self.test_user_id = 123456789
+        # Слова с одинаковым created_at — порядок задает id
+        self.ids = [self.db.add_word(self.test_user_id, f"слово{i}", "определение") for i in range(12)]
+    
+    def tearDown(self):
+        self.db.close()
+        remove_test_db(self.test_db_path)
+    
+    def key(self, word):
+        return word['page_at'], word['id']
+    
+    def test_walk_forward_and_back(self):
+        """Страницы по курсору вперед и назад совпадают"""
+        first = self.db.get_dictionary_data(self.test_user_id, limit=5)
+        self.assertEqual(first['total_words'], 12)
+        self.assertEqual([w['id'] for w in first['words']], self.ids[::-1][:5])
+        self.assertTrue(first['has_next'])
+        self.assertFalse(first['has_prev'])
+        
+        second = self.db.get_dictionary_data(self.test_user_id, limit=5, anchor=self.key(first['words'][-1]))
+        self.assertEqual([w['id'] for w in second['words']], self.ids[::-1][5:10])
+        self.assertTrue(second['has_prev'])
+        
+        third = self.db.get_dictionary_data(self.test_user_id, limit=5, anchor=self.key(second['words'][-1]))
+        self.assertEqual(len(third['words']), 2)
+        self.assertFalse(third['has_next'])
+        
+        back = self.db.get_dictionary_data(self.test_user_id, limit=5, anchor=self.key(third['words'][0]), direction="p")
+        self.assertEqual(back['words'], second['words'])
+        
+        same = self.db.get_dictionary_data(self.test_user_id, limit=5, anchor=self.key(second['words'][0]), direction="a")
+        self.assertEqual(same['words'], second['words'])
+    
+    def test_counter_maintained(self):
+        """Счетчик слов меняется при добавлении и удалении, но не при обновлении"""
+        self.db.add_word(self.test_user_id, "слово0", "новое определение")
+        self.db.delete_word(self.ids[1], self.test_user_id)
+        self.db.delete_word(self.ids[1], self.test_user_id)
+        
+        self.assertEqual(self.db.get_dictionary_data(self.test_user_id)['total_words'], 11)
+    
+    def test_deleted_anchor(self):
+        """Курсор не зависит от строки якоря: после ее удаления страница продолжается с того же места"""
+        second = self.db.get_dictionary_data(self.test_user_id, limit=5, offset=5)
+        anchor = self.key(second['words'][0])
+        self.db.delete_word(anchor[1], self.test_user_id)
+        
+        same = self.db.get_dictionary_data(self.test_user_id, limit=5, anchor=anchor, direction="a")
+        next_page = self.db.get_dictionary_data(self.test_user_id, limit=5, anchor=anchor)
+        
+        self.assertEqual([w['id'] for w in same['words']], self.ids[::-1][6:11])
+        self.assertEqual(next_page['words'], same['words'])
+        self.assertTrue(same['has_prev'])
+
+
+class TestSpacedRepetition(unittest.TestCase):
+    """Тесты интервальных повторений (SM-2) и очереди слов к повторению"""
+    
+    def setUp(self):
+        self.test_db_path = "test_srs.db"
+        self.db = Database(self.test_db_path)
+        self.test_user_id = 123456789
+    
+    def tearDown(self):
+        self.db.close()
+        remove_test_db(self.test_db_path)
+    
+    def test_intervals_grow(self):
+        """Успешные ответы: 1 день, 6 дней, дальше интервал умножается на легкость"""
+        first = next_schedule(DEFAULT_EASE, 0, 0, GOOD)
+        second = next_schedule(first.ease, first.interval_days, first.repetitions, GOOD)
+        third = next_schedule(second.ease, second.interval_days, second.repetitions, GOOD)
+        self.assertEqual([first.interval_days, second.interval_days, third.interval_days], [1, 6, 15])
+        self.assertEqual(third.repetitions, 3)
+    
+    def test_forgotten_word_relearned(self):
+        """Забытое слово сбрасывает серию и возвращается через несколько минут"""
+        schedule = next_schedule(DEFAULT_EASE, 15, 3, AGAIN)
+        self.assertEqual(schedule.repetitions, 0)
+        self.assertEqual(schedule.delay_minutes, RELEARN_MINUTES)
+        self.assertLess(schedule.ease, DEFAULT_EASE)
+    
+    def test_ease_bounds(self):
+        """Легкость не падает ниже минимума, а «легко» ее повышает"""
+        self.assertEqual(next_schedule(MIN_EASE, 6, 2, HARD).ease, MIN_EASE)
+        self.assertGreater(next_schedule(DEFAULT_EASE, 6, 2, EASY).ease, DEFAULT_EASE)
+        with self.assertRaises(ValueError):
+            next_schedule(DEFAULT_EASE, 0, 0, 7)
+    
+    def test_new_words_due(self):
+        """Новое слово сразу в очереди, после ответа уходит из нее"""
+        word_id = self.db.add_word(self.test_user_id, "очередь", "определение")
+        self.assertEqual([w['id'] for w in self.db.get_due_words(self.test_user_id)], [word_id])
+        
+        schedule = self.db.review_word(word_id, self.test_user_id, GOOD)
+        self.assertEqual(schedule.interval_days, 1)
+        self.assertEqual(self.db.count_due_words(self.test_user_id), 0)
+        self.assertEqual(self.db.get_user_stats(self.test_user_id)['reviews_done'], 1)
+    
+    def test_review_other_user_word(self):
+        """Чужое слово оценить нельзя"""
+        word_id = self.db.add_word(self.test_user_id, "чужое", "определение")
+        self.assertIsNone(self.db.review_word(word_id, 999, GOOD))
+    
+    def test_users_with_due_words(self):
+        """Все подписчики с накопленными словами находятся одним запросом"""
+        for user_id, count in [(1, 3), (2, 1), (3, 5)]:
+            self.db.add_user(user_id, None, None)
+            for i in range(count):
+                self.db.add_word(user_id, f"слово{i}", "определение")
+        self.db.subscribe_user(1, True)
+        self.db.subscribe_user(2, True)
+        
+        due = self.db.get_users_with_due_words(min_due=2)
+        self.assertEqual(due, [{'user_id': 1, 'due': 3}])
+
+
+class TestUserStats(unittest.TestCase):
+    """Тесты денормализованной статистики"""
+    
+    def setUp(self):
+        self.test_db_path = "test_stats.db"
+        self.db = Database(self.test_db_path)
+        self.test_user_id = 123456789
+    
+    def tearDown(self):
+        self.db.close()
+        remove_test_db(self.test_db_path)
+    
+    def test_empty_user(self):
+        """Для пользователя без слов статистика нулевая"""
+        stats = self.db.get_user_stats(self.test_user_id)
+        self.assertEqual(stats['total_words'], 0)
+        self.assertIsNone(stats['first_word_date'])
+    
+    def test_reviews_and_streak(self):
+        """Повторения считаются, занятие сегодня начинает серию"""
+        word_id = self.db.add_word(self.test_user_id, "слово", "определение")
+        self.db.update_last_reviewed(word_id)
+        self.db.update_last_reviewed(word_id)
+        
+        stats = self.db.get_user_stats(self.test_user_id)
+        self.assertEqual(stats['reviews_done'], 2)
+        self.assertEqual(stats['streak_days'], 1)
+    
+    def test_streak_continues_from_yesterday(self):
+        """Занятие на следующий день продлевает серию"""
+        self.db.add_word(self.test_user_id, "слово1", "определение")
+        conn = self.db.get_connection()
+        conn.execute("UPDATE user_stats SET last_active_date = date('now', '-1 day')")
+        conn.commit()
+        
+        self.db.add_word(self.test_user_id, "слово2", "определение")
+        self.assertEqual(self.db.get_user_stats(self.test_user_id)['streak_days'], 2)
+    
+    def test_delete_updates_dates(self):
+        """После удаления всех слов даты сбрасываются"""
+        word_id = self.db.add_word(self.test_user_id, "слово", "определение")
+        self.db.delete_word(word_id, self.test_user_id)
+        
+        stats = self.db.get_user_stats(self.test_user_id)
+        self.assertEqual(stats['total_words'], 0)
+        self.assertIsNone(stats['last_word_date'])
+    
+    def test_rebuild_repairs_drift(self):
+        """Пересчет исправляет рассинхронизацию счетчиков"""
+        self.db.add_word(self.test_user_id, "слово1", "определение")
+        self.db.add_word(self.test_user_id, "слово2", "определение")
+        conn = self.db.get_connection()
+        conn.execute("UPDATE user_stats SET word_count = 100")
+        conn.commit()
+        
+        self.db.rebuild_user_stats()
+        self.assertEqual(self.db.get_user_stats(self.test_user_id)['total_words'], 2)
+
+
+class TestSearch(unittest.TestCase):
+    """Тесты полнотекстового поиска"""
+    
+    def setUp(self):
+        self.test_db_path = "test_search.db"
+        self.db = Database(self.test_db_path)
+        self.test_user_id = 123456789
+    
+    def tearDown(self):
+        self.db.close()
+        remove_test_db(self.test_db_path)
+    
+    def test_word_match_ranked_first(self):
+        """Совпадение в слове выше совпадения в определении"""
+        self.db.add_word(self.test_user_id, "анализ", "противоположность: синтез частей")
+        self.db.add_word(self.test_user_id, "синтез", "соединение частей")
+        
+        results = self.db.search_words(self.test_user_id, "синтез")
+        
+        self.assertEqual([r['word'] for r in results], ["синтез", "анализ"])
+    
+    def test_only_own_words(self):
+        """Поиск не выходит за пределы словаря пользователя"""
+        self.db.add_word(self.test_user_id, "палимпсест", "рукопись")
+        self.db.add_word(42, "палимпсест", "рукопись")
+        
+        self.assertEqual(len(self.db.search_words(self.test_user_id, "палим")), 1)
+    
+    def test_index_follows_updates_and_deletes(self):
+        """Индекс синхронизирован с изменениями таблицы words"""
+        word_id = self.db.add_word(self.test_user_id, "эпистема", "знание")
+        self.db.add_word(self.test_user_id, "эпистема", "система знаний эпохи")
+        
+        self.assertEqual(len(self.db.search_words(self.test_user_id, "эпохи")), 1)
+        self.assertEqual(self.db.search_words(self.test_user_id, "знание"), [])
+        
+        self.db.delete_word(word_id, self.test_user_id)
+        self.assertEqual(self.db.search_words(self.test_user_id, "эпистема"), [])
+    
+    def test_limit_applies_to_own_words(self):
+        """Более подходящие слова других пользователей не вытесняют свои из LIMIT"""
+        for i in range(10):
+            self.db.add_word(42, "палимпсест", f"рукопись {i}")
+        self.db.add_word(self.test_user_id, "палитра", "набор красок")
+        
+        results = self.db.search_words(self.test_user_id, "пали", limit=3)
+        
+        self.assertEqual([r['word'] for r in results], ["палитра"])
+    
+    def test_old_index_rebuilt_with_user_id(self):
+        """Индекс без user_id пересоздается при открытии базы"""
+        self.db.add_word(self.test_user_id, "кворум", "необходимое число участников")
+        conn = self.db.get_connection()
+        for trigger in ('words_fts_insert', 'words_fts_delete', 'words_fts_update'):
+            conn.execute(f"DROP TRIGGER {trigger}")
+        conn.execute("DROP TABLE words_fts")
+        conn.execute("""
+            CREATE VIRTUAL TABLE words_fts USING fts5(
+                word, short_definition, content='words', content_rowid='id'
+            )
+        """)
+        conn.commit()
+        self.db.release_connection(conn)
+        self.db.close()
+        
+        self.db = Database(self.test_db_path)
+        
+        conn = self.db.get_connection()
+        sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'words_fts'").fetchone()[0]
+        self.db.release_connection(conn)
+        self.assertIn("user_id UNINDEXED", sql)
+        self.assertEqual(len(self.db.search_words(self.test_user_id, "кворум")), 1)
+    
+    def test_special_characters(self):
+        """Спецсимволы FTS в запросе не ломают поиск"""
+        self.db.add_word(self.test_user_id, "кворум", "необходимое число участников")
+        
+        self.assertEqual(len(self.db.search_words(self.test_user_id, 'кворум"*)')), 1)
+        self.assertEqual(self.db.search_words(self.test_user_id, '"*()'), [])
+
+
+class TestSQLiteConnection(unittest.TestCase):
+    """Тесты долгоживущего соединения SQLite"""
+    
+    def setUp(self):
+        self.test_db_path = "test_connection.db"
+        self.db = Database(self.test_db_path)
+    
+    def tearDown(self):
+        self.db.close()
+        remove_test_db(self.test_db_path)
+    
+    def test_connection_reused(self):
+        """Повторные вызовы в одном потоке получают то же соединение"""
+        conn = self.db.get_connection()
+        self.db.release_connection(conn)
+        self.assertIs(self.db.get_connection(), conn)
+    
+    def test_wal_mode(self):
+        """Соединение работает в режиме WAL"""
+        conn = self.db.get_connection()
+        mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode.lower(), "wal")
+    
+    def test_failed_method_rolls_back(self):
+        """Незакоммиченная транзакция откатывается при возврате соединения"""
+        conn = self.db.get_connection()
+        conn.execute("INSERT INTO users (user_id) VALUES (1)")
+        self.db.release_connection(conn)
+        
+        self.assertFalse(conn.in_transaction)
+        self.assertIsNone(conn.execute("SELECT user_id FROM users WHERE user_id = 1").fetchone())
+
+
+class TestExplanationCache(unittest.TestCase):
+    """Тесты кэша объяснений"""
+    
+    def setUp(self):
+        self.test_db_path = "test_cache.db"
+        self.db = AsyncDatabase(Database(self.test_db_path))
+        self.cache = ExplanationCache(self.db, max_size=2, ttl=3600)
+    
+    def tearDown(self):
+        self.db.shutdown()
+        remove_test_db(self.test_db_path)
+    
+    def test_miss_then_hit(self):
+        """После сохранения слово берется из памяти"""
+        self.assertIsNone(asyncio.run(self.cache.get("Апробация")))
+        asyncio.run(self.cache.put("Апробация", "апробация", "<b>объяснение</b>"))
+        
+        self.assertEqual(asyncio.run(self.cache.get("  апробация ")), ("апробация", "<b>объяснение</b>"))
+        self.assertEqual(self.cache.stats()['misses'], 1)
+        self.assertEqual(self.cache.stats()['memory_hits'], 1)
+    
+    def test_normalized_word_key(self):
+        """Объяснение доступно и по нормализованной форме слова"""
+        asyncio.run(self.cache.put("апробаций", "апробация", "текст"))
+        self.assertEqual(asyncio.run(self.cache.get("Апробация")), ("апробация", "текст"))
+    
+    def test_shared_between_processes(self):
+        """Новый экземпляр кэша находит запись в БД"""
+        asyncio.run(self.cache.put("синтез", "синтез", "текст"))
+        
+        other = ExplanationCache(self.db, max_size=2, ttl=3600)
+        self.assertEqual(asyncio.run(other.get("синтез")), ("синтез", "текст"))
+        self.assertEqual(other.stats()['db_hits'], 1)
+    
+    def test_lru_eviction(self):
+        """В памяти держится не больше max_size записей"""
+        for word in ("один", "два", "три"):
+            asyncio.run(self.cache.put(word, word, "текст"))
+        self.assertEqual(self.cache.stats()['memory_size'], 2)
+
+
+class TestAsyncDatabase(unittest.TestCase):
+    """Тесты асинхронного фасада БД"""
+    
+    def setUp(self):
+        self.test_db_path = "test_async.db"
+        self.db = AsyncDatabase(Database(self.test_db_path), max_workers=4)
+        self.test_user_id = 123456789
+    
+    def tearDown(self):
+        self.db.shutdown()
+        remove_test_db(self.test_db_path)
+    
+    def test_same_api(self):
+        """Методы Database доступны через await"""
+        async def scenario():
+            word_id = await self.db.add_word(self.test_user_id, "фасад", "обертка")
+            word = await self.db.get_word_by_id(word_id)
+            stats = await self.db.get_user_stats(self.test_user_id)
+            return word, stats
+        
+        word, stats = asyncio.run(scenario())
+        self.assertEqual(word['word'], "фасад")
+        self.assertEqual(stats['total_words'], 1)
+    
+    def test_concurrent_calls(self):
+        """Параллельные запросы выполняются в пуле потоков"""
+        async def scenario():
+            await asyncio.gather(*(
+                self.db.add_word(self.test_user_id, f"слово{i}", "определение") for i in range(10)
+            ))
+            return await self.db.get_user_stats(self.test_user_id)
+        
+        self.assertEqual(asyncio.run(scenario())['total_words'], 10)
+    
+    def test_concurrent_same_word(self):
+        """Одновременное сохранение одного слова дает одну запись"""
+        async def scenario():
+            await asyncio.gather(*(
+                self.db.add_word(self.test_user_id, word, "определение") for word in ["Гонка", "гонка", "ГОНКА"] * 3
+            ))
+            return await self.db.get_user_stats(self.test_user_id)
+        
+        self.assertEqual(asyncio.run(scenario())['total_words'], 1)
+
+
+class TestHotCache(unittest.TestCase):
+    """Тесты кэша горячих данных с write-through сбросом"""
+    
+    def setUp(self):
+        self.test_db_path = "test_hot_cache.db"
+        self.async_db = AsyncDatabase(Database(self.test_db_path), max_workers=2)
+        self.cache = HotCache(self.async_db, MemoryBackend(max_bytes=1024 * 1024, ttl=60))
+        self.test_user_id = 123456789
+    
+    def tearDown(self):
+        self.async_db.shutdown()
+        remove_test_db(self.test_db_path)
+    
+    def test_reads_cached_until_write(self):
+        """Повторное чтение из кэша, add_word/delete_word сбрасывают кэш пользователя"""
+        async def scenario():
+            word_id = await self.cache.add_word(self.test_user_id, "кворум", "число участников")
+            first = await self.cache.get_dictionary_data(self.test_user_id)
+            await self.cache.get_dictionary_data(self.test_user_id)
+            await self.cache.get_user_stats(self.test_user_id)
+            await self.cache.get_user_stats(self.test_user_id)
+            hits = self.cache.hits
+            await self.cache.add_word(self.test_user_id, "синтез", "соединение")
+            second = await self.cache.get_dictionary_data(self.test_user_id)
+            await self.cache.delete_word(word_id, self.test_user_id)
+            stats = await self.cache.get_user_stats(self.test_user_id)
+            return first, second, stats, hits
+        
+        first, second, stats, hits = asyncio.run(scenario())
+        self.assertEqual(hits, 2)
+        self.assertEqual(first['total_words'], 1)
+        self.assertEqual(second['total_words'], 2)
+        self.assertEqual(stats['total_words'], 1)
+    
+    def test_word_only_for_owner(self):
+        """Карточка слова кэшируется у владельца, чужой пользователь ее не получает"""
+        async def scenario():
+            word_id = await self.cache.add_word(self.test_user_id, "кворум", "число участников")
+            own = await self.cache.get_word_by_id(word_id, self.test_user_id)
+            cached = await self.cache.get_word_by_id(word_id, self.test_user_id)
+            foreign = await self.cache.get_word_by_id(word_id, 42)
+            return own, cached, foreign
+        
+        own, cached, foreign = asyncio.run(scenario())
+        self.assertEqual(own, cached)
+        self.assertIsNone(foreign)
+        self.assertEqual(self.cache.hits, 1)
+    
+    def test_cached_value_is_a_copy(self):
+        """Изменение полученного словаря не портит кэш"""
+        async def scenario():
+            await self.cache.add_word(self.test_user_id, "кворум", "число участников")
+            (await self.cache.get_user_stats(self.test_user_id))['total_words'] = 100
+            return await self.cache.get_user_stats(self.test_user_id)
+        
+        self.assertEqual(asyncio.run(scenario())['total_words'], 1)
+    
+    def test_memory_limit_evicts_oldest_user(self):
+        """При превышении лимита выбрасывается самый давно использованный пользователь"""
+        backend = MemoryBackend(max_bytes=100, ttl=60)
+        
+        async def scenario():
+            await backend.set(1, 'a', b"x" * 40)
+            await backend.set(2, 'a', b"x" * 40)
+            await backend.get(1, 'a')
+            await backend.set(3, 'a', b"x" * 40)
+            return [await backend.get(user_id, 'a') is not None for user_id in (1, 2, 3)]
+        
+        self.assertEqual(asyncio.run(scenario()), [True, False, True])
+        self.assertEqual(backend.size, 80)
+    
+    def test_redis_backend(self):
+        """Redis-хранилище: хэш на пользователя, сброс одним DEL"""
+        class FakeRedis:
+            def __init__(self):
+                self.data = {}
+            
+            async def hget(self, name, key):
+                return self.data.get(name, {}).get(key)
+            
+            async def hset(self, name, key, value):
+                self.data.setdefault(name, {})[key] = value
+            
+            async def expire(self, name, ttl):
+                pass
+            
+            async def delete(self, name):
+                self.data.pop(name, None)
+        
+        client = FakeRedis()
+        cache = HotCache(self.async_db, RedisBackend(client, ttl=60))
+        
+        async def scenario():
+            await cache.add_word(self.test_user_id, "кворум", "число участников")
+            await cache.get_user_stats(self.test_user_id)
+            cached = f"hot:{self.test_user_id}" in client.data
+            await cache.add_word(self.test_user_id, "синтез", "соединение")
+            return cached, f"hot:{self.test_user_id}" in client.data
+        
+        self.assertEqual(asyncio.run(scenario()), (True, False))
+
+
+class TestStateStore(unittest.TestCase):
+    """Тесты временного состояния с TTL (кнопки "Сохранить")"""
+    
+    def setUp(self):
+        self.test_db_path = "test_state.db"
+        self.db = AsyncDatabase(Database(self.test_db_path), max_workers=2)
+        self.state = StateStore(self.db)
+    
+    def tearDown(self):
+        self.db.shutdown()
+        remove_test_db(self.test_db_path)
+    
+    def test_each_message_keeps_its_word(self):
+        """Два открытых предложения — каждая кнопка сохраняет свое слово, один раз"""
+        async def scenario():
+            first = await self.state.put_suggestion("кворум", "<b>число</b>")
+            second = await self.state.put_suggestion("синтез", "соединение")
+            a, b = await self.state.get_suggestion(first), await self.state.get_suggestion(second)
+            await self.state.discard_suggestion(first)
+            return first, (a, b, await self.state.get_suggestion(first))
+        
+        first, (a, b, again) = asyncio.run(scenario())
+        self.assertTrue(first.startswith(SAVE_CALLBACK_PREFIX))
+        self.assertLessEqual(len(first.encode()), 64)
+        self.assertEqual(a, ("кворум", "<b>число</b>"))
+        self.assertEqual(b, ("синтез", "соединение"))
+        self.assertIsNone(again)
+    
+    def test_suggestion_kept_until_discarded(self):
+        """Чтение не удаляет токен: если сохранение упало, кнопку можно нажать снова"""
+        async def scenario():
+            data = await self.state.put_suggestion("кворум", "число")
+            return await self.state.get_suggestion(data), await self.state.get_suggestion(data)
+        
+        self.assertEqual(asyncio.run(scenario()), (("кворум", "число"), ("кворум", "число")))
+    
+    def test_expiry_and_purge(self):
+        """Истекшее значение не читается и удаляется фоновой очисткой"""
+        async def scenario():
+            await self.state.put("old", {"a": 1}, ttl=-1)
+            await self.state.put("fresh", {"a": 2}, ttl=60)
+            return await self.state.get("old"), await self.state.purge(), await self.state.get("fresh")
+        
+        self.assertEqual(asyncio.run(scenario()), (None, 1, {"a": 2}))
+    
+    def test_recent_suggestions(self):
+        """Недавние предложения хранятся ограниченным списком"""
+        async def scenario():
+            for i in range(RECENT_SUGGESTIONS_LIMIT + 5):
+                await self.state.remember_suggestion(1, f"слово{i}")
+            return await self.state.recent_suggestions(1), await self.state.recent_suggestions(2)
+        
+        recent, other = asyncio.run(scenario())
+        self.assertEqual(len(recent), RECENT_SUGGESTIONS_LIMIT)
+        self.assertEqual(recent[-1], f"слово{RECENT_SUGGESTIONS_LIMIT + 4}")
+        self.assertEqual(other, [])
+
+
+class TestGeminiClient(unittest.TestCase):
+    """Тесты асинхронного клиента Gemini"""
+    
+    class FakeModel:
+        """Модель-заглушка, считающая одновременные запросы"""
+        
+        def __init__(self):
+            self.active = 0
+            self.max_active = 0
+        
+        async def generate_content_async(self, prompt):
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            await asyncio.sleep(0.01)
+            self.active -= 1
+            return type('Response', (), {'text': f"ответ: {prompt}"})()
+    
+    def test_generate_returns_text(self):
+        """Клиент возвращает текст ответа модели"""
+        client = GeminiClient(self.FakeModel(), max_concurrency=2)
+        text = asyncio.run(client.generate("слово"))
+        self.assertEqual(text, "ответ: слово")
+    
+    def test_concurrency_limit(self):
+        """Одновременно выполняется не больше max_concurrency запросов"""
+        model = self.FakeModel()
+        client = GeminiClient(model, max_concurrency=3, rpm=60000)
+        
+        async def run_many():
+            return await asyncio.gather(*(client.generate(str(i)) for i in range(10)))
+        
+        results = asyncio.run(run_many())
+        self.assertEqual(len(results), 10)
+        self.assertEqual(model.max_active, 3)
+
+    class FlakyModel:
+        """Модель-заглушка: первые failures вызовов отвечают 429"""
+        
+        model_name = "models/flaky"
+        
+        def __init__(self, failures, error="429 Resource exhausted"):
+            self.failures = failures
+            self.error = error
+            self.calls = 0
+        
+        async def generate_content_async(self, prompt):
+            self.calls += 1
+            if self.calls <= self.failures:
+                raise RuntimeError(self.error)
+            return type('Response', (), {'text': "ок"})()
+    
+    def make_client(self, model, **kwargs):
+        client = GeminiClient(model, max_concurrency=2, rpm=6000, **kwargs)
+        client.backoff_base = 0.001
+        client.backoff_cap = 0.01
+        return client
+    
+    def test_retries_rate_limit(self):
+        """429 повторяется с задержкой, квота модели считает запросы и отказы"""
+        model = self.FlakyModel(failures=2)
+        client = self.make_client(model, max_retries=3)
+        self.assertEqual(asyncio.run(client.generate("слово")), "ок")
+        self.assertEqual(model.calls, 3)
+        stats = client.stats()['models']['models/flaky']
+        self.assertEqual((stats['requests'], stats['rate_limited'], stats['breaker']), (3, 2, 'closed'))
+    
+    def test_other_errors_not_retried(self):
+        """Постоянные ошибки не повторяются"""
+        model = self.FlakyModel(failures=5, error="400 API key not valid")
+        client = self.make_client(model)
+        with self.assertRaises(RuntimeError):
+            asyncio.run(client.generate("слово"))
+        self.assertEqual(model.calls, 1)
+    
+    def test_breaker_fails_fast(self):
+        """После серии 429 интерактивный запрос сразу получает отказ, а не ждет"""
+        model = self.FlakyModel(failures=100)
+        client = self.make_client(model, max_retries=5)
+        client.breaker_threshold = 2
+        client.breaker_reset = 60
+        
+        async def scenario():
+            with self.assertRaises(GeminiUnavailable):
+                await client.generate("слово")
+            calls = model.calls
+            with self.assertRaises(GeminiUnavailable) as ctx:
+                await client.generate("другое")
+            return calls, ctx.exception
+        
+        calls, error = asyncio.run(scenario())
+        self.assertEqual(calls, 2)
+        self.assertEqual(model.calls, 2)  # второй запрос не дошел до API
+        self.assertGreater(error.retry_in, 50)
+        self.assertGreater(client.retry_in(), 50)
+    
+    def test_long_retry_after_fails_fast(self):
+        """Если API просит ждать дольше допустимого, пользователь сразу видит отказ"""
+        model = self.FlakyModel(failures=1, error="429 Quota exceeded. Please retry in 40.5s.")
+        client = self.make_client(model)
+        with self.assertRaises(GeminiUnavailable) as ctx:
+            asyncio.run(client.generate("слово"))
+        self.assertGreaterEqual(ctx.exception.retry_in, 40.5)
+        self.assertEqual(model.calls, 1)
+    
+    def test_interactive_preempts_background(self):
+        """Запрос пользователя обгоняет очередь фоновой генерации"""
+        order = []
+        
+        class OrderedModel:
+            async def generate_content_async(self, prompt):
+                order.append(prompt)
+                await asyncio.sleep(0.01)
+                return type('Response', (), {'text': prompt})()
+        
+        client = GeminiClient(OrderedModel(), max_concurrency=1, rpm=60000)
+        
+        async def scenario():
+            background = [asyncio.ensure_future(client.generate(f"фон{i}", priority=BACKGROUND)) for i in range(4)]
+            await asyncio.sleep(0.005)
+            await client.generate("слово", priority=INTERACTIVE)
+            await asyncio.gather(*background)
+        
+        asyncio.run(scenario())
+        self.assertEqual(order[0], "фон0")
+        self.assertLess(order.index("слово"), 3)
+
+
+class TestResilience(unittest.TestCase):
+    """Тесты повторов, предохранителя и приоритетной очереди"""
+    
+    def test_retry_after_parsing(self):
+        """Задержка берется из атрибута или текста ошибки API"""
+        self.assertEqual(retry_after(RuntimeError("429 Please retry in 27.5s.")), 27.5)
+        self.assertEqual(retry_after(RuntimeError("429 retry_delay {\n  seconds: 31\n}")), 31)
+        error = RuntimeError("429")
+        error.retry_after = 5
+        self.assertEqual(retry_after(error), 5)
+        self.assertIsNone(retry_after(RuntimeError("500")))
+    
+    def test_backoff_delay(self):
+        """Задержка растет экспоненциально, не выходит за потолок и соблюдает retry-after"""
+        delays = [backoff_delay(attempt, base=1, cap=8) for attempt in range(10) for _ in range(20)]
+        self.assertTrue(all(0 <= d <= 8 for d in delays))
+        self.assertTrue(all(backoff_delay(0, base=1, cap=8) <= 1 for _ in range(20)))
+        self.assertEqual(backoff_delay(0, base=1, cap=8, hint=30), 30)
+    
+    def test_breaker_cycle(self):
+        """closed -> open -> half-open (один пробный запрос) -> closed"""
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'closed')
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+        self.assertFalse(breaker.allow())
+        
+        import time
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, 'half-open')
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # пробный уже идет
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')  # неудачная проба открывает снова
+        
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+        self.assertEqual(breaker.opens, 2)
+    
+    def test_breaker_opens_for_retry_after(self):
+        """Подсказка API открывает предохранитель сразу на названное время"""
+        breaker = CircuitBreaker(failure_threshold=5, reset_timeout=1)
+        breaker.record_failure(hint=20)
+        self.assertEqual(breaker.state, 'open')
+        self.assertGreater(breaker.retry_in(), 19)
+    
+    def test_priority_gate_order(self):
+        """Освободившееся место получает ожидающий с высшим приоритетом, отмененные пропускаются"""
+        gate = PriorityGate(1)
+        order = []
+        
+        async def worker(name, priority):
+            async with gate.slot(priority):
+                order.append(name)
+                await asyncio.sleep(0.001)
+        
+        async def scenario():
+            await gate.acquire()
+            tasks = [asyncio.ensure_future(worker(f"фон{i}", BACKGROUND)) for i in range(3)]
+            cancelled = asyncio.ensure_future(worker("отмена", INTERACTIVE))
+            tasks.append(asyncio.ensure_future(worker("слово", INTERACTIVE)))
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            gate.release()
+            await asyncio.gather(*tasks)
+            return gate.active
+        
+        self.assertEqual(asyncio.run(scenario()), 0)
+        self.assertEqual(order, ["слово", "фон0", "фон1", "фон2"])
+
+
+class TestModelRouter(unittest.TestCase):
+    """Тесты маршрутизации по моделям и проверки доступных моделей"""
+    
+    class NamedModel:
+        """Модель-заглушка с именем; exhausted — квота исчерпана"""
+        
+        def __init__(self, name, exhausted=False):
+            self.model_name = f"models/{name}"
+            self.exhausted = exhausted
+            self.prompts = []
+        
+        async def generate_content_async(self, prompt):
+            self.prompts.append(prompt)
+            if self.exhausted:
+                raise RuntimeError("429 Resource exhausted")
+            usage = type('Usage', (), {'prompt_token_count': 1000, 'candidates_token_count': 500})()
+            return type('Response', (), {'text': f"{self.model_name}: {prompt}", 'usage_metadata': usage})()
+    
+    def make_router(self, exhausted=()):
+        models = {name: self.NamedModel(name, name in exhausted) for name in ("lite", "pro")}
+        client = GeminiClient(max_concurrency=2, rpm=60000, max_retries=0)
+        router = ModelRouter(client, models.__getitem__, tiers={LIGHT: ["lite"], STRONG: ["pro"]},
+                             prices={"lite": (1.0, 2.0), "pro": (10.0, 20.0)})
+        return router, models
+    
+    def test_routes_by_tier(self):
+        """Дешевые задачи — в легкую модель, объяснения — в сильную"""
+        router, models = self.make_router()
+        self.assertEqual(asyncio.run(router.generate('normalize', "кворумы")), "models/lite: кворумы")
+        self.assertEqual(asyncio.run(router.route('explain').generate("кворум")), "models/pro: кворум")
+        self.assertEqual(router.chain('explain'), ["pro", "lite"])
+    
+    def test_fallback_on_quota(self):
+        """При исчерпании квоты запрос сразу уходит в другую модель"""
+        router, models = self.make_router(exhausted={"pro"})
+        self.assertEqual(asyncio.run(router.generate('explain', "кворум")), "models/lite: кворум")
+        self.assertEqual(len(models["pro"].prompts), 1)  # без повторов в исчерпанную модель
+        stats = router.stats()['explain']
+        self.assertEqual((stats['calls'], stats['fallbacks'], stats['models']), (1, 1, {"lite": 1}))
+    
+    def test_all_models_exhausted(self):
+        """Если квота исчерпана везде, ошибка доходит до вызывающего"""
+        router, _ = self.make_router(exhausted={"pro", "lite"})
+        with self.assertRaises(RuntimeError):
+            asyncio.run(router.generate('explain', "кворум"))
+        self.assertEqual(router.stats()['explain']['errors'], 1)
+    
+    def test_cost_and_latency(self):
+        """Расходы считаются по токенам из usage_metadata и ценам модели"""
+        router, _ = self.make_router()
+        asyncio.run(router.generate('explain', "a"))
+        asyncio.run(router.generate('explain', "b"))
+        stats = router.stats()['explain']
+        self.assertEqual((stats['input_tokens'], stats['output_tokens']), (2000, 1000))
+        self.assertAlmostEqual(stats['cost_usd'], 2 * (1000 * 10 + 500 * 20) / 1_000_000)
+        self.assertGreaterEqual(stats['max_seconds'], stats['avg_seconds'])
+    
+    def test_unavailable_models_skipped(self):
+        """Модели, которых нет у ключа, не используются"""
+        router, models = self.make_router()
+        router.set_available(["lite", "other"])
+        self.assertEqual(router.chain('explain'), ["lite"])
+        router.set_available(["other"])
+        self.assertEqual(router.chain('explain'), ["pro", "lite"])
+    
+    def test_probe_cached_on_disk(self):
+        """Список моделей берется из кэша на диске, пока он свежий и от того же ключа"""
+        path = "test_models_cache.json"
+        calls = []
+        
+        def lister():
+            calls.append(1)
+            return ["gemini-2.0-flash", "gemini-2.0-flash-lite"]
+        
+        def failing():
+            raise RuntimeError("network down")
+        
+        try:
+            self.assertEqual(probe_models("key", path, ttl=3600, lister=lister), lister())
+            calls.clear()
+            self.assertEqual(probe_models("key", path, ttl=3600, lister=lister)[0], "gemini-2.0-flash")
+            self.assertEqual(calls, [])
+            # Другой ключ — кэш не подходит
+            probe_models("other", path, ttl=3600, lister=lister)
+            self.assertEqual(len(calls), 1)
+            # API недоступно — используется устаревший кэш
+            self.assertEqual(len(probe_models("other", path, ttl=0, lister=failing)), 2)
+            self.assertIsNone(probe_models("third", path, refresh=True, lister=failing))
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class TestStreaming(unittest.TestCase):
+    """Тесты потокового ответа и дописываемого сообщения"""
+    
+    class StreamingModel:
+        """Модель-заглушка: отдает ответ частями; failures первых вызовов — 429 до первой части"""
+        
+        def __init__(self, parts, failures=0, name="models/stream"):
+            self.parts = parts
+            self.failures = failures
+            self.calls = 0
+            self.model_name = name
+        
+        async def generate_content_async(self, prompt, stream=False):
+            self.calls += 1
+            if self.calls <= self.failures:
+                raise RuntimeError("429 Resource exhausted")
+            
+            async def chunks():
+                for part in self.parts:
+                    await asyncio.sleep(0)
+                    yield type('Chunk', (), {'text': part, 'usage_metadata': None})()
+            
+            return chunks()
+    
+    class FakeMessage:
+        def __init__(self, chat):
+            self.chat = chat
+        
+        async def edit_text(self, text, reply_markup=None, parse_mode=None):
+            self.chat.append(('edit', text, reply_markup))
+    
+    def test_partial_json_string(self):
+        """Значение поля растет по мере прихода JSON и не ломается на оборванных escape"""
+        for ensure_ascii in (False, True):
+            value = 'Кворум — **📝 Краткое** "определение"\nвторая строка'
+            raw = json.dumps({"normalized_word": "Кворум", "explanation": value}, ensure_ascii=ensure_ascii)
+            previous = ""
+            for end in range(len(raw) + 1):
+                partial, complete = partial_json_string(raw[:end], "explanation")
+                if partial is None:
+                    continue
+                self.assertTrue(value.startswith(partial), (ensure_ascii, raw[:end]))
+                self.assertGreaterEqual(len(partial), len(previous))
+                self.assertEqual(complete, partial == value and raw[:end].rstrip("}").endswith('"'))
+                previous = partial
+            self.assertEqual(previous, value)
+            self.assertEqual(partial_json_string(raw, "normalized_word"), ("Кворум", True))
+        self.assertEqual(partial_json_string('{"normalized_word": "Кво', "explanation"), (None, False))
+    
+    def test_completed_part(self):
+        """Показываются только законченные абзацы"""
+        self.assertEqual(completed_part("**📝 Краткое определение:**\nКворум — мин"), "")
+        self.assertEqual(completed_part("**📝 Раздел:**\nтекст\n\n**🔍 Конт"), "**📝 Раздел:**\nтекст")
+    
+    def test_progressive_message_throttled(self):
+        """Первый кадр — сразу, следующие — не чаще интервала, итог — правкой с клавиатурой"""
+        chat = []
+        
+        async def send(text, reply_markup=None, parse_mode=None):
+            chat.append(('send', text, reply_markup))
+            return self.FakeMessage(chat)
+        
+        async def scenario():
+            progress = ProgressiveMessage(send, interval=0.05)
+            await progress.update("кадр 1")
+            await progress.update("кадр 2")  # слишком рано — пропускается
+            await asyncio.sleep(0.06)
+            await progress.update("кадр 3")
+            await progress.finish("итог", reply_markup="клавиатура")
+        
+        asyncio.run(scenario())
+        self.assertEqual(chat, [('send', "кадр 1", None), ('edit', "кадр 3", None), ('edit', "итог", "клавиатура")])
+    
+    def test_progressive_message_long_result(self):
+        """Длинный итог: первая часть — правкой, остальное — новыми сообщениями, клавиатура в конце"""
+        chat = []
+        
+        async def send(text, reply_markup=None, parse_mode=None):
+            chat.append(('send', text, reply_markup))
+            return self.FakeMessage(chat)
+        
+        async def scenario():
+            progress = ProgressiveMessage(send, interval=0)
+            await progress.update("начало")
+            await progress.finish("абзац\n\n" * 1000, reply_markup="клавиатура")
+        
+        asyncio.run(scenario())
+        self.assertEqual(chat[1][0], 'edit')
+        self.assertIsNone(chat[1][2])
+        self.assertEqual(chat[-1][0], 'send')
+        self.assertEqual(chat[-1][2], "клавиатура")
+    
+    def test_stream_retries_before_first_chunk(self):
+        """До первой части 429 повторяется или переходит на запасную модель"""
+        client = GeminiClient(max_concurrency=2, rpm=60000)
+        client.backoff_base = client.backoff_cap = 0.001
+        model = self.StreamingModel(["{", '"a": 1', "}"], failures=1)
+        
+        async def collect(stream):
+            return [chunk async for chunk in stream]
+        
+        chunks = asyncio.run(collect(client.stream_response("слово", model=model)))
+        self.assertEqual("".join(chunk.text for chunk in chunks), '{"a": 1}')
+        self.assertEqual(model.calls, 2)
+        
+        models = {"pro": self.StreamingModel(["x"], failures=100, name="models/pro"),
+                  "lite": self.StreamingModel(["ч", "асти"], name="models/lite")}
+        router = ModelRouter(GeminiClient(max_concurrency=2, rpm=60000), models.__getitem__,
+                             tiers={LIGHT: ["lite"], STRONG: ["pro"]}, prices={})
+        self.assertEqual(asyncio.run(collect(router.stream('explain', "слово"))), ["ч", "асти"])
+        stats = router.stats()['explain']
+        self.assertEqual((stats['streams'], stats['fallbacks'], stats['models']), (1, 1, {"lite": 1}))
+        self.assertLessEqual(stats['avg_first_chunk_seconds'], stats['avg_seconds'])
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Тесты объединения одинаковых одновременных запросов"""
+    
+    def test_concurrent_same_key(self):
+        """Одновременные вызовы с одним ключом — одно выполнение"""
+        flight = SingleFlight()
+        calls = []
+        
+        async def fetch(word):
+            calls.append(word)
+            await asyncio.sleep(0.05)
+            return word.upper()
+        
+        async def scenario():
+            return await asyncio.gather(
+                *(flight.run("кворум", lambda: fetch("кворум")) for _ in range(10)),
+                flight.run("синтез", lambda: fetch("синтез")),
+            )
+        
+        results = asyncio.run(scenario())
+        self.assertEqual(results, ["КВОРУМ"] * 10 + ["СИНТЕЗ"])
+        self.assertEqual(sorted(calls), ["кворум", "синтез"])
+        stats = flight.stats()
+        self.assertEqual((stats['executed'], stats['coalesced'], stats['in_flight']), (2, 9, 0))
+        self.assertGreater(stats['avg_coalesced_wait'], 0)
+    
+    def test_error_shared_and_key_released(self):
+        """Ошибку получают все ожидающие, следующий вызов выполняется заново"""
+        flight = SingleFlight()
+        
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("429")
+        
+        async def ok():
+            return "ответ"
+        
+        async def scenario():
+            results = await asyncio.gather(*(flight.run("k", failing) for _ in range(3)), return_exceptions=True)
+            return results, await flight.run("k", ok)
+        
+        results, after = asyncio.run(scenario())
+        self.assertTrue(all(isinstance(r, RuntimeError) for r in results))
+        self.assertEqual(after, "ответ")
+    
+    def test_waiter_cancel_keeps_request(self):
+        """Отмена первого ожидающего не отменяет запрос для остальных"""
+        flight = SingleFlight()
+        
+        async def slow():
+            await asyncio.sleep(0.05)
+            return "готово"
+        
+        async def scenario():
+            first = asyncio.ensure_future(flight.run("k", slow))
+            await asyncio.sleep(0)
+            second = asyncio.ensure_future(flight.run("k", slow))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            return await second
+        
+        self.assertEqual(asyncio.run(scenario()), "готово")
+
+
+class TestBroadcast(unittest.TestCase):
+    """Тесты ограничителя частоты и движка рассылки"""
+    
+    def test_token_bucket_rate(self):
+        """После исчерпания ведра токены выдаются со скоростью rate"""
+        async def scenario():
+            bucket = TokenBucket(rate=100, capacity=5)
+            start = asyncio.get_running_loop().time()
+            for _ in range(15):
+                await bucket.acquire()
+            return asyncio.get_running_loop().time() - start
+        
+        # 5 токенов сразу, еще 10 по 10 мс
+        self.assertGreaterEqual(asyncio.run(scenario()), 0.09)
+    
+    def test_try_acquire(self):
+        """try_acquire не ждет, а сообщает о нехватке токенов"""
+        bucket = TokenBucket(rate=0.1, capacity=1)
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+    
+    def test_run_concurrently(self):
+        """Получатели обрабатываются параллельно, ошибки считаются"""
+        engine = BroadcastEngine(concurrency=10, gemini_rpm=60000, telegram_rps=1000)
+        active = {'now': 0, 'max': 0}
+        
+        async def deliver(user_id):
+            active['now'] += 1
+            active['max'] = max(active['max'], active['now'])
+            await engine.gemini.acquire()
+            await asyncio.sleep(0.01)
+            await engine.telegram.acquire()
+            active['now'] -= 1
+            if user_id % 10 == 0:
+                raise RuntimeError("Forbidden")
+        
+        stats = asyncio.run(engine.run(range(1, 51), deliver))
+        
+        self.assertEqual(stats['sent'], 45)
+        self.assertEqual(stats['failed'], 5)
+        self.assertEqual(active['max'], 10)
+        self.assertFalse(engine.running)
+    
+    def test_batch_stats_per_user(self):
+        """Для пачек считаются пользователи: частичная доставка и сбой всей пачки"""
+        engine = BroadcastEngine(concurrency=2, gemini_rpm=60000, telegram_rps=1000)
+        
+        async def deliver(batch):
+            if batch[0] == 0:
+                raise RuntimeError("Gemini недоступен")
+            return len(batch) - 1, 1
+        
+        stats = asyncio.run(engine.run([[0, 1, 2], [3, 4, 5, 6], [7, 8]], deliver))
+        
+        self.assertEqual((stats['sent'], stats['failed']), (4, 5))
+
+
+class TestSuggestions(unittest.TestCase):
+    """Тесты разбора ответов генерации умных слов"""
+    
+    def test_exclusion_list(self):
+        """Исключаются слова словаря и сессии, пустой словарь — клише"""
+        words = [{'word': 'Синтез'}, {'word': 'анализ'}]
+        self.assertEqual(exclusion_list(words, ['Контекст']), ['синтез', 'анализ', 'контекст'])
+        self.assertEqual(exclusion_list([]), CLICHE_WORDS)
+    
+    def test_extract_json_from_code_block(self):
+        """JSON извлекается из блока ```json"""
+        self.assertEqual(extract_json('```json\n[{"user": 1}]\n```'), [{'user': 1}])
+    
+    def test_batch_validated_per_entry(self):
+        """Невалидные элементы пакета отбрасываются, остальные сохраняются"""
+        data = [
+            {'user': 1, 'word': 'Палимпсест', 'explanation': '**📝 Краткое определение:** ...'},
+            {'user': 2, 'word': 'синтез', 'explanation': 'уже есть в словаре'},
+            {'user': 3, 'word': '', 'explanation': 'пустое слово'},
+            {'user': 9, 'word': 'Апофения', 'explanation': 'нет такого пользователя'},
+            'мусор',
+        ]
+        exclusions = [['анализ'], ['синтез'], [], []]
+        
+        results = parse_suggestion_batch(data, exclusions)
+        
+        self.assertEqual(results[0], ('Палимпсест', '**📝 Краткое определение:** ...'))
+        self.assertEqual(results[1:], [None, None, None])
+    
+    def test_batch_not_a_list(self):
+        """Ответ не-массив дает None для всех пользователей"""
+        self.assertEqual(parse_suggestion_batch({'word': 'x'}, [[], []]), [None, None])
+
+
+class TestWordPool(unittest.TestCase):
+    """Тесты пула готовых слов"""
+    
+    def setUp(self):
+        self.test_db_path = "test_pool.db"
+        self.db = AsyncDatabase(Database(self.test_db_path))
+        self.calls = []
+        self.pool = WordPool(self.db, self.fake_generate, size=4, threshold=2, max_serves=2, batch_size=3)
+        self.test_user_id = 123456789
+    
+    def tearDown(self):
+        self.db.shutdown()
+        remove_test_db(self.test_db_path)
+    
+    async def fake_generate(self, theme, count, existing):
+        self.calls.append((theme, count))
+        start = len(existing)
+        return [(f"{theme}-{i}", f"<b>{theme}-{i}</b>") for i in range(start, start + count)]
+    
+    def test_refill_all_themes(self):
+        """Каждая тема пополняется до целевого размера пачками"""
+        added = asyncio.run(self.pool.refill())
+        
+        self.assertEqual(added, 4 * len(THEMES))
+        self.assertEqual(asyncio.run(self.db.get_pool_counts())[THEMES[0]], 4)
+        # 4 слова при пачке 3 — два запроса на тему
+        self.assertEqual(len(self.calls), 2 * len(THEMES))
+        
+        # Выше порога — повторное пополнение ничего не делает
+        self.assertEqual(asyncio.run(self.pool.refill()), 0)
+    
+    def test_draw_skips_known_words(self):
+        """Из пула не выдаются слова, которые уже есть в словаре или исключены"""
+        asyncio.run(self.db.add_pool_words("Тема", [("альфа", "а"), ("бета", "б"), ("гамма", "г")]))
+        asyncio.run(self.db.add_word(self.test_user_id, "альфа", "есть в словаре"))
+        
+        word, explanation = asyncio.run(self.pool.draw(self.test_user_id, exclude_words=["Бета"]))
+        self.assertEqual((word, explanation), ("гамма", "г"))
+    
+    def test_word_retired_after_max_serves(self):
+        """Слово удаляется из пула после max_serves выдач"""
+        asyncio.run(self.db.add_pool_words("Тема", [("альфа", "а")]))
+        
+        self.assertIsNotNone(asyncio.run(self.pool.draw(1)))
+        self.assertIsNotNone(asyncio.run(self.pool.draw(2)))
+        self.assertIsNone(asyncio.run(self.pool.draw(3)))
+
+
+class TestImporter(unittest.TestCase):
+    """Тесты массового импорта слов"""
+    
+    def setUp(self):
+        self.test_db_path = "test_import.db"
+        self.db = AsyncDatabase(Database(self.test_db_path))
+        self.prompts = []
+        self.test_user_id = 123456789
+    
+    def tearDown(self):
+        self.db.shutdown()
+        remove_test_db(self.test_db_path)
+    
+    async def generate(self, prompt, priority=None):
+        """Фейковый Gemini: объясняет все слова из списка в запросе, кроме «провал»"""
+        self.prompts.append(prompt)
+        words = [line.split(". ", 1)[1] for line in prompt.split("СЛОВА:")[1].split("\n\n")[0].strip().splitlines()]
+        return json.dumps([{"word": w, "explanation": f"**{w}**"} for w in words if w != "провал"])
+    
+    def make_importer(self, **kwargs):
+        gemini = type("FakeGemini", (), {"generate": staticmethod(self.generate)})()
+        return WordImporter(self.db, gemini, **kwargs)
+    
+    def test_read_txt(self):
+        """Текст: слово на строку, без пустых строк, комментариев и повторов"""
+        rows = list(read_rows(["Апробация\n", "\n", "# комментарий\n", "апробация\n", "это явно целое предложение\n", "кворум"]))
+        self.assertEqual(rows, [("Апробация", None), ("кворум", None)])
+    
+    def test_read_csv(self):
+        """CSV с ; и заголовком, определение экранируется для HTML"""
+        rows = list(read_rows(["слово;определение\n", "кворум;число <членов>\n", "синтез\n"], csv_format=True))
+        self.assertEqual(rows, [("кворум", "число &lt;членов&gt;"), ("синтез", None)])
+    
+    def test_parse_explanations(self):
+        """В ответе модели учитываются только слова из запроса"""
+        data = [{"word": "КВОРУМ", "explanation": "a"}, {"word": "лишнее", "explanation": "b"}, {"word": "синтез"}]
+        self.assertEqual(parse_explanations(data, ["кворум", "синтез"]), {"кворум": "a"})
+    
+    def test_import_pipeline(self):
+        """Существующие слова пропускаются, объяснения идут пакетами, запись — пачками"""
+        self.db.db.add_word(self.test_user_id, "Кворум", "уже есть")
+        rows = [(f"слово{i}", None) for i in range(7)] + [("кворум", None), ("свое", "мое определение"), ("провал", None)]
+        progress = []
+        
+        async def report(stats):
+            progress.append(stats)
+        
+        importer = self.make_importer(batch_size=3, chunk_size=5)
+        stats = asyncio.run(importer.run(self.test_user_id, rows, progress=report))
+        
+        self.assertEqual((stats['added'], stats['existing'], stats['failed']), (8, 1, 1))
+        self.assertFalse(stats['truncated'])
+        # Две пачки записи; в каждой объясняются только слова без определения
+        self.assertEqual(len(progress), 2)
+        self.assertEqual(len(self.prompts), 3)
+        self.assertEqual(self.db.db.get_user_stats(self.test_user_id)['total_words'], 9)
+        self.assertEqual(self.db.db.search_words(self.test_user_id, "свое")[0]['short_definition'], "мое определение")
+    
+    def test_import_limit(self):
+        """Сверх лимита слова не обрабатываются"""
+        importer = self.make_importer(max_words=3)
+        stats = asyncio.run(importer.run(self.test_user_id, [(f"слово{i}", "x") for i in range(5)]))
+        self.assertEqual(stats['added'], 3)
+        self.assertTrue(stats['truncated'])
+        self.assertEqual(self.prompts, [])
+
+
+class TestExporter(unittest.TestCase):
+    """Тесты потоковой выгрузки словаря"""
+    
+    def setUp(self):
+        self.test_db_path = "test_export.db"
+        self.db = Database(self.test_db_path)
+        self.test_user_id = 123456789
+        self.db.add_word(self.test_user_id, "кворум", "<b>Число</b> &amp; членов", "из статьи")
+        self.db.add_word(self.test_user_id, "синтез", "объединение")
+        self.db.add_word(999, "чужое", "определение")
+    
+    def tearDown(self):
+        self.db.close()
+        remove_test_db(self.test_db_path)
+    
+    def test_iter_user_words(self):
+        """Слова пользователя идут потоком, старые первыми"""
+        words = self.db.iter_user_words(self.test_user_id)
+        self.assertEqual(next(words)['word'], "кворум")
+        self.assertEqual([w['word'] for w in words], ["синтез"])
+    
+    def test_csv(self):
+        """CSV: заголовок, строки пользователя, объяснение без HTML"""
+        out, count = export_words(self.db, self.test_user_id, 'csv')
+        with out:
+            rows = list(csv.reader(io.TextIOWrapper(out, encoding="utf-8-sig")))
+        self.assertEqual(count, 2)
+        self.assertEqual(rows[1][:3], ["кворум", "Число & членов", "из статьи"])
+        self.assertEqual(len(rows), 3)
+    
+    @unittest.skipUnless(importlib.util.find_spec("openpyxl"), "openpyxl не установлен")
+    def test_xlsx(self):
+        """Excel в режиме write-only"""
+        from openpyxl import load_workbook
+        out, count = export_words(self.db, self.test_user_id, 'xlsx')
+        with out:
+            ws = load_workbook(out).active
+            self.assertEqual(ws.max_row, 3)
+            self.assertEqual(ws.cell(row=3, column=1).value, "синтез")
+    
+    def test_unknown_format(self):
+        """Неизвестный формат — понятная ошибка"""
+        with self.assertRaises(ExportError):
+            export_words(self.db, self.test_user_id, 'doc')
+    
+    def test_available_formats(self):
+        """Форматы без установленной библиотеки не предлагаются"""
+        with patch("exporter.importlib.util.find_spec", return_value=None):
+            self.assertEqual(list(available_formats()), ['csv'])
+        with patch("exporter.importlib.util.find_spec", return_value=object()):
+            self.assertEqual(list(available_formats()), list(FORMATS))
+    
+    def test_html_to_text(self):
+        """Теги убираются, сущности раскрываются"""
+        self.assertEqual(html_to_text("<b>A</b> &lt;b&gt;"), "A <b>")
+
+
+class TestMigration(unittest.TestCase):
+    """Тесты переноса данных между базами"""
+    
+    def setUp(self):
+        self.source_path = "test_migrate_source.db"
+        self.target_path = "test_migrate_target.db"
+        # Источник со старой схемой: без word_key, rand_key, SRS и новых таблиц
+        conn = sqlite3.connect(self.source_path)
+        conn.executescript("""
+            CREATE TABLE users (user_id INTEGER PRIMARY KEY, username TEXT, first_name TEXT,
+                                is_subscribed BOOLEAN DEFAULT 0, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+            CREATE TABLE words (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, word TEXT NOT NULL,
+                                definition TEXT NOT NULL, context TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                                last_reviewed TIMESTAMP);
+        """)
+        conn.executemany("INSERT INTO users (user_id, username, is_subscribed) VALUES (?, ?, ?)",
+                         [(1, "anna", 1), (2, "boris", 0)])
+        conn.executemany("INSERT INTO words (user_id, word, definition) VALUES (?, ?, ?)",
+                         [(1 + i % 2, f"слово{i}", f"определение {i} " * (40 if i == 0 else 1)) for i in range(25)])
+        conn.commit()
+        conn.close()
+        
+        self.source = Database(self.source_path, init_schema=False)
+        self.target = Database(self.target_path)
+    
+    def tearDown(self):
+        self.source.close()
+        self.target.close()
+        remove_test_db(self.source_path)
+        remove_test_db(self.target_path)
+    
+    def test_source_schema_untouched(self):
+        """Источник открывается без миграций схемы"""
+        conn = self.source.get_connection()
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(words)")]
+        self.source.release_connection(conn)
+        self.assertNotIn("word_key", columns)
+    
+    def test_migrate_and_verify(self):
+        """Все строки перенесены, новые колонки дозаполнены, статистика пересчитана"""
+        copied = Migrator(self.source, self.target, batch_size=10).run()
+        
+        self.assertEqual(copied, {'users': 2, 'words': 25})
+        self.assertEqual(self.target.get_user_stats(1)['total_words'], 13)
+        self.assertEqual(len(self.target.search_words(1, "слово10")), 1)
+        self.assertIsNotNone(self.target.get_random_word(2))
+        self.assertEqual(self.target.get_subscribed_users(), [1])
+        # Длинное определение из старой базы сжато в новой и читается целиком
+        self.assertEqual(self.target.get_word_by_id(1)['definition'], "определение 0 " * 40)
+    
+    def test_resume_after_failure(self):
+        """Упавший перенос продолжается с контрольной точки без дубликатов"""
+        migrator = Migrator(self.source, self.target, batch_size=10)
+        original = migrator._write_batch
+        calls = []
+        
+        def failing_write(table, columns, rows, key_index):
+            calls.append(table.name)
+            if table.name == 'words' and calls.count('words') == 2:
+                raise RuntimeError("обрыв соединения")
+            return original(table, columns, rows, key_index)
+        
+        with patch.object(migrator, '_write_batch', failing_write):
+            with self.assertRaises(RuntimeError):
+                migrator.run()
+        
+        copied = Migrator(self.source, self.target, batch_size=10).run()
+        self.assertEqual(copied['words'], 15)
+        self.assertEqual(self.target.get_user_stats(1)['total_words'] + self.target.get_user_stats(2)['total_words'], 25)
+    
+    def test_case_duplicates_collapsed(self):
+        """Кириллические дубликаты без учета регистра: переносится самая свежая версия, проверка проходит"""
+        conn = sqlite3.connect(self.source_path)
+        conn.executemany("INSERT INTO words (user_id, word, definition) VALUES (?, ?, ?)",
+                         [(1, "Кворум", "старое"), (1, "кворум", "среднее"), (1, "КВОРУМ", "новое"), (2, "кворум", "чужое")])
+        conn.commit()
+        conn.close()
+        
+        migrator = Migrator(self.source, self.target, batch_size=10)
+        with self.assertLogs('migration', level='WARNING') as logs:
+            copied = migrator.run()
+        
+        self.assertEqual(copied['words'], 27)
+        self.assertIn("26, 27", "\n".join(logs.output))
+        results = self.target.search_words(1, "кворум")
+        self.assertEqual([(r['word'], r['short_definition']) for r in results], [("КВОРУМ", "новое")])
+        self.assertEqual(len(self.target.search_words(2, "кворум")), 1)
+        # Повторная проверка и продолжение не находят расхождений
+        self.assertTrue(all(r['ok'] for r in Migrator(self.source, self.target).verify().values()))
+    
+    def test_verify_detects_mismatch(self):
+        """Проверка замечает потерянную строку"""
+        migrator = Migrator(self.source, self.target)
+        migrator.run()
+        self.target.delete_word(5, 1)
+        with self.assertRaises(MigrationError):
+            migrator.verify()
+
+
+class TestMarkdownConverter(unittest.TestCase):
+    """Тесты конвертера Markdown -> HTML Telegram и нарезки сообщений"""
+    
+    CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_data", "markdown")
+    
+    def test_golden_corpus(self):
+        """Реальные объяснения конвертируются ровно в эталонный HTML"""
+        names = sorted(name[:-3] for name in os.listdir(self.CORPUS_DIR) if name.endswith(".md"))
+        self.assertTrue(names)
+        for name in names:
+            with self.subTest(sample=name):
+                with open(os.path.join(self.CORPUS_DIR, name + ".md"), encoding="utf-8") as f:
+                    source = f.read()
+                with open(os.path.join(self.CORPUS_DIR, name + ".html"), encoding="utf-8") as f:
+                    expected = f.read()
+                self.assertEqual(md_to_telegram_html(source), expected)
+    
+    def test_golden_long_line_split(self):
+        """Длинная строка режется по последнему пробелу, слова не разрываются"""
+        text = ("<b>📝 Краткое определение:</b>\n<i>Кворум</i> — минимальное число участников собрания, "
+                "при котором оно правомочно\n• Кворума не набралось.")
+        self.assertEqual(split_message(text, limit=40), [
+            "<b>📝 Краткое определение:</b>\n<i>Кворум</i> — ",
+            "минимальное число участников собрания, ",
+            "при котором оно правомочно\n",
+            "• Кворума не набралось.",
+        ])
+    
+    def test_code_is_protected(self):
+        """Внутри кода разметка не применяется, HTML экранируется"""
+        self.assertEqual(md_to_telegram_html("`a * b * c` и *курсив*"),
+                         "<code>a * b * c</code> и <i>курсив</i>")
+        self.assertEqual(md_to_telegram_html("```\n**x** <y>\n```"), "<pre>**x** &lt;y&gt;\n</pre>")
+    
+    def test_nested_and_escaped(self):
+        """Вложенная разметка и экранирование текста"""
+        self.assertEqual(md_to_telegram_html("**жирный с *курсивом* внутри**"),
+                         "<b>жирный с <i>курсивом</i> внутри</b>")
+        self.assertEqual(md_to_telegram_html("a < b & c"), "a &lt; b &amp; c")
+        self.assertEqual(md_to_telegram_html("snake_case_name"), "snake_case_name")
+    
+    def test_markup_does_not_cross_lines(self):
+        """Одиночные ** и ~~ не захватывают следующие строки и заголовки разделов"""
+        self.assertEqual(md_to_telegram_html("Формула: 2 ** 10 = 1024\n\n**💬 Примеры:**\n• пример"),
+                         "Формула: 2 ** 10 = 1024\n\n<b>💬 Примеры:</b>\n• пример")
+        self.assertEqual(md_to_telegram_html("a**2\n**Заголовок:**"), "a**2\n<b>Заголовок:</b>")
+        self.assertEqual(md_to_telegram_html("~~a\nb~~"), "~~a\nb~~")
+        self.assertEqual(md_to_telegram_html("```\nx**2\n\ny**3\n```"), "<pre>x**2\n\ny**3\n</pre>")
+    
+    def test_visible_length(self):
+        """Теги не считаются, сущность — один символ"""
+        self.assertEqual(visible_length("<b>ab</b> &amp;"), 4)
+    
+    def test_split_short_message(self):
+        """Короткое сообщение не режется"""
+        self.assertEqual(split_message("<b>коротко</b>"), ["<b>коротко</b>"])
+    
+    def test_split_long_message(self):
+        """Части в пределах лимита, теги закрыты и открыты заново"""
+        text = "<b>" + "\n".join(f"строка номер {i}" for i in range(50)) + "</b>"
+        chunks = split_message(text, limit=100)
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(visible_length(chunk), 100)
+            self.assertTrue(chunk.startswith("<b>") and chunk.endswith("</b>"))
+        self.assertEqual("".join(c[3:-4] for c in chunks), text[3:-4])
+    
+    def test_split_long_line(self):
+        """Строка длиннее лимита без пробелов режется жестко"""
+        chunks = split_message("x" * 250, limit=100)
+        self.assertEqual([len(c) for c in chunks], [100, 100, 50])
+
+
+class TestSections(unittest.TestCase):
+    """Тесты разделов объяснения и краткого определения"""
+    
+    EXPLANATION = ("<b>📝 Краткое определение:</b>\n<i>Кворум</i> — минимальное число &amp; участников.\n\n"
+                   "<b>💬 Примеры предложений:</b>\n• Кворума не набралось.\n\n"
+                   "<b>🔄 Синонимы:</b> правомочный состав")
+    
+    def setUp(self):
+        self.test_db_path = "test_sections.db"
+        self.db = Database(self.test_db_path)
+        self.test_user_id = 123456789
+    
+    def tearDown(self):
+        self.db.close()
+        remove_test_db(self.test_db_path)
+    
+    def test_parse_sections(self):
+        """Разделы по эмодзи заголовков, текст после заголовка в той же строке"""
+        sections = parse_sections(self.EXPLANATION)
+        self.assertEqual(list(sections), ['short', 'examples', 'synonyms'])
+        self.assertEqual(sections['examples'], "• Кворума не набралось.")
+        self.assertEqual(sections['synonyms'], "правомочный состав")
+    
+    def test_short_definition(self):
+        """Краткое определение — обычный текст; без разделов — первая строка"""
+        self.assertEqual(short_definition(self.EXPLANATION), "Кворум — минимальное число & участников.")
+        self.assertEqual(parse_sections("просто текст\nвторая строка"), {})
+        self.assertEqual(short_definition("просто текст\nвторая строка"), "просто текст")
+        self.assertEqual(len(short_definition("а" * 500)), SHORT_DEFINITION_LENGTH)
+    
+    def test_stored_with_word(self):
+        """add_word сохраняет разделы, список и поиск отдают краткое определение"""
+        word_id = self.db.add_word(self.test_user_id, "кворум", self.EXPLANATION)
+        page = self.db.get_dictionary_data(self.test_user_id)
+        self.assertEqual(page['words'][0]['short_definition'], "Кворум — минимальное число & участников.")
+        found = self.db.search_words(self.test_user_id, "кворум")[0]
+        self.assertNotIn('definition', found)
+        self.assertEqual(found['short_definition'], page['words'][0]['short_definition'])
+        self.assertEqual(self.db.get_word_briefs(self.test_user_id)[0]['id'], word_id)
+        self.assertEqual(self.db.get_word_by_id(word_id)['definition'], self.EXPLANATION)
+    
+    def test_backfill_old_words(self):
+        """Слова, сохраненные до появления разделов, заполняет разовый перенос при init_db"""
+        conn = self.db.get_connection()
+        conn.execute("INSERT INTO words (user_id, word, word_key, definition) VALUES (?, 'кворум', 'кворум', ?)",
+                     (self.test_user_id, self.EXPLANATION))
+        conn.execute("DELETE FROM schema_migrations WHERE name = 'sections'")
+        conn.commit()
+        self.db.release_connection(conn)
+        self.db.init_db()
+        row = self.db.get_word_briefs(self.test_user_id)[0]
+        self.assertEqual(row['short_definition'], "Кворум — минимальное число & участников.")
+
+
+class TestCompression(unittest.TestCase):
+    """Тесты сжатого хранения длинных определений"""
+    
+    LONG = "<b>📝 Краткое определение:</b>\n<i>Кворум</i> — минимальное число участников.\n\n" * 5
+    
+    def setUp(self):
+        self.test_db_path = "test_compression.db"
+        self.db = Database(self.test_db_path)
+        self.test_user_id = 123456789
+    
+    def tearDown(self):
+        self.db.close()
+        remove_test_db(self.test_db_path)
+    
+    def stored(self, word_id: int) -> tuple:
+        conn = self.db.get_connection()
+        try:
+            return tuple(conn.execute("SELECT definition, definition_z FROM words WHERE id = ?", (word_id,)).fetchone())
+        finally:
+            self.db.release_connection(conn)
+    
+    def test_roundtrip(self):
+        """Словарь заголовков сжимает объяснение сильнее обычного zlib"""
+        import zlib
+        packed = compress_text(self.LONG)
+        self.assertEqual(decompress_text(packed), self.LONG)
+        self.assertLess(len(packed), len(zlib.compress(self.LONG.encode("utf-8"), 9)))
+    
+    def test_long_definition_compressed(self):
+        """Длинное определение хранится сжатым, get_word_by_id его распаковывает"""
+        word_id = self.db.add_word(self.test_user_id, "кворум", self.LONG)
+        definition, packed = self.stored(word_id)
+        self.assertEqual(definition, "")
+        self.assertIsNotNone(packed)
+        self.assertEqual(self.db.get_word_by_id(word_id)['definition'], self.LONG)
+        self.assertNotIn('definition_z', self.db.get_word_by_id(word_id))
+    
+    def test_list_without_definition(self):
+        """Список и случайное слово без объяснения не распаковывают definition_z"""
+        self.db.add_word(self.test_user_id, "кворум", self.LONG)
+        with patch("database.unpack_definition") as unpack:
+            words = self.db.get_user_words(self.test_user_id, with_definition=False)
+            word = self.db.get_random_word(self.test_user_id, with_definition=False)
+        unpack.assert_not_called()
+        self.assertNotIn('definition', words[0])
+        self.assertTrue(words[0]['short_definition'])
+        self.assertEqual(word['word'], "кворум")
+    
+    def test_short_definition_plain(self):
+        """Короткое определение не сжимается"""
+        word_id = self.db.add_word(self.test_user_id, "синтез", "соединение")
+        self.assertEqual(self.stored(word_id), ("соединение", None))
+    
+    def test_state_value(self):
+        """Временное состояние тоже хранится сжатым"""
+        self.db.put_state("suggestion:abc", self.LONG, ttl=60)
+        self.assertEqual(self.db.get_state("suggestion:abc"), self.LONG)
+    
+    def test_old_rows_compressed(self):
+        """Слова, сохраненные без сжатия, сжимает разовый перенос при init_db"""
+        conn = self.db.get_connection()
+        conn.execute("INSERT INTO words (user_id, word, word_key, definition) VALUES (?, 'кворум', 'кворум', ?)",
+                     (self.test_user_id, self.LONG))
+        conn.execute("DELETE FROM schema_migrations WHERE name = 'compression'")
+        conn.commit()
+        self.db.release_connection(conn)
+        self.db.init_db()
+        self.assertEqual(self.stored(1)[0], "")
+        self.assertEqual(self.db.get_word_by_id(1)['definition'], self.LONG)
+        self.assertGreaterEqual(len(self.LONG), COMPRESS_MIN_LENGTH)
 
 
 class TestConfig(unittest.TestCase):
@@ -145,6 +1835,29 @@ def run_tests():
     
     # Добавляем тесты
     suite.addTests(loader.loadTestsFromTestCase(TestDatabase))
+    suite.addTests(loader.loadTestsFromTestCase(TestDictionaryPagination))
+    suite.addTests(loader.loadTestsFromTestCase(TestUserStats))
+    suite.addTests(loader.loadTestsFromTestCase(TestSpacedRepetition))
+    suite.addTests(loader.loadTestsFromTestCase(TestSearch))
+    suite.addTests(loader.loadTestsFromTestCase(TestSQLiteConnection))
+    suite.addTests(loader.loadTestsFromTestCase(TestExplanationCache))
+    suite.addTests(loader.loadTestsFromTestCase(TestAsyncDatabase))
+    suite.addTests(loader.loadTestsFromTestCase(TestHotCache))
+    suite.addTests(loader.loadTestsFromTestCase(TestStateStore))
+    suite.addTests(loader.loadTestsFromTestCase(TestGeminiClient))
+    suite.addTests(loader.loadTestsFromTestCase(TestResilience))
+    suite.addTests(loader.loadTestsFromTestCase(TestModelRouter))
+    suite.addTests(loader.loadTestsFromTestCase(TestStreaming))
+    suite.addTests(loader.loadTestsFromTestCase(TestSingleFlight))
+    suite.addTests(loader.loadTestsFromTestCase(TestBroadcast))
+    suite.addTests(loader.loadTestsFromTestCase(TestSuggestions))
+    suite.addTests(loader.loadTestsFromTestCase(TestWordPool))
+    suite.addTests(loader.loadTestsFromTestCase(TestImporter))
+    suite.addTests(loader.loadTestsFromTestCase(TestExporter))
+    suite.addTests(loader.loadTestsFromTestCase(TestMigration))
+    suite.addTests(loader.loadTestsFromTestCase(TestMarkdownConverter))
+    suite.addTests(loader.loadTestsFromTestCase(TestSections))
+    suite.addTests(loader.loadTestsFromTestCase(TestCompression))
     suite.addTests(loader.loadTestsFromTestCase(TestConfig))
     
     # Запускаем
@@ -0,0 +1,89 @@
+"""
+Пул заранее сгенерированных "умных слов"
+
+Фоновая задача держит в БД запас слов с готовыми объяснениями по каждой
+теме, а /random и рассылка берут слово из пула мгновенно, без ожидания
+ответа Gemini.
+"""
+
+import logging
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from config import (
+    WORD_POOL_SIZE,
+    WORD_POOL_REFILL_THRESHOLD,
+    WORD_POOL_MAX_SERVES,
+    BROADCAST_BATCH_SIZE,
+)
+from suggestions import THEMES
+
+logger = logging.getLogger(__name__)
+
+# generate(theme, count, exclude_words) -> список (word, explanation_html)
+Generator = Callable[[str, int, List[str]], Awaitable[List[Tuple[str, str]]]]
+
+
+class WordPool:
+    """Запас слов по темам с фоновым пополнением"""
+
+    def __init__(self, db, generate: Generator, size: int = None, threshold: int = None,
+                 max_serves: int = None, batch_size: int = None):
+        """
+        Args:
+            db: Экземпляр AsyncDatabase
+            generate: Корутина генерации слов для темы
+            size: Целевой размер пула на тему
+            threshold: Пополнять тему, когда в ней осталось меньше слов
+            max_serves: Сколько раз одно слово может быть выдано разным пользователям
+            batch_size: Сколько слов просить у Gemini за один запрос
+        """
+        self.db = db
+        self.generate = generate
+        self.size = size or WORD_POOL_SIZE
+        self.threshold = threshold or WORD_POOL_REFILL_THRESHOLD
+        self.max_serves = max_serves or WORD_POOL_MAX_SERVES
+        self.batch_size = batch_size or BROADCAST_BATCH_SIZE
+        self.refilling = False
+
+    async def draw(self, user_id: int, exclude_words: List[str] = None) -> Optional[Tuple[str, str]]:
+        """Взять слово для пользователя: (word, explanation_html) или None, если пул пуст"""
+        row = await self.db.draw_pool_word(user_id, exclude_words, self.max_serves)
+        if not row:
+            return None
+        return row['word'], row['explanation']
+
+    async def refill(self) -> int:
+        """Пополнить темы, в которых слов меньше порога. Возвращает число добавленных"""
+        if self.refilling:
+            return 0
+
+        self.refilling = True
+        added = 0
+        try:
+            counts = await self.db.get_pool_counts()
+            for theme in THEMES:
+                count = counts.get(theme, 0)
+                if count >= self.threshold:
+                    continue
+                added += await self._refill_theme(theme, self.size - count)
+        finally:
+            self.refilling = False
+
+        if added:
+            logger.info(f"🧺 Пул слов пополнен на {added}")
+        return added
+
+    async def _refill_theme(self, theme: str, missing: int) -> int:
+        added = 0
+        while missing > 0:
+            existing = await self.db.get_pool_words(theme)
+            items = await self.generate(theme, min(missing, self.batch_size), existing)
+            if not items:
+                break
+            new = await self.db.add_pool_words(theme, items)
+            if not new:
+                # Модель повторяет уже имеющиеся слова — не крутимся впустую
+                break
+            added += new
+            missing -= new
+        return added